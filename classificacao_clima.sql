@@ -86,7 +86,9 @@ CREATE TABLE public.area (
     area_intents jsonb,
     area_review text,
     area_level integer,
-    area_plan text
+    area_plan text,
+    area_tree_in integer,
+    area_tree_out integer
 );
 
 
@@ -127,7 +129,8 @@ CREATE TABLE public.comment (
     comment_employee_id integer NOT NULL,
     comment_question_id integer NOT NULL,
     comment_survey_id integer,
-    comment_area_id integer
+    comment_area_id integer,
+    comment_classification_status character varying(20) DEFAULT 'pending'::character varying NOT NULL
 );
 
 
@@ -246,6 +249,79 @@ ALTER SEQUENCE public.employee_id_seq OWNER TO postgres;
 ALTER SEQUENCE public.employee_id_seq OWNED BY public.employee.id;
 
 
+--
+-- Name: job; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.job (
+    job_id character varying(36) NOT NULL,
+    job_type character varying(50) NOT NULL,
+    payload jsonb DEFAULT '{}'::jsonb NOT NULL,
+    priority integer DEFAULT 0 NOT NULL,
+    status character varying(20) DEFAULT 'queued'::character varying NOT NULL,
+    progress jsonb,
+    error text,
+    attempts integer DEFAULT 0 NOT NULL,
+    cancel_requested boolean DEFAULT false NOT NULL,
+    worker_id character varying(100),
+    created_at timestamp without time zone DEFAULT now() NOT NULL,
+    started_at timestamp without time zone,
+    heartbeat_at timestamp without time zone,
+    finished_at timestamp without time zone,
+    CONSTRAINT job_status_check CHECK (((status)::text = ANY ((ARRAY['queued'::character varying, 'running'::character varying, 'done'::character varying, 'failed'::character varying, 'cancelled'::character varying])::text[])))
+);
+
+
+ALTER TABLE public.job OWNER TO postgres;
+
+--
+-- Name: job_event; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.job_event (
+    event_id bigint NOT NULL,
+    job_id character varying(36) NOT NULL,
+    payload jsonb NOT NULL,
+    created_at timestamp without time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.job_event OWNER TO postgres;
+
+--
+-- Name: job_event_event_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
+--
+
+CREATE SEQUENCE public.job_event_event_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+
+ALTER SEQUENCE public.job_event_event_id_seq OWNER TO postgres;
+
+--
+-- Name: job_event_event_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: postgres
+--
+
+ALTER SEQUENCE public.job_event_event_id_seq OWNED BY public.job_event.event_id;
+
+
+--
+-- Name: job_file; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.job_file (
+    job_id character varying(36) NOT NULL,
+    file_key character varying(50) NOT NULL,
+    content bytea NOT NULL
+);
+
+
+ALTER TABLE public.job_file OWNER TO postgres;
+
 --
 -- TOC entry 222 (class 1259 OID 16570)
 -- Name: perception; Type: TABLE; Schema: public; Owner: postgres
@@ -328,6 +404,37 @@ ALTER SEQUENCE public.question_question_id_seq OWNER TO postgres;
 ALTER SEQUENCE public.question_question_id_seq OWNED BY public.question.question_id;
 
 
+--
+-- Name: question_theme_map; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.question_theme_map (
+    question_key text NOT NULL,
+    question_text character varying(500) NOT NULL,
+    theme_name character varying(255) NOT NULL,
+    source character varying(20) DEFAULT 'llm'::character varying NOT NULL,
+    version integer DEFAULT 1 NOT NULL,
+    updated_at timestamp without time zone DEFAULT now() NOT NULL,
+    CONSTRAINT question_theme_map_source_check CHECK (((source)::text = ANY ((ARRAY['llm'::character varying, 'manual'::character varying])::text[])))
+);
+
+
+ALTER TABLE public.question_theme_map OWNER TO postgres;
+
+--
+-- Name: schema_migration; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.schema_migration (
+    version integer NOT NULL,
+    name text NOT NULL,
+    checksum character varying(32) NOT NULL,
+    applied_at timestamp without time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.schema_migration OWNER TO postgres;
+
 --
 -- TOC entry 216 (class 1259 OID 16492)
 -- Name: survey; Type: TABLE; Schema: public; Owner: postgres
@@ -454,6 +561,13 @@ ALTER TABLE ONLY public.config_empresa ALTER COLUMN id SET DEFAULT nextval('publ
 ALTER TABLE ONLY public.employee ALTER COLUMN id SET DEFAULT nextval('public.employee_id_seq'::regclass);
 
 
+--
+-- Name: job_event event_id; Type: DEFAULT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.job_event ALTER COLUMN event_id SET DEFAULT nextval('public.job_event_event_id_seq'::regclass);
+
+
 --
 -- TOC entry 3246 (class 2604 OID 16573)
 -- Name: perception perception_id; Type: DEFAULT; Schema: public; Owner: postgres
@@ -531,6 +645,30 @@ ALTER TABLE ONLY public.employee
     ADD CONSTRAINT employee_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: job job_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.job
+    ADD CONSTRAINT job_pkey PRIMARY KEY (job_id);
+
+
+--
+-- Name: job_event job_event_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.job_event
+    ADD CONSTRAINT job_event_pkey PRIMARY KEY (event_id);
+
+
+--
+-- Name: job_file job_file_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.job_file
+    ADD CONSTRAINT job_file_pkey PRIMARY KEY (job_id, file_key);
+
+
 --
 -- TOC entry 3261 (class 2606 OID 16577)
 -- Name: perception perception_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
@@ -549,6 +687,22 @@ ALTER TABLE ONLY public.question
     ADD CONSTRAINT question_pkey PRIMARY KEY (question_id);
 
 
+--
+-- Name: question_theme_map question_theme_map_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.question_theme_map
+    ADD CONSTRAINT question_theme_map_pkey PRIMARY KEY (question_key);
+
+
+--
+-- Name: schema_migration schema_migration_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.schema_migration
+    ADD CONSTRAINT schema_migration_pkey PRIMARY KEY (version);
+
+
 --
 -- TOC entry 3255 (class 2606 OID 16497)
 -- Name: survey survey_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
@@ -567,6 +721,127 @@ ALTER TABLE ONLY public.theme_ranking
     ADD CONSTRAINT theme_ranking_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: action_plan_survey_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX action_plan_survey_idx ON public.action_plan USING btree (action_plan_survey_id);
+
+
+--
+-- Name: area_survey_area_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX area_survey_area_idx ON public.area USING btree (area_survey_id, area_id);
+
+
+--
+-- Name: area_survey_tree_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX area_survey_tree_idx ON public.area USING btree (area_survey_id, area_tree_in, area_tree_out);
+
+
+--
+-- Name: comment_question_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX comment_question_idx ON public.comment USING btree (comment_question_id);
+
+
+--
+-- Name: comment_survey_employee_question_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX comment_survey_employee_question_idx ON public.comment USING btree (comment_survey_id, comment_employee_id, comment_question_id);
+
+
+--
+-- Name: config_empresa_survey_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX config_empresa_survey_idx ON public.config_empresa USING btree (survey_id);
+
+
+--
+-- Name: employee_survey_area_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX employee_survey_area_idx ON public.employee USING btree (employee_survey_id, employee_area_id);
+
+
+--
+-- Name: employee_survey_employee_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX employee_survey_employee_idx ON public.employee USING btree (employee_survey_id, employee_id);
+
+
+--
+-- Name: job_event_created_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX job_event_created_idx ON public.job_event USING btree (created_at);
+
+
+--
+-- Name: job_event_job_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX job_event_job_idx ON public.job_event USING btree (job_id, event_id);
+
+
+--
+-- Name: job_queue_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX job_queue_idx ON public.job USING btree (priority DESC, created_at) WHERE ((status)::text = 'queued'::text);
+
+
+--
+-- Name: perception_comment_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX perception_comment_idx ON public.perception USING btree (perception_comment_id);
+
+
+--
+-- Name: perception_survey_area_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX perception_survey_area_idx ON public.perception USING btree (perception_survey_id, perception_area_id) INCLUDE (perception_theme, perception_intension);
+
+
+--
+-- Name: question_survey_name_uidx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE UNIQUE INDEX question_survey_name_uidx ON public.question USING btree (question_survey_id, question_name);
+
+
+--
+-- Name: theme_ranking_survey_area_theme_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX theme_ranking_survey_area_theme_idx ON public.theme_ranking USING btree (survey_id, area_id, theme_name);
+
+
+--
+-- Name: action_plan fk_action_plan_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.action_plan
+    ADD CONSTRAINT fk_action_plan_survey FOREIGN KEY (action_plan_survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
+
+
+--
+-- Name: area fk_area_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.area
+    ADD CONSTRAINT fk_area_survey FOREIGN KEY (area_survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
+
+
 --
 -- TOC entry 3273 (class 2606 OID 16564)
 -- Name: comment fk_comment_question; Type: FK CONSTRAINT; Schema: public; Owner: postgres
@@ -576,6 +851,54 @@ ALTER TABLE ONLY public.comment
     ADD CONSTRAINT fk_comment_question FOREIGN KEY (comment_question_id) REFERENCES public.question(question_id) ON DELETE CASCADE;
 
 
+--
+-- Name: comment fk_comment_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.comment
+    ADD CONSTRAINT fk_comment_survey FOREIGN KEY (comment_survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
+
+
+--
+-- Name: config_empresa fk_config_empresa_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.config_empresa
+    ADD CONSTRAINT fk_config_empresa_survey FOREIGN KEY (survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
+
+
+--
+-- Name: employee fk_employee_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.employee
+    ADD CONSTRAINT fk_employee_survey FOREIGN KEY (employee_survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
+
+
+--
+-- Name: job_file fk_job_file_job; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.job_file
+    ADD CONSTRAINT fk_job_file_job FOREIGN KEY (job_id) REFERENCES public.job(job_id) ON DELETE CASCADE;
+
+
+--
+-- Name: perception fk_perception_comment; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.perception
+    ADD CONSTRAINT fk_perception_comment FOREIGN KEY (perception_comment_id) REFERENCES public.comment(comment_id) ON DELETE CASCADE;
+
+
+--
+-- Name: perception fk_perception_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.perception
+    ADD CONSTRAINT fk_perception_survey FOREIGN KEY (perception_survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
+
+
 --
 -- TOC entry 3272 (class 2606 OID 16512)
 -- Name: question fk_question_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
@@ -585,6 +908,14 @@ ALTER TABLE ONLY public.question
     ADD CONSTRAINT fk_question_survey FOREIGN KEY (question_survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
 
 
+--
+-- Name: theme_ranking fk_theme_ranking_survey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.theme_ranking
+    ADD CONSTRAINT fk_theme_ranking_survey FOREIGN KEY (survey_id) REFERENCES public.survey(survey_id) ON DELETE CASCADE;
+
+
 -- Completed on 2025-10-23 11:41:01
 
 --
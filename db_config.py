@@ -1,5 +1,9 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, exc as sa_exc
+from sqlalchemy.pool import QueuePool
 
 #from dotenv import load_dotenv
 #load_dotenv()
@@ -18,4 +22,172 @@ if DATABASE_URL.startswith("postgres://"):
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL não está definida!")
 
-engine = create_engine(DATABASE_URL)
\ No newline at end of file
+# ============================================================
+# Pool de conexões
+# ============================================================
+# Cada processo (web e worker) tem o seu pool: o total de conexões no banco é
+# (WEB_CONCURRENCY + JOB_WORKERS) x (DB_POOL_SIZE + DB_MAX_OVERFLOW), mais uma
+# conexão de LISTEN por processo (progress_bus). Deve caber no max_connections.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+# espera máxima por uma conexão livre (segundos)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# o proxy do Railway derruba conexões ociosas: recicla antes disso (segundos)
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") not in ("0", "false", "False", "")
+# statement_timeout da sessão (ms); 0 = sem limite
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "120000"))
+# nos processos de worker (worker.py) COPY grande, UPDATE de staging e as
+# agregações de métricas passam fácil de 2 min: limite próprio, sem limite por padrão
+JOB_STATEMENT_TIMEOUT_MS = int(os.environ.get("JOB_STATEMENT_TIMEOUT_MS", "0"))
+# "web" (gunicorn/flask) ou "worker" (definido pelo worker.py antes dos imports);
+# workers embutidos no processo web (JOB_EMBEDDED_WORKERS) seguem o limite do web
+DB_PROCESS_ROLE = os.environ.get("DB_PROCESS_ROLE", "web")
+
+class PoolStats:
+    """Contadores do pool deste processo (expostos em /internal/db_pool)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.connects = 0
+            self.invalidated = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.request_connections = 0
+            self.request_reuses = 0
+
+    def add(self, name: str, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def add_wait(self, seconds: float):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            checkouts = self.checkouts
+            return {
+                "pid": os.getpid(),
+                "pool_size": pool.size(),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "checkouts": checkouts,
+                "connects": self.connects,
+                "invalidated": self.invalidated,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total * 1000, 1),
+                "wait_avg_ms": round(self.wait_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 1),
+                "request_connections": self.request_connections,
+                "request_reuses": self.request_reuses,
+                "statement_timeout_ms": statement_timeout_ms(),
+            }
+
+pool_stats = PoolStats()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mede a espera por conexão (inclui abrir uma nova) e os timeouts."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            pool_stats.add("timeouts")
+            raise
+        finally:
+            pool_stats.add_wait(time.perf_counter() - t0)
+
+def statement_timeout_ms() -> int:
+    return JOB_STATEMENT_TIMEOUT_MS if DB_PROCESS_ROLE == "worker" else DB_STATEMENT_TIMEOUT_MS
+
+def _connect_args() -> dict:
+    timeout = statement_timeout_ms()
+    if timeout > 0:
+        return {"options": f"-c statement_timeout={timeout}"}
+    return {}
+
+def make_engine(url: str):
+    eng = create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=_connect_args(),
+    )
+    event.listen(eng, "checkout", lambda *_: pool_stats.add("checkouts"))
+    event.listen(eng, "connect", lambda *_: pool_stats.add("connects"))
+    event.listen(eng, "invalidate", lambda *_: pool_stats.add("invalidated"))
+    return eng
+
+# ============================================================
+# Conexão por requisição
+# ============================================================
+
+class RequestScopedEngine:
+    """
+    Engine cujo `begin()` reaproveita uma única conexão durante a requisição
+    Flask (cada bloco continua sendo a sua própria transação). Fora de
+    requisição (workers, streams SSE) ou com uma transação já aberta na
+    conexão da requisição, é o `engine.begin()` normal. O resto (connect,
+    raw_connection, pool...) vai direto para o engine.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    def __getattr__(self, name):
+        return getattr(self._engine, name)
+
+    def _request_connection(self):
+        try:
+            from flask import g, has_request_context
+        except ImportError:
+            return None
+        if not has_request_context():
+            return None
+        conn = g.get("_db_conn")
+        if conn is not None and (conn.closed or conn.invalidated):
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = g._db_conn = self._engine.connect()
+            pool_stats.add("request_connections")
+        else:
+            pool_stats.add("request_reuses")
+        return conn
+
+    @contextmanager
+    def begin(self):
+        conn = self._request_connection()
+        if conn is None or conn.in_transaction():
+            with self._engine.begin() as c:
+                yield c
+            return
+        with conn.begin():
+            yield conn
+
+    def pool_status(self) -> dict:
+        return pool_stats.snapshot(self._engine.pool)
+
+def close_request_connection(exc=None):
+    """teardown_request do Flask: devolve a conexão da requisição ao pool."""
+    from flask import g
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.close()
+
+engine = RequestScopedEngine(make_engine(DATABASE_URL))
\ No newline at end of file
@@ -0,0 +1,281 @@
+# explain_check.py
+"""
+Regressão de plano das consultas da dashboard: semeia uma base grande (várias
+pesquisas) numa transação, roda EXPLAIN ANALYZE nas consultas quentes e falha
+(exit 1) se alguma fizer Seq Scan numa tabela grande ou, com comment/perception
+particionadas, ler partição de outra pesquisa. A transação é desfeita no fim:
+nada do que foi semeado fica no banco.
+
+    python explain_check.py --url postgresql://... --surveys 40 --employees 1500
+    EXPLAIN_CHECK_URL=postgresql://... python explain_check.py
+
+Rode depois de `python migrate.py`, contra um banco de teste/homologação. O
+banco é obrigatório e nunca o do db_config: mesmo desfeita, a semeadura carrega
+o banco e consome as sequências.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from sqlalchemy import text
+
+from service.partitioning import (
+    PARTITIONED_TABLES,
+    ensure_survey_partitions,
+    partition_name,
+    survey_partitioning_enabled,
+)
+
+# tabelas das consultas abaixo; Seq Scan é regressão nas que passam de --min-rows
+# (em tabela pequena o Seq Scan é o plano certo)
+TABLES = ["action_plan", "area", "comment", "config_empresa", "employee", "perception", "question", "theme_ranking"]
+
+THEMES = [
+    "Liderança e Gestão", "Comunicação Interna", "Reconhecimento e Valorização",
+    "Desenvolvimento e Carreira", "Cultura e Valores Organizacionais",
+    "Relacionamento com a equipe", "Ambiente e Bem-estar no Trabalho",
+]
+INTENTS = ["Crítica", "Sugestão", "Reconhecimento"]
+# partições de comment/perception (layout de `python migrate.py partition`)
+_PARTITION_RE = re.compile(r"^(comment|perception)_(s\d+|default)$")
+
+# ============================================================
+# Base semeada
+# ============================================================
+
+SEED_SQL = [
+    """
+    INSERT INTO survey (survey_name)
+    SELECT 'explain_check ' || g FROM generate_series(1, :surveys) g
+    """,
+    """
+    CREATE TEMP TABLE _seed_survey ON COMMIT DROP AS
+    SELECT survey_id FROM survey WHERE survey_name LIKE 'explain_check %'
+    """,
+    """
+    INSERT INTO area (area_id, area_name, area_parent, area_survey_id, area_score, area_level, area_tree_in, area_tree_out)
+    SELECT a, 'Área ' || a, CASE WHEN a = 0 THEN NULL ELSE 0 END, s.survey_id,
+           round((random() * 5)::numeric, 2), CASE WHEN a = 0 THEN 0 ELSE 1 END,
+           CASE WHEN a = 0 THEN 0 ELSE 2 * a - 1 END, CASE WHEN a = 0 THEN 2 * :areas + 1 ELSE 2 * a END
+    FROM _seed_survey s, generate_series(0, :areas) a
+    """,
+    """
+    INSERT INTO employee (employee_id, employee_email, employee_name, employee_area_id, employee_manager_id, employee_survey_id)
+    SELECT g, 'pessoa' || g || '@empresa.com', 'Pessoa ' || g, 1 + g % :areas, 0, s.survey_id
+    FROM _seed_survey s, generate_series(1, :employees) g
+    """,
+    """
+    INSERT INTO question (question_name, question_survey_id)
+    SELECT 'Pergunta ' || q, s.survey_id
+    FROM _seed_survey s, generate_series(1, :questions) q
+    """,
+    """
+    INSERT INTO comment (comment, comment_employee_id, comment_question_id, comment_survey_id, comment_area_id, comment_classification_status)
+    SELECT 'Comentário ' || e.employee_id || ' sobre ' || q.question_name,
+           e.employee_id, q.question_id, e.employee_survey_id, e.employee_area_id, 'done'
+    FROM employee e
+    JOIN _seed_survey s ON s.survey_id = e.employee_survey_id
+    JOIN question q ON q.question_survey_id = e.employee_survey_id
+    WHERE q.question_name IN ('Pergunta 1', 'Pergunta 2')
+    """,
+    """
+    INSERT INTO perception (perception_comment_id, perception_comment_clipping, perception_theme, perception_intension, perception_survey_id, perception_area_id)
+    SELECT c.comment_id, c.comment,
+           (:themes)[1 + (c.comment_id + k) % cardinality(:themes)],
+           (:intents)[1 + (c.comment_id * 7 + k) % cardinality(:intents)],
+           c.comment_survey_id, c.comment_area_id
+    FROM comment c
+    JOIN _seed_survey s ON s.survey_id = c.comment_survey_id
+    CROSS JOIN generate_series(1, 2) k
+    """,
+    """
+    INSERT INTO theme_ranking (area_id, theme_name, score, dissatisfied_score, comment_score, ranking, survey_id)
+    SELECT a, t.theme, round((random() * 5)::numeric, 2), round((random() * 5)::numeric, 2),
+           round((random() * 5)::numeric, 2), t.ord, s.survey_id
+    FROM _seed_survey s, generate_series(0, :areas) a, unnest(:themes) WITH ORDINALITY AS t(theme, ord)
+    """,
+    """
+    INSERT INTO action_plan (theme_name, action_plan, action_plan_survey_id, tipo)
+    SELECT t, 'Plano para ' || t, s.survey_id, 1
+    FROM _seed_survey s, unnest(:themes) t
+    """,
+    """
+    INSERT INTO config_empresa (sobre_empresa, survey_id)
+    SELECT 'Empresa de teste', s.survey_id FROM _seed_survey s
+    """,
+]
+
+# ============================================================
+# Consultas quentes (mesmo SQL das funções indicadas)
+# ============================================================
+
+QUERIES = [
+    # survey_repository.get_comments_with_perceptions (1)
+    ("comments_of_survey", """
+        SELECT c.comment_id, c.comment, q.question_name
+        FROM comment c
+        JOIN question q ON q.question_id = c.comment_question_id
+        WHERE c.comment_survey_id = :sid
+    """),
+    # survey_repository.get_comments_with_perceptions (2)
+    ("perceptions_of_comments", """
+        SELECT p.perception_id, p.perception_comment_id, p.perception_comment_clipping,
+               p.perception_theme, p.perception_intension
+        FROM perception p
+        WHERE p.perception_comment_id IN :ids
+          AND p.perception_survey_id = :sid
+        ORDER BY p.perception_id
+    """),
+    # survey_repository.list_areas_with_non_null_score
+    ("areas_with_score", """
+        SELECT area_id, area_name
+        FROM area
+        WHERE area_survey_id = :sid
+        AND area_score IS NOT NULL
+        AND area_id <> 0
+        ORDER BY area_name
+    """),
+    # survey_repository.list_perception_themes_for_survey
+    ("perception_themes", """
+        SELECT DISTINCT p.perception_theme AS theme
+        FROM perception p
+        WHERE p.perception_survey_id = :sid
+          AND p.perception_theme IS NOT NULL
+          AND TRIM(p.perception_theme) <> ''
+        ORDER BY 1
+    """),
+    # areas_service.get_themes_intents (todas as áreas)
+    ("themes_intents_survey", """
+        SELECT perception_theme AS tema, perception_intension AS intencao, COUNT(*) AS qtd
+        FROM perception
+        WHERE perception_survey_id = :survey_id
+        GROUP BY perception_theme, perception_intension
+        ORDER BY perception_theme, perception_intension
+    """),
+    # areas_service.get_themes_intents (uma área)
+    ("themes_intents_area", """
+        SELECT perception_theme AS tema, perception_intension AS intencao, COUNT(*) AS qtd
+        FROM perception
+        WHERE perception_survey_id = :survey_id
+          AND perception_area_id = :area_id
+        GROUP BY perception_theme, perception_intension
+        ORDER BY perception_theme, perception_intension
+    """),
+    # survey_repository.get_area_review_plan
+    ("area_review_plan", """
+        SELECT area_survey_id, area_review, area_plan, area_comments_number, area_employee_number
+        FROM area
+        WHERE area_id = :aid AND area_survey_id = :sid
+        LIMIT 1
+    """),
+    # perception_service.get_theme_perceptions
+    ("theme_perceptions", """
+        SELECT area_id, theme_name, score, dissatisfied_score, comment_score
+        FROM theme_ranking
+        WHERE survey_id = :sid
+        AND theme_name IN :themes
+    """),
+    # general_review.get_general_action_plan
+    ("general_action_plan", """
+        SELECT * FROM action_plan WHERE action_plan_survey_id = :sid ORDER BY id
+    """),
+    # config.get_survey_config
+    ("survey_config", """
+        SELECT * FROM config_empresa WHERE survey_id = :sid LIMIT 1
+    """),
+    # comment_repository.employee_lookup_map
+    ("employees_of_survey", """
+        SELECT lower(employee_email) AS email, employee_id, employee_area_id, employee_manager_id
+        FROM employee
+        WHERE employee_survey_id = :sid
+    """),
+]
+
+def _seq_scans(plan: dict, large: set, own_partitions: set) -> list:
+    """Seq Scan em tabela grande ou leitura de partição de outra pesquisa (sem poda)."""
+    found = []
+    rel = plan.get("Relation Name")
+    if plan.get("Node Type") == "Seq Scan" and rel in large:
+        found.append(rel)
+    elif rel and _PARTITION_RE.match(rel) and rel not in own_partitions:
+        found.append(f"{rel} (sem poda)")
+    for child in plan.get("Plans", ()):
+        found.extend(_seq_scans(child, large, own_partitions))
+    return found
+
+def _scans(plan: dict) -> list:
+    out = []
+    if "Relation Name" in plan:
+        out.append(f'{plan["Node Type"]} on {plan["Relation Name"]}')
+    for child in plan.get("Plans", ()):
+        out.extend(_scans(child))
+    return out
+
+def run(engine, surveys: int, employees: int, areas: int, questions: int, min_rows: int) -> bool:
+    ok = True
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            conn.exec_driver_sql("SET LOCAL statement_timeout = 0")
+            t0 = time.perf_counter()
+            seed_params = {
+                "surveys": surveys, "employees": employees, "areas": areas, "questions": questions,
+                "themes": THEMES, "intents": INTENTS,
+            }
+            for i, sql in enumerate(SEED_SQL):
+                conn.execute(text(sql), seed_params)
+                if i == 1 and survey_partitioning_enabled(conn):
+                    for s in conn.execute(text("SELECT survey_id FROM _seed_survey")).scalars().all():
+                        ensure_survey_partitions(conn, s)
+            for table in TABLES:
+                conn.exec_driver_sql(f"ANALYZE {table}")
+            rows = dict(conn.execute(
+                text("SELECT relname, reltuples::bigint FROM pg_class WHERE relname IN :tables AND relkind = 'r'"),
+                {"tables": tuple(TABLES)}
+            ).all())
+            large = {t for t, n in rows.items() if n >= min_rows}
+            print(f"base semeada em {time.perf_counter() - t0:.1f}s: {rows}")
+            print(f"tabelas grandes (>= {min_rows} linhas): {', '.join(sorted(large))}")
+
+            sid = conn.execute(text("SELECT survey_id FROM _seed_survey ORDER BY survey_id OFFSET :k LIMIT 1"),
+                               {"k": surveys // 2}).scalar()
+            ids = tuple(conn.execute(text(QUERIES[0][1]), {"sid": sid}).scalars().all())
+            own = {partition_name(t, sid) for t in PARTITIONED_TABLES}
+            params = {"sid": sid, "survey_id": sid, "area_id": 1, "aid": 1, "ids": ids, "themes": tuple(THEMES[:3])}
+
+            for name, sql in QUERIES:
+                row = conn.execute(text("EXPLAIN (ANALYZE, FORMAT JSON) " + sql), params).scalar()
+                plan = (json.loads(row) if isinstance(row, str) else row)[0]
+                seq = _seq_scans(plan["Plan"], large, own)
+                ok = ok and not seq
+                status = "FALHOU" if seq else "ok"
+                print(f"{status:7} {name:24} {plan['Execution Time']:8.2f} ms  {', '.join(_scans(plan['Plan']))}")
+        finally:
+            trans.rollback()
+    return ok
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default=os.environ.get("EXPLAIN_CHECK_URL"),
+                    help="banco alvo (obrigatório; padrão: EXPLAIN_CHECK_URL)")
+    ap.add_argument("--surveys", type=int, default=40)
+    ap.add_argument("--employees", type=int, default=1500, help="colaboradores por pesquisa")
+    ap.add_argument("--areas", type=int, default=50, help="áreas por pesquisa")
+    ap.add_argument("--questions", type=int, default=6, help="perguntas por pesquisa")
+    ap.add_argument("--min-rows", type=int, default=10000, help="a partir de quantas linhas a tabela conta como grande")
+    args = ap.parse_args()
+    if not args.url:
+        ap.error("informe o banco de teste com --url ou EXPLAIN_CHECK_URL")
+
+    from db_config import make_engine
+    engine = make_engine(args.url)
+
+    ok = run(engine, args.surveys, args.employees, args.areas, args.questions, args.min_rows)
+    print("OK: nenhuma consulta com Seq Scan em tabela grande" if ok else "FALHA: consultas com Seq Scan em tabela grande")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
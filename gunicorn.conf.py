@@ -0,0 +1,49 @@
+# gunicorn.conf.py
+"""
+Configuração do gunicorn (lida automaticamente do diretório atual).
+
+As rotas SSE (/events, /plan_events, /area_review_events) ficam abertas
+durante todo o job. Com o worker `sync` cada conexão prende um processo
+inteiro. Aqui o padrão é `gevent`: cada stream é um greenlet parado em
+threading.Event.wait (cooperativo com o monkey patch, acordado pelo
+LISTEN/NOTIFY do progress_bus), então um processo segura centenas de
+streams ociosos sem atrasar as outras rotas. Sem gevent instalado cai para
+`gthread`, que ocupa uma thread por stream (limite = GUNICORN_THREADS).
+
+    GUNICORN_WORKER_CLASS=gevent      (ou gthread)
+    WEB_CONCURRENCY=2                 processos
+    GUNICORN_WORKER_CONNECTIONS=1000  conexões simultâneas por processo (gevent)
+    GUNICORN_THREADS=256              threads por processo (gthread)
+
+Teste de carga: python sse_load_test.py --help
+"""
+import importlib.util
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+_default_worker = "gevent" if importlib.util.find_spec("gevent") else "gthread"
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", _default_worker)
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+# gthread: máximo de requisições simultâneas (streams SSE incluídos) por processo
+threads = int(os.environ.get("GUNICORN_THREADS", "256"))
+# gevent: máximo de conexões simultâneas por processo
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# o stream manda ping a cada 30s; requisições normais continuam limitadas
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+# no restart, streams abertos não seguram o processo: o EventSource reconecta com Last-Event-ID
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "10"))
+keepalive = 5
+
+accesslog = "-"
+
+def post_fork(server, worker):
+    # gevent: o psycopg2 precisa do hook do psycogreen para não travar o loop
+    # durante as consultas (psycopg 3 já coopera com o gevent)
+    if worker_class.startswith("gevent"):
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen não instalado: consultas do psycopg2 bloqueiam o worker gevent")
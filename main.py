@@ -2,9 +2,16 @@ from flask import Flask, Response, request, render_template, send_from_directory
 from sqlalchemy import text
 import pandas as pd
 import os
-from db_config import engine
-import tempfile, uuid, threading, time
+from db_config import engine, close_request_connection
 from service.progress import progress_bus, timed_step
+from service.job_queue import (
+    submit_job,
+    cancel_job,
+    job_status,
+    stream_job_events,
+    start_embedded_workers,
+    JOB_EMBEDDED_WORKERS
+)
 import markdown
 
 from service.comment_repository import (
@@ -31,18 +38,23 @@ from service.survey_repository import (
     get_comments_with_perceptions,
     list_areas_with_non_null_score,
     list_perception_themes_for_survey,
-    get_area_review_plan
+    get_area_review_plan,
+    delete_survey
 )
 
 from service.areas_repository import (
     insert_areas,
+    fetch_survey_areas,
     fetch_survey_areas_with_intents,
     update_theme_ranking_scores,
+    delete_general_theme_ranking,
+    get_themes_score,
     get_area_weights
 )
 
 from service.person_repository import (
-    insert_person
+    insert_person,
+    fetch_survey_person
 )
 
 from service.perception_service import (
@@ -50,6 +62,8 @@ from service.perception_service import (
     get_theme_perceptions
     )
 
+from service.perception_repository import count_classification_status
+
 from service.areas_service import (
     create_organizational_chart,
     generate_and_save_area_reviews,
@@ -57,10 +71,23 @@ from service.areas_service import (
     comment_score_calc,
     get_theme_ranking,
     calculate_theme_average,
-    closed_question_classification
+    classify_closed_questions,
+    compute_area_theme_scores,
+    compute_and_update_area_metrics_python,
+    compute_general_area_metrics_and_json,
+    areas_with_ancestors,
+    select_theme_scores_to_update
     
 )
 
+from service.llm_cache import get_llm_cache
+
+from service.question_theme_repository import (
+    list_question_themes,
+    upsert_question_themes,
+    SOURCE_MANUAL
+)
+
 from service.general_review import (
     generate_and_save_general_review,
     save_general_ranking,
@@ -74,6 +101,33 @@ from service.general_review import (
 #pesquisa Mind = [165,166,167,168,169,170,171,172,175,176,178,179,181,182,183,184,185,187,188,191,192,193,195,196,200,203,204,241,242,243]
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+# repositórios reaproveitam uma conexão por requisição (db_config.RequestScopedEngine)
+app.teardown_request(close_request_connection)
+
+# token do /internal/*; sem token, só acesso local
+INTERNAL_METRICS_TOKEN = os.environ.get("INTERNAL_METRICS_TOKEN")
+
+# Temas usados na classificação de perguntas e comentários
+TEMAS = [
+    "Sem tema",
+    "Liderança e Gestão",
+    "Comunicação Interna",
+    "Reconhecimento e Valorização",
+    "Desenvolvimento e Carreira",
+    "Cultura e Valores Organizacionais",
+    "Relacionamento com a equipe",
+    "Relacionamento entre equipes",
+    "Ambiente e Bem-estar no Trabalho",
+    "Carga de Trabalho",
+    "Remuneração e Benefícios",
+    "Diversidade e Inclusão e Equidade",
+    "Recursos, Ferramentas e Estrutura",
+    "Engajamento e Motivação",
+    "Autonomia e Tomada de Decisão",
+    "Assédio",
+    "Abuso de autoridade",
+    "Preconceito"
+]
 
 def read_csv_flex(src):
     """
@@ -184,6 +238,52 @@ def api_survey_exists_path(sid: int):
         row = conn.execute(text("SELECT 1 FROM survey WHERE survey_id = :sid"), {"sid": sid}).first()
     return jsonify({"exists": bool(row)}), 200
 
+# Estatísticas do cache de respostas do LLM (hits/misses/evictions dos processos que usam o mesmo arquivo de cache)
+@app.get("/api/llm_cache/stats")
+def api_llm_cache_stats():
+    cache = get_llm_cache()
+    if cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **cache.stats()}), 200
+
+### MAPA PERGUNTA -> TEMA ######################################
+
+# Lista os vínculos pergunta -> tema reaproveitados entre pesquisas
+@app.get("/api/question_themes")
+def api_question_themes():
+    return jsonify(list_question_themes()), 200
+
+# Importa/sobrescreve vínculos manualmente.
+# JSON: {"mappings": [{"pergunta": "...", "tema": "..."}]} ou arquivo CSV (campo 'arquivo') com colunas pergunta;tema
+@app.post("/api/question_themes")
+def api_question_themes_import():
+    if "arquivo" in request.files:
+        try:
+            df = read_csv_flex(request.files["arquivo"])
+        except Exception as e:
+            return jsonify({"error": f"CSV inválido: {e}"}), 400
+        df.columns = [str(c).strip().lower() for c in df.columns]
+        if not {"pergunta", "tema"}.issubset(df.columns):
+            return jsonify({"error": "O CSV precisa das colunas 'pergunta' e 'tema'."}), 400
+        mappings = df[["pergunta", "tema"]].dropna().to_dict(orient="records")
+    else:
+        data = request.get_json(force=True, silent=True) or {}
+        mappings = data.get("mappings")
+        if not isinstance(mappings, list):
+            return jsonify({"error": "Payload inválido"}), 400
+
+    validos, invalidos = [], []
+    for m in mappings:
+        pergunta = str((m or {}).get("pergunta") or "").strip()
+        tema = str((m or {}).get("tema") or "").strip()
+        if pergunta and tema in TEMAS:
+            validos.append((pergunta, tema))
+        else:
+            invalidos.append({"pergunta": pergunta, "tema": tema})
+
+    imported = upsert_question_themes(validos, source=SOURCE_MANUAL)
+    return jsonify({"imported": int(imported), "invalid": invalidos}), 200
+
 
 
 ### ROTAS DA DASHBOARD #######################################
@@ -335,26 +435,7 @@ def classifica_comentarios_route():
         df_comments = data_preprocessing(df_campanha, df_person, survey_id, perguntas_abertas)
         persist_questions_and_comments(df_comments)
         
-        temas = [
-            "Sem tema",
-            "Liderança e Gestão",
-            "Comunicação Interna",
-            "Reconhecimento e Valorização",
-            "Desenvolvimento e Carreira",
-            "Cultura e Valores Organizacionais",
-            "Relacionamento com a equipe",
-            "Relacionamento entre equipes",
-            "Ambiente e Bem-estar no Trabalho",
-            "Carga de Trabalho",
-            "Remuneração e Benefícios",
-            "Diversidade e Inclusão e Equidade",
-            "Recursos, Ferramentas e Estrutura",
-            "Engajamento e Motivação",
-            "Autonomia e Tomada de Decisão",
-            "Assédio",
-            "Abuso de autoridade",
-            "Preconceito"
-        ]
+        temas = list(TEMAS)
 
         classify_and_save_perceptions(
             survey_id=survey_id,
@@ -421,32 +502,141 @@ def classifica_comentarios_async():
         "perguntas_abertas": request.form.get("perguntas_abertas", type=str)
     }
 
-    # Salva arquivos temporários
-    tmpdir = tempfile.mkdtemp(prefix="clima_")
-    paths = {}
-    for key in required:
-        f = request.files[key]
-        path = os.path.join(tmpdir, f"{key}.csv")
-        f.save(path)
-        paths[key] = path
+    # Arquivos vão para o banco junto com o job (o worker pode estar em outro processo/máquina)
+    files = {key: request.files[key].read() for key in required}
 
-    job_id = str(uuid.uuid4())
-    progress_bus.open(job_id)
-
-    # dispara o worker
-    th = threading.Thread(target=_worker_pipeline, args=(job_id, paths, config), daemon=True)
-    th.start()
+    job_id = submit_job("pipeline", {"config": config}, _job_priority(request.form), files)
 
     return jsonify({"job_id": job_id})
 
 @app.get("/events/<job_id>")
 def sse_events(job_id: str):
-    def generate():
-        for chunk in progress_bus.stream(job_id):
-            yield chunk
-    return Response(generate(), mimetype="text/event-stream")
+    return _sse_response(job_id)
+
 
+### FILA DE JOBS #########################################
 
+def _last_event_id():
+    """Reconexão do EventSource: header Last-Event-ID (ou ?last_event_id=)."""
+    raw = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+def _sse_response(job_id: str) -> Response:
+    """
+    Stream SSE do job. A espera entre eventos é cooperativa (threading.Event do
+    progress_bus), então com worker gthread/gevent (gunicorn.conf.py) o stream
+    ocupa só uma thread/greenlet, não o processo.
+    """
+    stream = stream_job_events(job_id, _last_event_id())
+    return Response(stream, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # proxies (nginx) não devem acumular o stream
+        "X-Accel-Buffering": "no",
+    })
+
+def _job_priority(data) -> int:
+    """Prioridade opcional do job ('priority' no form/JSON); maior sai antes."""
+    try:
+        return int(data.get("priority") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+@app.get("/jobs/<job_id>")
+def get_job_status(job_id: str):
+    job = job_status(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    return jsonify(job)
+
+@app.post("/jobs/<job_id>/cancel")
+def cancel_job_route(job_id: str):
+    status = cancel_job(job_id)
+    if status is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    return jsonify({"job_id": job_id, "status": status}), 202
+
+
+### MÉTRICAS INTERNAS ####################################
+
+def _internal_allowed() -> bool:
+    if INTERNAL_METRICS_TOKEN:
+        return request.headers.get("X-Internal-Token") == INTERNAL_METRICS_TOKEN
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+@app.get("/internal/db_pool")
+def internal_db_pool():
+    """Pool de conexões deste processo: ocupação, checkouts, espera e overflow."""
+    if not _internal_allowed():
+        return jsonify({"error": "não encontrado"}), 404
+    return jsonify(engine.pool_status())
+
+
+
+
+### EXCLUSÃO DE PESQUISA #################################
+
+# Apaga a pesquisa e todos os dados dela. Com comment/perception particionadas
+# (python migrate.py partition) as partições da pesquisa saem por DETACH/DROP.
+@app.delete("/surveys/<int:survey_id>")
+def delete_survey_route(survey_id: int):
+    result = delete_survey(survey_id)
+    if not result["deleted"]:
+        return jsonify({"error": "Pesquisa não encontrada."}), 404
+    return jsonify({"survey_id": survey_id, **result})
+
+
+### RETOMADA DA CLASSIFICAÇÃO ############################
+
+# Reenfileira só o que falta classificar (comentários 'pending'/'failed') e recalcula as notas.
+# O progresso sai em /events/<job_id>.
+@app.post("/surveys/<int:survey_id>/resume")
+def resume_survey(survey_id: int):
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT 1 FROM survey WHERE survey_id = :sid"), {"sid": survey_id}).first()
+    if not row:
+        return jsonify({"error": "Pesquisa não encontrada."}), 404
+
+    status = count_classification_status(survey_id)
+
+    job_id = submit_job("resume", {"survey_id": survey_id}, _job_priority(request.form))
+
+    return jsonify({"job_id": job_id, "status": status}), 202
+
+
+### CARGA INCREMENTAL ####################################
+
+# Acrescenta respostas novas (CSV delta da campanha) a um survey existente:
+# só comentários inéditos são gravados/classificados e só as áreas afetadas
+# (e seus ancestrais) têm métricas e theme_ranking recalculados.
+@app.post("/surveys/<int:survey_id>/append")
+def append_survey(survey_id: int):
+    if "campanha" not in request.files:
+        return jsonify({"error": "Arquivo 'campanha' é obrigatório."}), 400
+
+    perguntas_abertas = request.form.get("perguntas_abertas", type=str)
+    if not perguntas_abertas:
+        return jsonify({"error": "Campo 'perguntas_abertas' é obrigatório."}), 400
+
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT 1 FROM survey WHERE survey_id = :sid"), {"sid": survey_id}).first()
+    if not row:
+        return jsonify({"error": "Pesquisa não encontrada."}), 404
+
+    config = {
+        "org_top": request.form.get("org_top", type=int),
+        "org_bottom": request.form.get("org_bottom", type=int),
+        "perguntas_abertas": perguntas_abertas
+    }
+
+    # 'pessoas' é opcional: completa e-mails por nome
+    files = {key: request.files[key].read() for key in ("campanha", "pessoas") if key in request.files}
+
+    job_id = submit_job("append", {"survey_id": survey_id, "config": config}, _job_priority(request.form), files)
+
+    return jsonify({"job_id": job_id}), 202
 
 
 ### GERA PLANOS DE AÇÃO ################################## 
@@ -464,25 +654,25 @@ def generate_plans_async():
     if not survey_id or survey_id < 1:
         return jsonify({"error": "survey_id inválido"}), 400
 
-    job_id = str(uuid.uuid4())
-    progress_bus.open(job_id)
-    # dispara thread do worker
-    t = threading.Thread(target=_worker_plans, args=(job_id, survey_id, overwrite), daemon=True)
-    t.start()
+    # enfileira o job (executado por um worker da fila)
+    job_id = submit_job("plans", {"survey_id": survey_id, "overwrite": overwrite}, _job_priority(data))
 
     return jsonify({"job_id": job_id}), 202
 
 @app.get("/plan_events/<job_id>")
 def plan_events(job_id: str):
-    def generate():
-        for chunk in progress_bus.stream(job_id):
-            yield chunk
-    return Response(generate(), mimetype="text/event-stream")
+    return _sse_response(job_id)
 
 
 
 ### WORKERS #############################################
 
+def _perceptions_progress(job_id: str):
+    # progresso da etapa mais longa; é também onde o cancelamento do job é percebido (JobCancelled)
+    def _put(p: dict):
+        progress_bus.put(job_id, {"event": "perceptions_progress", **p})
+    return _put
+
 def _worker_pipeline(job_id: str, paths: dict, config: dict):
     """
     Executa o pipeline completo e publica progresso por SSE.
@@ -495,26 +685,7 @@ def _worker_pipeline(job_id: str, paths: dict, config: dict):
         max_lvl = int(config.get("org_bottom") or 999)
         perguntas_abertas = config.get("perguntas_abertas")
 
-        temas = [
-            "Sem tema",
-            "Liderança e Gestão",
-            "Comunicação Interna",
-            "Reconhecimento e Valorização",
-            "Desenvolvimento e Carreira",
-            "Cultura e Valores Organizacionais",
-            "Relacionamento com a equipe",
-            "Relacionamento entre equipes",
-            "Ambiente e Bem-estar no Trabalho",
-            "Carga de Trabalho",
-            "Remuneração e Benefícios",
-            "Diversidade e Inclusão e Equidade",
-            "Recursos, Ferramentas e Estrutura",
-            "Engajamento e Motivação",
-            "Autonomia e Tomada de Decisão",
-            "Assédio",
-            "Abuso de autoridade",
-            "Preconceito"
-        ]
+        temas = list(TEMAS)
 
         # Leitura CSVs
         def _read_csvs():
@@ -566,18 +737,15 @@ def _worker_pipeline(job_id: str, paths: dict, config: dict):
             .reset_index(drop=True)
         )
 
-        tema_perguntas_fechadas = []
-        
-        for pergunta in df_perguntas_fechadas['pergunta']:
-            
-            tema = timed_step(job_id, f"""Classificando questao: {pergunta}""", closed_question_classification, pergunta, temas)
-            tema_perguntas_fechadas.append((pergunta, tema))
-            time.sleep(1.2)
+        def _on_questions(classificadas):
+            progress_bus.put(job_id, {"event": "perguntas classificadas", "message": classificadas})
 
-            progress_bus.put(job_id, {"event": "perguntas classificadas", "message": tema_perguntas_fechadas})
-
-        #garante o df
-        df_areas_perguntas_fechadas = pd.DataFrame(tema_perguntas_fechadas, columns=["pergunta", "tema"])
+        # mapa pergunta -> tema de pesquisas anteriores; só as inéditas vão ao LLM (em lotes)
+        df_areas_perguntas_fechadas = timed_step(
+            job_id, f"Classificando {len(df_perguntas_fechadas)} questões fechadas",
+            classify_closed_questions, df_perguntas_fechadas['pergunta'].tolist(), temas,
+            on_progress=_on_questions
+        )
         
         df_notas_areas = df_notas_areas.merge(
             df_areas_perguntas_fechadas,
@@ -587,10 +755,8 @@ def _worker_pipeline(job_id: str, paths: dict, config: dict):
 
         #Prepara as notas para calcular as médias
         df_notas_areas['nota'] = pd.to_numeric(df_notas_areas['nota'], errors="coerce")
-        df_notas_areas['nota'] = df_notas_areas['nota'].apply(lambda x: None if pd.isna(x) else x)
 
         df_notas_areas['nota diretos'] = pd.to_numeric(df_notas_areas['nota diretos'], errors="coerce")
-        df_notas_areas['nota diretos'] = df_notas_areas['nota diretos'].apply(lambda x: None if pd.isna(x) else x)
 
         # Normaliza de 0-5 para 0-100
         df_notas_areas['nota'] = df_notas_areas['nota'].where(df_notas_areas['nota'] > 5, df_notas_areas['nota'] * 20)
@@ -607,41 +773,8 @@ def _worker_pipeline(job_id: str, paths: dict, config: dict):
         #calcula o peso de cada área para aplicar a média ponderada
         df_pesos_area = get_area_weights(survey_id)
 
-        # Juntar pesos na df_notas_areas
-        df_notas_areas = df_notas_areas.merge(
-            df_pesos_area[["employee_area_id", "peso"]],
-            left_on="area_id",
-            right_on="employee_area_id",
-            how="left"
-        ).drop(columns=["employee_area_id"])
-
-        df_nota_area_temas = (
-            df_notas_areas
-            .groupby(["area_id", "tema"])
-            .apply(lambda g: pd.Series({
-                "nota": (
-                    (g["nota"] * g["peso"]).sum() / g["peso"].sum()
-                    if g["nota"].notna().any() and g["peso"].notna().any() and g["peso"].sum() > 0
-                    else None
-                ),
-                "nota_diretos": (
-                    (g["nota diretos"] * g["peso"]).sum() / g["peso"].sum()
-                    if g["nota diretos"].notna().any() and g["peso"].notna().any() and g["peso"].sum() > 0
-                    else None
-                ),
-                "porcentagem_insatisfeitos": (
-                    (g["porcentagem insatisfeitos"] * g["peso"]).sum() / g["peso"].sum()
-                    if g["porcentagem insatisfeitos"].notna().any() and g["peso"].notna().any() and g["peso"].sum() > 0
-                    else None
-                ),
-                "porcentagem_insatisfeitos_diretos": (
-                    (g["porcentagem insatisfeitos diretos"] * g["peso"]).sum() / g["peso"].sum()
-                    if g["porcentagem insatisfeitos diretos"].notna().any() and g["peso"].notna().any() and g["peso"].sum() > 0
-                    else None
-                ),
-            }))
-            .reset_index()
-        )
+        # Média ponderada por área × tema
+        df_nota_area_temas = compute_area_theme_scores(df_notas_areas, df_pesos_area)
        
         save_themes_score (df_nota_area_temas, survey_id)
         progress_bus.put(job_id, {"event": "themes", "Temas classificados": "-"})
@@ -669,28 +802,11 @@ def _worker_pipeline(job_id: str, paths: dict, config: dict):
         progress_bus.put(job_id, {"event": "stats", "scope": "questions_comments", "data": q_c_stats})
 
         #7) Classificar Percepções
-        perc_stats = timed_step(job_id, "Classificar percepções", classify_and_save_perceptions, survey_id, temas, "gpt-4o", 0.0, False)
+        perc_stats = timed_step(job_id, "Classificar percepções", classify_and_save_perceptions, survey_id, temas, "gpt-4o", 0.0, False, on_progress=_perceptions_progress(job_id))
         progress_bus.put(job_id, {"event": "stats", "scope": "perceptions", "tokens_saida": "completion_tokens", "data": perc_stats})
 
         #8) Calcula nota dos comentários do tema
-        def _themes_by_comment():
-            
-            scores = comment_score_calc(survey_id, df_areas)
-            update_theme_ranking_scores(survey_id, scores)
-            theme_ranking = get_theme_ranking(survey_id)
-            df_ranking = calculate_theme_average (theme_ranking, survey_id)
- 
-            # Ordena pela menor nota geral
-            df_ranking = df_ranking.sort_values(by="nota_geral", ascending=True).reset_index(drop=True)
-            df_ranking['ranking'] = range(1, len(df_ranking) + 1)
- 
-            df_ranking = df_ranking.sort_values(by="nota_direta", ascending=True).reset_index(drop=True)
-            df_ranking['ranking_direta'] = range(1, len(df_ranking) + 1)
-
-            return df_ranking
-        
-        ranking_final = timed_step(job_id, "Calculando nota dos comentários...", _themes_by_comment)
-        save_general_ranking(ranking_final)
+        _finalize_theme_ranking(job_id, survey_id, df_areas)
         
         progress_bus.put(job_id, {"event": "info", "message": f"Pipeline concluído com sucesso."})
     
@@ -702,6 +818,139 @@ def _worker_pipeline(job_id: str, paths: dict, config: dict):
         progress_bus.put(job_id, {"event": "done"})
         progress_bus.close(job_id)
 
+def _finalize_theme_ranking(job_id: str, survey_id: int, df_areas: pd.DataFrame, area_ids=None):
+    """
+    Nota dos comentários por tema/área + ranking geral (area_id = 0).
+    Idempotente: o ranking geral anterior é removido antes de recalcular.
+    Com area_ids (carga incremental), só as linhas dessas áreas e as que mudaram
+    de valor são regravadas no theme_ranking.
+    """
+    def _themes_by_comment():
+        
+        scores = comment_score_calc(survey_id, df_areas)
+        if area_ids is not None:
+            scores = select_theme_scores_to_update(scores, get_themes_score(survey_id), area_ids)
+        update_theme_ranking_scores(survey_id, scores)
+        delete_general_theme_ranking(survey_id)
+        theme_ranking = get_theme_ranking(survey_id)
+        df_ranking = calculate_theme_average (theme_ranking, survey_id)
+ 
+        # Ordena pela menor nota geral
+        df_ranking = df_ranking.sort_values(by="nota_geral", ascending=True).reset_index(drop=True)
+        df_ranking['ranking'] = range(1, len(df_ranking) + 1)
+ 
+        df_ranking = df_ranking.sort_values(by="nota_direta", ascending=True).reset_index(drop=True)
+        df_ranking['ranking_direta'] = range(1, len(df_ranking) + 1)
+
+        return df_ranking
+    
+    ranking_final = timed_step(job_id, "Calculando nota dos comentários...", _themes_by_comment)
+    save_general_ranking(ranking_final)
+
+def _worker_resume(job_id: str, survey_id: int):
+    """
+    Worker: retoma a classificação de um survey (só comentários pendentes/falhos)
+    e recalcula as notas dos temas.
+    """
+    import traceback
+    try:
+        progress_bus.put(job_id, {"event": "info", "message": "Retomando classificação..."})
+
+        perc_stats = timed_step(job_id, "Classificar percepções pendentes", classify_and_save_perceptions, survey_id, list(TEMAS), "gpt-4o", 0.0, False, on_progress=_perceptions_progress(job_id))
+        progress_bus.put(job_id, {"event": "stats", "scope": "perceptions", "data": perc_stats})
+
+        _finalize_theme_ranking(job_id, survey_id, fetch_survey_areas(survey_id))
+
+        progress_bus.put(job_id, {"event": "stats", "scope": "classification_status", "data": count_classification_status(survey_id)})
+        progress_bus.put(job_id, {"event": "info", "message": "Retomada concluída com sucesso."})
+
+    except Exception as e:
+        traceback.print_exc()
+        progress_bus.put(job_id, {"event": "error", "message": str(e)})
+
+    finally:
+        progress_bus.put(job_id, {"event": "done"})
+        progress_bus.close(job_id)
+
+def _worker_append(job_id: str, survey_id: int, paths: dict, config: dict):
+    """
+    Worker: carga incremental de respostas num survey existente.
+    """
+    import traceback
+    try:
+        progress_bus.put(job_id, {"event": "info", "message": "Iniciando carga incremental..."})
+        progress_bus.put(job_id, {"event": "survey", "survey_id": survey_id})
+
+        min_lvl = int(config.get("org_top") or 0)
+        max_lvl = int(config.get("org_bottom") or 999)
+
+        def _read_csvs():
+            df_campanha = read_csv_flex(paths["campanha"])
+            df_person = read_csv_flex(paths["pessoas"]) if "pessoas" in paths else None
+            return df_campanha, df_person
+
+        df_campanha, df_person = timed_step(job_id, "1 - lendo arquivos (csv)", _read_csvs)
+
+        # employees já cadastrados no survey (a carga incremental não altera pessoas/áreas)
+        df_employee = timed_step(job_id, "2 - carregando employees", fetch_survey_person, survey_id)
+
+        # Completar e-mails na df_campanha a partir do Nome e Sobrenome
+        if df_person is not None:
+            df_temp = pd.merge(
+                df_campanha,
+                df_person,
+                how='left',
+                left_on=['Nome', 'Sobrenome'],
+                right_on=['nome', 'sobrenome']
+            )
+            df_campanha['Email'] = df_campanha['Email'].where(
+                df_campanha['Email'].notna(),
+                df_temp['email']
+            )
+
+        df_processed = timed_step(job_id, "3 - Normalizar respostas (df_final)", data_preprocessing, df_campanha, survey_id, df_employee, config.get("perguntas_abertas"))
+
+        # só comentários inéditos por (employee, pergunta, hash do texto)
+        q_c_stats = timed_step(job_id, "4 - Inserir comentários novos", persist_questions_and_comments, df_processed, True)
+        progress_bus.put(job_id, {"event": "stats", "scope": "questions_comments", "data": q_c_stats})
+
+        if not q_c_stats["comments"]:
+            progress_bus.put(job_id, {"event": "info", "message": "Nenhum comentário novo; nada a recalcular."})
+            return
+
+        # classify_and_save_perceptions já pega só os comentários ainda não classificados
+        perc_stats = timed_step(job_id, "5 - Classificar percepções novas", classify_and_save_perceptions, survey_id, list(TEMAS), "gpt-4o", 0.0, False, on_progress=_perceptions_progress(job_id))
+        progress_bus.put(job_id, {"event": "stats", "scope": "perceptions", "data": perc_stats})
+
+        # áreas afetadas = áreas dos comentários novos + ancestrais
+        df_areas = fetch_survey_areas(survey_id)
+        area_ids = areas_with_ancestors(df_areas, q_c_stats["new_area_ids"])
+        progress_bus.put(job_id, {"event": "stats", "scope": "areas", "data": {"affected_areas": len(area_ids), "total_areas": len(df_areas)}})
+
+        # métricas só são mantidas se o survey já as tem calculadas (area_intents)
+        if not fetch_survey_areas_with_intents(survey_id).empty:
+            def _metrics():
+                n = compute_and_update_area_metrics_python(
+                    survey_id, None, min_lvl, max_lvl, 3, [a for a in area_ids if a != 0]
+                )
+                if 0 in area_ids:
+                    compute_general_area_metrics_and_json(survey_id)
+                return n
+
+            timed_step(job_id, "6 - Atualizando métricas das áreas afetadas", _metrics)
+
+        _finalize_theme_ranking(job_id, survey_id, df_areas, area_ids)
+
+        progress_bus.put(job_id, {"event": "info", "message": "Carga incremental concluída com sucesso."})
+
+    except Exception as e:
+        traceback.print_exc()
+        progress_bus.put(job_id, {"event": "error", "message": str(e)})
+
+    finally:
+        progress_bus.put(job_id, {"event": "done"})
+        progress_bus.close(job_id)
+
 def _worker_plans(job_id: str, survey_id: int, overwrite: bool):
     """
     Worker: gera planos de ação.
@@ -819,10 +1068,7 @@ def dashboard_areas_search():
                            themes_intents_data=themes_intents_data)
 @app.get("/area_review_events/<job_id>")
 def area_review_events(job_id: str):
-    def generate():
-        for chunk in progress_bus.stream(job_id):
-            yield chunk
-    return Response(generate(), mimetype="text/event-stream")
+    return _sse_response(job_id)
 
 # Dispara geração dos resumos de áreas (sincrono e simples)
 @app.post("/generate_area_reviews")
@@ -872,19 +1118,23 @@ def generate_area_reviews_async():
     if not row:
         return jsonify({"error": "Pesquisa não encontrada."}), 400
 
-    job_id = str(uuid.uuid4())
-    progress_bus.open(job_id)
-
-    th = threading.Thread(
-        target=_worker_area_reviews,
-        args=(job_id, survey_id, overwrite),
-        daemon=True
-    )
-    th.start()
+    job_id = submit_job("area_reviews", {"survey_id": survey_id, "overwrite": overwrite}, _job_priority(data))
     return jsonify({"job_id": job_id}), 200
 #############################################
 #############################################
 
+# job_type -> worker (usado por worker.py e pelos workers embutidos)
+JOB_HANDLERS = {
+    "pipeline": _worker_pipeline,
+    "resume": _worker_resume,
+    "append": _worker_append,
+    "plans": _worker_plans,
+    "area_reviews": _worker_area_reviews,
+}
+
+# Workers na própria aplicação (JOB_EMBEDDED_WORKERS > 0); em produção use `python worker.py`
+if JOB_EMBEDDED_WORKERS > 0:
+    start_embedded_workers(JOB_HANDLERS)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
\ No newline at end of file
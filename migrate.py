@@ -0,0 +1,31 @@
+# migrate.py
+"""
+Migrações do banco (arquivos em migrations/).
+
+    python migrate.py            -> aplica as pendentes
+    python migrate.py status     -> lista aplicadas/pendentes
+    python migrate.py 2          -> aplica até a versão 2
+    python migrate.py partition  -> (opcional) particiona comment/perception por pesquisa
+"""
+import logging
+import sys
+
+from service.migrations import migrate, migration_status
+from service.partitioning import enable_survey_partitioning
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    arg = sys.argv[1] if len(sys.argv) > 1 else None
+    if arg == "status":
+        for m in migration_status():
+            state = "pendente" if m["applied_at"] is None else f"aplicada em {m['applied_at']:%Y-%m-%d %H:%M}"
+            if m["checksum_ok"] is False:
+                state += " (arquivo alterado depois de aplicada)"
+            print(f"{m['version']:04d}_{m['name']}: {state}")
+    elif arg == "partition":
+        migrate()
+        surveys = enable_survey_partitioning()
+        print("já estava particionado" if surveys is None else f"particionado: {len(surveys)} pesquisa(s)")
+    else:
+        applied = migrate(int(arg) if arg else None)
+        print(f"{len(applied)} migração(ões) aplicada(s)" + (f": {applied}" if applied else ""))
@@ -0,0 +1,120 @@
+-- migrate: no-transaction
+-- Leva um banco criado pelo dump original ao schema que o código espera:
+-- tabelas, colunas e índices que entraram em classificacao_clima.sql antes
+-- das migrações versionadas existirem. Tudo com IF NOT EXISTS: num banco
+-- carregado do dump atual não muda nada.
+-- Comando a comando fora de transação (índices CONCURRENTLY); cada um pode
+-- ser repetido se a migração parar no meio.
+
+-- fila de jobs (job_queue) e arquivos enviados com o job
+CREATE TABLE IF NOT EXISTS public.job (
+    job_id character varying(36) NOT NULL,
+    job_type character varying(50) NOT NULL,
+    payload jsonb DEFAULT '{}'::jsonb NOT NULL,
+    priority integer DEFAULT 0 NOT NULL,
+    status character varying(20) DEFAULT 'queued'::character varying NOT NULL,
+    progress jsonb,
+    error text,
+    attempts integer DEFAULT 0 NOT NULL,
+    cancel_requested boolean DEFAULT false NOT NULL,
+    worker_id character varying(100),
+    created_at timestamp without time zone DEFAULT now() NOT NULL,
+    started_at timestamp without time zone,
+    heartbeat_at timestamp without time zone,
+    finished_at timestamp without time zone,
+    CONSTRAINT job_pkey PRIMARY KEY (job_id),
+    CONSTRAINT job_status_check CHECK (((status)::text = ANY ((ARRAY['queued'::character varying, 'running'::character varying, 'done'::character varying, 'failed'::character varying, 'cancelled'::character varying])::text[])))
+);
+
+CREATE INDEX IF NOT EXISTS job_queue_idx
+    ON public.job USING btree (priority DESC, created_at) WHERE ((status)::text = 'queued'::text);
+
+CREATE TABLE IF NOT EXISTS public.job_file (
+    job_id character varying(36) NOT NULL,
+    file_key character varying(50) NOT NULL,
+    content bytea NOT NULL,
+    CONSTRAINT job_file_pkey PRIMARY KEY (job_id, file_key),
+    CONSTRAINT fk_job_file_job FOREIGN KEY (job_id) REFERENCES public.job(job_id) ON DELETE CASCADE
+);
+
+-- eventos de progresso (PROGRESS_BACKEND=postgres, replay por Last-Event-ID)
+CREATE SEQUENCE IF NOT EXISTS public.job_event_event_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+CREATE TABLE IF NOT EXISTS public.job_event (
+    event_id bigint DEFAULT nextval('public.job_event_event_id_seq'::regclass) NOT NULL,
+    job_id character varying(36) NOT NULL,
+    payload jsonb NOT NULL,
+    created_at timestamp without time zone DEFAULT now() NOT NULL,
+    CONSTRAINT job_event_pkey PRIMARY KEY (event_id)
+);
+
+ALTER SEQUENCE public.job_event_event_id_seq OWNED BY public.job_event.event_id;
+
+CREATE INDEX IF NOT EXISTS job_event_job_idx ON public.job_event USING btree (job_id, event_id);
+
+CREATE INDEX IF NOT EXISTS job_event_created_idx ON public.job_event USING btree (created_at);
+
+-- mapa pergunta -> tema reaproveitado entre pesquisas
+CREATE TABLE IF NOT EXISTS public.question_theme_map (
+    question_key text NOT NULL,
+    question_text character varying(500) NOT NULL,
+    theme_name character varying(255) NOT NULL,
+    source character varying(20) DEFAULT 'llm'::character varying NOT NULL,
+    version integer DEFAULT 1 NOT NULL,
+    updated_at timestamp without time zone DEFAULT now() NOT NULL,
+    CONSTRAINT question_theme_map_pkey PRIMARY KEY (question_key),
+    CONSTRAINT question_theme_map_source_check CHECK (((source)::text = ANY ((ARRAY['llm'::character varying, 'manual'::character varying])::text[])))
+);
+
+-- intervalos da subárvore (OrgTree); pesquisas antigas ficam com NULL até o
+-- organograma ser regravado (nenhuma consulta depende deles nesse caso)
+ALTER TABLE public.area ADD COLUMN IF NOT EXISTS area_tree_in integer;
+
+ALTER TABLE public.area ADD COLUMN IF NOT EXISTS area_tree_out integer;
+
+-- status da classificação (retomada); comentário antigo que já tem percepção conta como 'done'
+ALTER TABLE public.comment
+    ADD COLUMN IF NOT EXISTS comment_classification_status character varying(20) DEFAULT 'pending'::character varying NOT NULL;
+
+UPDATE public.comment c
+   SET comment_classification_status = 'done'
+ WHERE c.comment_classification_status = 'pending'
+   AND EXISTS (SELECT 1 FROM public.perception p WHERE p.perception_comment_id = c.comment_id);
+
+-- perguntas repetidas na mesma pesquisa impedem o índice único do ON CONFLICT
+-- (insert_questions): os comentários passam para a de menor id e as demais saem.
+-- Um comando só: o cascade de fk_comment_question já encontra os comentários movidos.
+WITH dup AS (
+    SELECT question_id,
+           min(question_id) OVER (PARTITION BY question_survey_id, question_name) AS keep_id
+      FROM public.question
+), moved AS (
+    UPDATE public.comment c
+       SET comment_question_id = dup.keep_id
+      FROM dup
+     WHERE c.comment_question_id = dup.question_id
+       AND dup.question_id <> dup.keep_id
+)
+DELETE FROM public.question q
+ USING dup
+ WHERE q.question_id = dup.question_id
+   AND dup.question_id <> dup.keep_id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS question_survey_name_uidx
+    ON public.question USING btree (question_survey_id, question_name);
+
+-- chave (employee, pergunta, texto) da carga incremental
+CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_survey_employee_question_idx
+    ON public.comment USING btree (comment_survey_id, comment_employee_id, comment_question_id);
+
+-- UPDATE ... FROM da tabela de staging de notas (update_theme_ranking_scores)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS theme_ranking_survey_area_theme_idx
+    ON public.theme_ranking USING btree (survey_id, area_id, theme_name);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS area_survey_tree_idx
+    ON public.area USING btree (area_survey_id, area_tree_in, area_tree_out);
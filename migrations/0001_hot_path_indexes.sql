@@ -0,0 +1,38 @@
+-- migrate: no-transaction
+-- Índices das consultas quentes (dashboard, métricas por área, classificação).
+-- CONCURRENTLY: não bloqueia escrita nas tabelas grandes; por isso fora de transação.
+-- Já cobertos pelos índices criados na 0000_series_schema:
+--   question(question_survey_id)         -> question_survey_name_uidx
+--   comment(comment_survey_id, ...)      -> comment_survey_employee_question_idx
+--   theme_ranking(survey_id, area_id)    -> theme_ranking_survey_area_theme_idx
+
+-- get_themes_intents / list_perception_themes_for_survey / métricas por área:
+-- filtro por pesquisa (+ área) e agregação por tema x intenção só no índice
+CREATE INDEX CONCURRENTLY IF NOT EXISTS perception_survey_area_idx
+    ON public.perception USING btree (perception_survey_id, perception_area_id)
+    INCLUDE (perception_theme, perception_intension);
+
+-- percepções de um conjunto de comentários (get_comments_with_perceptions) e FK para comment
+CREATE INDEX CONCURRENTLY IF NOT EXISTS perception_comment_idx
+    ON public.perception USING btree (perception_comment_id);
+
+-- join question -> comment e FK fk_comment_question
+CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_question_idx
+    ON public.comment USING btree (comment_question_id);
+
+-- colaboradores da pesquisa (por e-mail/id) e contagem por área
+CREATE INDEX CONCURRENTLY IF NOT EXISTS employee_survey_employee_idx
+    ON public.employee USING btree (employee_survey_id, employee_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS employee_survey_area_idx
+    ON public.employee USING btree (employee_survey_id, employee_area_id);
+
+-- área de uma pesquisa pelo area_id do arquivo
+CREATE INDEX CONCURRENTLY IF NOT EXISTS area_survey_area_idx
+    ON public.area USING btree (area_survey_id, area_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS action_plan_survey_idx
+    ON public.action_plan USING btree (action_plan_survey_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS config_empresa_survey_idx
+    ON public.config_empresa USING btree (survey_id);
@@ -0,0 +1,31 @@
+-- Chaves estrangeiras que faltavam (apagar a pesquisa leva junto tudo dela).
+-- Só NOT VALID aqui: a criação não lê as linhas existentes e segura o lock da
+-- tabela só até o commit desta migração. Linhas novas já são checadas; as
+-- antigas (órfãs incluídas) ficam para a 0003, que valida fora de transação.
+-- comment_employee_id não vira FK: employee_id só é único dentro da pesquisa.
+
+DO $$
+DECLARE
+    fk record;
+BEGIN
+    FOR fk IN
+        SELECT * FROM (VALUES
+            ('perception',     'fk_perception_comment',     'perception_comment_id', 'comment(comment_id)'),
+            ('perception',     'fk_perception_survey',      'perception_survey_id',  'survey(survey_id)'),
+            ('comment',        'fk_comment_survey',         'comment_survey_id',     'survey(survey_id)'),
+            ('employee',       'fk_employee_survey',        'employee_survey_id',    'survey(survey_id)'),
+            ('area',           'fk_area_survey',            'area_survey_id',        'survey(survey_id)'),
+            ('theme_ranking',  'fk_theme_ranking_survey',   'survey_id',             'survey(survey_id)'),
+            ('action_plan',    'fk_action_plan_survey',     'action_plan_survey_id', 'survey(survey_id)'),
+            ('config_empresa', 'fk_config_empresa_survey',  'survey_id',             'survey(survey_id)')
+        ) AS t(tbl, name, col, ref)
+    LOOP
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = fk.name) THEN
+            EXECUTE format(
+                'ALTER TABLE public.%I ADD CONSTRAINT %I FOREIGN KEY (%I) REFERENCES public.%s ON DELETE CASCADE NOT VALID',
+                fk.tbl, fk.name, fk.col, fk.ref
+            );
+        END IF;
+    END LOOP;
+END
+$$;
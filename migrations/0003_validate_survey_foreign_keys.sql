@@ -0,0 +1,52 @@
+-- migrate: no-transaction
+-- Valida as FKs criadas NOT VALID na 0002. O VALIDATE lê a tabela inteira com
+-- um lock que não bloqueia leitura nem escrita; cada comando commita sozinho.
+-- O dump original não tinha essas FKs e apagar pesquisas deixava linhas
+-- órfãs: elas são removidas antes (o runner registra quantas, por comando).
+-- Com a FK já existente nenhuma órfã nova entra entre o DELETE e o VALIDATE.
+
+-- comentários antes das percepções: o cascade de fk_perception_comment leva as dele
+DELETE FROM public.comment c
+ WHERE c.comment_survey_id IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM public.survey s WHERE s.survey_id = c.comment_survey_id);
+
+ALTER TABLE public.comment VALIDATE CONSTRAINT fk_comment_survey;
+
+DELETE FROM public.perception p
+ WHERE NOT EXISTS (SELECT 1 FROM public.comment c WHERE c.comment_id = p.perception_comment_id);
+
+ALTER TABLE public.perception VALIDATE CONSTRAINT fk_perception_comment;
+
+DELETE FROM public.perception p
+ WHERE p.perception_survey_id IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM public.survey s WHERE s.survey_id = p.perception_survey_id);
+
+ALTER TABLE public.perception VALIDATE CONSTRAINT fk_perception_survey;
+
+DELETE FROM public.employee e
+ WHERE NOT EXISTS (SELECT 1 FROM public.survey s WHERE s.survey_id = e.employee_survey_id);
+
+ALTER TABLE public.employee VALIDATE CONSTRAINT fk_employee_survey;
+
+DELETE FROM public.area a
+ WHERE NOT EXISTS (SELECT 1 FROM public.survey s WHERE s.survey_id = a.area_survey_id);
+
+ALTER TABLE public.area VALIDATE CONSTRAINT fk_area_survey;
+
+DELETE FROM public.theme_ranking t
+ WHERE t.survey_id IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM public.survey s WHERE s.survey_id = t.survey_id);
+
+ALTER TABLE public.theme_ranking VALIDATE CONSTRAINT fk_theme_ranking_survey;
+
+DELETE FROM public.action_plan a
+ WHERE a.action_plan_survey_id IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM public.survey s WHERE s.survey_id = a.action_plan_survey_id);
+
+ALTER TABLE public.action_plan VALIDATE CONSTRAINT fk_action_plan_survey;
+
+DELETE FROM public.config_empresa c
+ WHERE c.survey_id IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM public.survey s WHERE s.survey_id = c.survey_id);
+
+ALTER TABLE public.config_empresa VALIDATE CONSTRAINT fk_config_empresa_survey;
@@ -2,6 +2,7 @@ from typing import List
 import pandas as pd
 from sqlalchemy import text
 from db_config import engine
+from service.bulk_loader import bulk_insert, bulk_insert_df
 import json
 
 REQUIRED_COLS = {"area_id", "area_name", "area_parent", "area_survey_id"}
@@ -21,21 +22,40 @@ def insert_areas (df_areas: pd.DataFrame) -> int:
         raise ValueError(f"Colunas obrigatórias ausentes no DF: {', '.join(sorted(missing))}")
 
     with engine.begin() as conn:
-        df_areas.to_sql(
-            "area",
-            con=conn,
-            if_exists="append",
-            index=False,
-            method="multi",
-            chunksize=1000
-        )
-
-    return len(df_areas)
+        return bulk_insert_df(conn, "area", df_areas)
 
 # ============================================================
 # Consultas e updates
 # ============================================================
 
+def update_area_tree_intervals(survey_id: int, df_intervals: pd.DataFrame) -> int:
+    """
+    Grava area_tree_in/area_tree_out (OrgTree.intervals()) em um único UPDATE.
+    Retorna o número de linhas atualizadas.
+    """
+    if df_intervals is None or df_intervals.empty:
+        return 0
+    sql = text("""
+        UPDATE area a
+           SET area_tree_in  = v.tree_in,
+               area_tree_out = v.tree_out
+          FROM unnest(
+                 CAST(:ids AS bigint[]),
+                 CAST(:tins AS integer[]),
+                 CAST(:touts AS integer[])
+               ) AS v(area_id, tree_in, tree_out)
+         WHERE a.area_survey_id = :sid
+           AND a.area_id = v.area_id
+    """)
+    params = {
+        "sid": survey_id,
+        "ids": [int(x) for x in df_intervals["area_id"]],
+        "tins": [int(x) for x in df_intervals["area_tree_in"]],
+        "touts": [int(x) for x in df_intervals["area_tree_out"]],
+    }
+    with engine.begin() as conn:
+        return conn.execute(sql, params).rowcount or 0
+
 def fetch_survey_areas(survey_id: int) -> pd.DataFrame:
     with engine.begin() as conn:
         return pd.read_sql(
@@ -441,55 +461,71 @@ def get_themes_score (survey_id):
             conn, params={"sid": survey_id}
         ) 
        
+def delete_general_theme_ranking(survey_id) -> int:
+    """
+    Remove o ranking geral (area_id = 0) do survey, para recalcular sem duplicar.
+    """
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("DELETE FROM theme_ranking WHERE survey_id = :sid AND area_id = 0"),
+            {"sid": survey_id}
+        )
+        return result.rowcount or 0
+
 #OK
-def update_theme_ranking_scores(survey_id, df_scores):
+def update_theme_ranking_scores(survey_id, df_scores) -> int:
     """
     Atualiza a tabela theme_ranking com base nos scores de comentários.
 
     Espera um DataFrame com as colunas:
     ['area_id', 'theme_name', 'direto', 'total']
+
+    Carrega os scores (COPY) numa tabela temporária e aplica um único
+    UPDATE ... FROM (índice theme_ranking_survey_area_theme_idx).
+    Retorna o número de linhas de theme_ranking atualizadas.
     """
-    with engine.begin() as conn:
+    if df_scores is None or df_scores.empty:
+        return 0
 
-        for _, row in df_scores.iterrows():
-            area_id = int(row["area_id"])
-            theme_name = row["theme_name"]
-            direct_score = row["direto"]
-            total_score = row["total"]
-
-            # Substitui NaN por None (equivalente a NULL no SQL)
-            if pd.isna(direct_score):
-                direct_score = None
-            if pd.isna(total_score):
-                total_score = None
-            if not theme_name or pd.isna(theme_name):
-                continue  # evita erro de parâmetro vazio
-
-            result = conn.execute(
-                text("""
-                    UPDATE theme_ranking
-                    SET 
-                        direct_comment_score = :dcs,
-                        comment_score = :cs
-                    WHERE 
-                        area_id = :aid 
-                        AND survey_id = :sid 
-                        AND theme_name = :t
-                """),
-                {
-                    "dcs": direct_score,
-                    "cs": total_score,
-                    "aid": area_id,
-                    "sid": survey_id,
-                    "t": theme_name
-                }
-            )
+    df = df_scores[["area_id", "theme_name", "direto", "total"]].copy()
+    # evita erro de parâmetro vazio
+    df = df[df["theme_name"].notna() & (df["theme_name"].astype(str) != "")]
+    df["area_id"] = pd.to_numeric(df["area_id"], errors="coerce")
+    df = df.dropna(subset=["area_id"])
+    df["area_id"] = df["area_id"].astype(int)
+    # mesma chave repetida: vale a última (como no update linha a linha)
+    df = df.drop_duplicates(subset=["area_id", "theme_name"], keep="last")
+    if df.empty:
+        return 0
 
-            # Se nenhum registro for atualizado, apenas ignora
-            if result.rowcount == 0:
-                continue
-              
-    return True
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TEMP TABLE tmp_theme_comment_scores (
+                area_id              integer,
+                theme_name           varchar(255),
+                direct_comment_score numeric,
+                comment_score        numeric
+            ) ON COMMIT DROP
+        """))
+        bulk_insert(
+            conn,
+            "tmp_theme_comment_scores",
+            ["area_id", "theme_name", "direct_comment_score", "comment_score"],
+            df.itertuples(index=False, name=None),
+        )
+        result = conn.execute(
+            text("""
+                UPDATE theme_ranking t
+                   SET direct_comment_score = s.direct_comment_score,
+                       comment_score        = s.comment_score
+                  FROM tmp_theme_comment_scores s
+                 WHERE t.survey_id  = :sid
+                   AND t.area_id    = s.area_id
+                   AND t.theme_name = s.theme_name
+            """),
+            {"sid": survey_id}
+        )
+        return result.rowcount or 0
 
 #OK
 def get_area_weights(survey_id):
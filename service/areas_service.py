@@ -3,12 +3,14 @@ from __future__ import annotations
 import pandas as pd
 from typing import Dict, List,  Callable, Optional
 import json
-from .openai_client import get_openai_client
+from .openai_client import chat_completion, discard_cached_completion
 from db_config import engine
 from sqlalchemy import text
-from collections import deque
 import re
+import unicodedata
 import numpy as np
+from .org_tree import OrgTree
+from .question_theme_repository import fetch_question_themes, upsert_question_themes, SOURCE_LLM
 
 
 from .areas_repository import (
@@ -20,7 +22,8 @@ from .areas_repository import (
     update_area_metrics_bulk,
     fetch_survey_areas_with_intents,
     get_area_perceptions,
-    get_themes_score
+    get_themes_score,
+    update_area_tree_intervals
 )
 
 # ============================================================
@@ -35,7 +38,8 @@ def create_organizational_chart(
 ) -> pd.DataFrame:
     """
     Retorna DataFrame pronto para inserir na tabela `area` com colunas:
-      - area_id, area_name, area_parent, area_level, area_survey_id
+      - area_id, area_name, area_parent, area_level, area_survey_id,
+        area_tree_in, area_tree_out (intervalo da subárvore, ver OrgTree)
 
     Regras:
       - Inclui TODAS as áreas (sem recorte de níveis).
@@ -46,7 +50,7 @@ def create_organizational_chart(
 
     Observações:
       - Pais inválidos (nulos, texto não numérico ou que não existam em `id`) são tratados como raiz (parent=NULL).
-      - Evita loops simples no cálculo de níveis.
+      - Auto-parent e ciclos não derrubam o cálculo: a OrgTree quebra o laço e a área vira topo.
     """
 
     # ============== 1) Normaliza chaves e faz o merge instância ↔ hierarquia ==============
@@ -99,55 +103,22 @@ def create_organizational_chart(
 
     base["area_parent"] = base["area_parent"].apply(norm_parent).astype("Int64")
 
-    # ============== 3) Descobre raízes originais e calcula níveis (sem Geral) ==============
+    # ============== 3) Descobre raízes originais ==============
     # raiz = parent NULL
     roots: List[int] = base.loc[base["area_parent"].isna(), "area_id"].astype(int).tolist()
     roots = sorted(set(roots))  # exclusão de duplicidades
 
-    # constrói mapa de filhos ignorando pais NULL
-    children: Dict[int, List[int]] = {}
-    for _, r in base.iterrows():
-        aid = int(r["area_id"])
-        pid = r["area_parent"]
-        if pd.isna(pid):
-            continue
-        pid = int(pid)
-        if aid == pid:
-            # evita laço trivial (uma área apontando para si mesma)
-            continue
-        children.setdefault(pid, []).append(aid)
-
-    # BFS multi-fonte: todos os roots começam com nível 0
-    levels: Dict[int, int] = {}
-    q = deque(roots)
-    for rt in roots:
-        levels[rt] = 0
-
-    while q:
-        cur = q.popleft()
-        for ch in children.get(cur, []):
-            if ch == cur or ch in levels:
-                continue
-            levels[ch] = levels[cur] + 1
-            q.append(ch)
-
-    # aplica níveis (áreas isoladas de um root — improvável após saneamento — ficam <NA>)
-    base["area_level"] = base["area_id"].apply(lambda x: levels.get(int(x), pd.NA)).astype("Int64")
-
     # ============== 4) Se houver mais de um topo, cria Geral e reparenta topos ==============
     if len(roots) > 1:
-        # cria Geral (id=0), parent=NULL, level=0
+        # cria Geral (id=0), parent=NULL
         geral_row = pd.DataFrame([{
             "area_id": 0,
             "area_name": "Geral",
             "area_parent": pd.NA,
-            "area_level": 0
         }])
 
-        # torna todos os roots filhos da Geral
-        # (parent 0), e eleva o nível de todas as áreas em +1
+        # torna todos os roots filhos da Geral (parent 0)
         base.loc[base["area_id"].isin(roots), "area_parent"] = 0
-        base["area_level"] = base["area_level"].apply(lambda v: (int(v) + 1) if not pd.isna(v) else pd.NA).astype("Int64")
 
         # concatena Geral
         full = pd.concat([geral_row, base], ignore_index=True)
@@ -158,8 +129,8 @@ def create_organizational_chart(
         root_id = roots[0]
         
         # atualiza o root para virar a área Geral
-        base.loc[base["area_id"] == root_id, ["area_id","area_name", "area_parent", "area_level"]] = [
-            0, "Geral", pd.NA, 0
+        base.loc[base["area_id"] == root_id, ["area_id","area_name", "area_parent"]] = [
+            0, "Geral", pd.NA
         ]
         
         # atualiza os filhos do root para terem parent = 0
@@ -171,9 +142,16 @@ def create_organizational_chart(
         # sem root (caso extremo), mantém como está
         full = base.copy()
 
-    # ============== 5) Finaliza com area_survey_id e ordenação ==============
+    # ============== 5) Níveis e intervalos da subárvore (OrgTree) ==============
+    # nível 0 = Geral/topo; laços (auto-parent, ciclos) são quebrados pela OrgTree
+    tree = OrgTree.from_frame(full)
+    full = full.drop(columns=["area_level"], errors="ignore").merge(tree.intervals(), on="area_id", how="left")
+    for col in ("area_level", "area_tree_in", "area_tree_out"):
+        full[col] = full[col].astype("Int64")
+
+    # ============== 6) Finaliza com area_survey_id e ordenação ==============
     full["area_survey_id"] = area_survey_id
-    full = full.loc[:, ["area_id", "area_name", "area_parent", "area_level", "area_survey_id"]]
+    full = full.loc[:, ["area_id", "area_name", "area_parent", "area_level", "area_survey_id", "area_tree_in", "area_tree_out"]]
     # ordena: nível (NA primeiro, por segurança), depois parent, depois id
     full = full.sort_values(["area_level", "area_parent", "area_id"], na_position="first").reset_index(drop=True)
     return full
@@ -198,75 +176,12 @@ def _normalize_intent(s: str | None) -> str | None:
 
 def _compute_area_levels(areas: pd.DataFrame) -> pd.Series:
     """
-    Calcula nível da área (0 = topo) de forma robusta:
-    - trata auto-parent (area_id == area_parent) como topo
-    - quebra ciclos (A->B->A) e IDs de parent inexistentes
+    Calcula nível da área (0 = topo) via OrgTree:
+    - trata auto-parent (area_id == area_parent) e parent inexistente como topo
+    - quebra ciclos (A->B->A) na área de menor id
     - trata parent não-numérico como nulo
     """
-    # mapa area_id -> parent (int ou None)
-    def to_int_or_none(x):
-        try:
-            if pd.isna(x) or x is None or str(x).strip() == "":
-                return None
-            return int(x)
-        except Exception:
-            return None
-
-    parent = {int(r.area_id): to_int_or_none(r.area_parent) for _, r in areas.iterrows()}
-    memo: Dict[int, int] = {}
-    visiting: set[int] = set()
-
-    def level_of(aid: int) -> int:
-        # base: geral
-        if aid == 0:
-            memo[aid] = 0
-            return 0
-        if aid in memo:
-            return memo[aid]
-
-        p = parent.get(aid, None)
-        # topo: sem parent, parent inválido, ou auto-parent → nível 0
-        if p is None or p == aid:
-            memo[aid] = 0
-            return 0
-
-        # quebra ciclo
-        if aid in visiting:
-            memo[aid] = 0
-            return 0
-
-        visiting.add(aid)
-        # se parent não existe no dict, trate como topo
-        if p not in parent:
-            lvl = 0
-        else:
-            lvl = level_of(p) + 1
-        visiting.remove(aid)
-
-        memo[aid] = lvl
-        return lvl
-
-    levels = {int(aid): level_of(int(aid)) for aid in areas["area_id"].tolist()}
-    return pd.Series(levels, name="level")
-
-def _build_children_map(areas: pd.DataFrame) -> Dict[int, List[int]]:
-    def to_int_or_none(x):
-        try:
-            if pd.isna(x) or x is None or str(x).strip() == "":
-                return None
-            return int(x)
-        except Exception:
-            return None
-
-    children: Dict[int, List[int]] = {}
-    for _, row in areas.iterrows():
-        aid = int(row["area_id"])
-        pid = to_int_or_none(row["area_parent"])
-        # ignora auto-parent (evita 0->0 e A->A)
-        if pid is None or pid == aid:
-            continue
-        children.setdefault(pid, []).append(aid)
-    return children
+    return pd.Series(OrgTree.from_frame(areas).levels(), name="level")
 
 def build_recortes_by_theme_intent(sub_perceptions: pd.DataFrame) -> Dict[str, Dict[str, list]]:
     """
@@ -307,21 +222,6 @@ def build_recortes_by_theme_intent(sub_perceptions: pd.DataFrame) -> Dict[str, D
 
     return out
 
-def _descendants(area_id: int, children_map: Dict[int, List[int]]) -> List[int]:
-    stack = [area_id]
-    out: List[int] = []
-    visited: set[int] = set()
-    while stack:
-        cur = stack.pop()
-        if cur in visited:
-            continue
-        visited.add(cur)
-        out.append(cur)
-        for ch in children_map.get(cur, []):
-            if ch not in visited:
-                stack.append(ch)
-    return out
-
 # ---- métricas individuais ----
 def metric_employee_number(subtree_employees: pd.DataFrame) -> int:
     return int(subtree_employees["employee_id"].nunique())
@@ -369,23 +269,43 @@ def metric_area_score(
     - Score final (para ranking global):
         score_perception * confiança * peso_ajustado
     """
+    if subtree_perceptions.empty:
+        return metric_area_score_from_counts({}, 0, respondents_area, employees_area, employees_global, k)
+
+    intent_counts = subtree_perceptions["intent_norm"].value_counts().to_dict()
+    return metric_area_score_from_counts(
+        intent_counts, len(subtree_perceptions), respondents_area, employees_area, employees_global, k
+    )
+
+# pesos por tipo de percepção
+INTENT_WEIGHTS = {
+    "reconhecimento":  2,
+    "sugestao":       -1,
+    "critica":        -2,
+    "neutro":          0,
+}
+
+def metric_area_score_from_counts(
+    intent_counts: Dict[str, int],
+    perceptions_number: int,    # total de percepções da subárvore (inclui intenções não mapeadas)
+    respondents_area: int,
+    employees_area: int,
+    employees_global: int,
+    k: int = 5
+) -> float:
+    """
+    Mesmo cálculo de metric_area_score, a partir das contagens por intenção
+    (permite acumular a subárvore sem filtrar o DataFrame de percepções).
+    """
     # validações iniciais
     if employees_area <= 0 or employees_global <= 0 or respondents_area <= 0:
         return 0
 
-    if subtree_perceptions.empty:
+    if perceptions_number <= 0:
         return 0
 
-    # pesos por tipo de percepção
-    weight = {
-        "reconhecimento":  2,
-        "sugestao":       -1,
-        "critica":        -2,
-        "neutro":          0,
-    }
-
     # soma dos pesos de todos os comentários (cada percepção pode contribuir)
-    total_weight = subtree_perceptions["intent_norm"].map(weight).fillna(0).sum()
+    total_weight = sum(int(intent_counts.get(i, 0) or 0) * w for i, w in INTENT_WEIGHTS.items())
 
     # score de percepção da área (escala -100 a +100)
     media = total_weight / (respondents_area + k)
@@ -458,12 +378,128 @@ def metric_area_intents_json(
     }
     return json.dumps(data, ensure_ascii=False)
 
+# ---- agregação da subárvore (de baixo para cima) ----
+# colunas da matriz tema × intenção; "" = intenção não mapeada (só conta presença do tema)
+_INTENT_COLUMNS = ["critica", "sugestao", "reconhecimento", "neutro", ""]
+
+def _area_leaf_aggregates(
+    area_ids: List[int],
+    df_employees: pd.DataFrame,
+    df_comments: pd.DataFrame,
+    perc: pd.DataFrame,
+    survey_id: int,
+) -> dict:
+    """
+    Contagens de cada área considerando só os registros dela (sem descendentes):
+      employees/commenters: {area_id -> set(ids)}
+      comments:             {area_id -> nº de comentários}
+      theme_intents:        matriz (áreas × temas × intenções), na ordem de area_ids
+      recortes:             {area_id -> posições em recortes_rows}
+    Os filtros por survey são os mesmos da versão por área.
+    """
+    index = {aid: i for i, aid in enumerate(area_ids)}
+
+    def by_area(df: pd.DataFrame, area_col: str, survey_col: str) -> pd.DataFrame:
+        if df.empty:
+            return df.assign(_area=pd.Series(dtype="int64"))
+        df = df[df[survey_col] == survey_id]
+        area = pd.to_numeric(df[area_col], errors="coerce")
+        df = df[area.isin(index.keys())]
+        return df.assign(_area=area[area.isin(index.keys())].astype(int))
+
+    emp = by_area(df_employees, "employee_area_id", "employee_survey_id")
+    employees = {int(a): set(g.tolist()) for a, g in emp.groupby("_area")["employee_id"]}
+
+    com = by_area(df_comments, "comment_area_id", "comment_survey_id")
+    commenters = {int(a): set(g.tolist()) for a, g in com.groupby("_area")["comment_employee_id"]}
+    comments = {int(a): int(n) for a, n in com.groupby("_area").size().items()}
+
+    p = by_area(perc, "comment_area_id", "comment_survey_id")
+    tema = p["perception_theme"].fillna("Sem tema").astype(str).str.strip()
+    intent = p["intent_norm"].fillna("")
+    themes = sorted(set(tema.tolist()))
+
+    theme_intents = np.zeros((len(area_ids), len(themes), len(_INTENT_COLUMNS)), dtype=np.int64)
+    if not p.empty:
+        t_idx = tema.map({t: i for i, t in enumerate(themes)}).to_numpy()
+        i_idx = intent.map({v: i for i, v in enumerate(_INTENT_COLUMNS)}).to_numpy()
+        a_idx = p["_area"].map(index).to_numpy()
+        np.add.at(theme_intents, (a_idx, t_idx, i_idx), 1)
+
+    # recortes válidos (texto não vazio e intenção mapeada), na ordem original das percepções
+    clip = p["perception_comment_clipping"].fillna("").astype(str).str.strip()
+    ok = (clip != "") & (intent != "")
+    recortes_rows = list(zip(tema[ok].tolist(), intent[ok].tolist(), clip[ok].tolist()))
+    recortes: Dict[int, np.ndarray] = {}
+    for a, g in pd.Series(np.arange(len(recortes_rows)), index=p.loc[ok, "_area"].to_numpy()).groupby(level=0):
+        recortes[int(a)] = g.to_numpy()
+
+    return {
+        "employees": employees,
+        "commenters": commenters,
+        "comments": comments,
+        "theme_intents": theme_intents,
+        "recortes": recortes,
+        "themes": themes,
+        "recortes_rows": recortes_rows,
+    }
+
+def _rollup_area_aggregates(area_ids: List[int], tree: OrgTree, own: dict) -> Dict[int, dict]:
+    """
+    Soma as contagens de cada área com as das filhas em pós-ordem, de modo que
+    cada registro é tocado uma vez por nível em vez de uma vez por área.
+    """
+    index = {aid: i for i, aid in enumerate(area_ids)}
+
+    def leaf(aid: int) -> dict:
+        return {
+            "employees": own["employees"].get(aid, set()),
+            "commenters": own["commenters"].get(aid, set()),
+            "comments": own["comments"].get(aid, 0),
+            "theme_intents": own["theme_intents"][index[aid]],
+            "recortes": own["recortes"].get(aid, np.empty(0, dtype=np.int64)),
+        }
+
+    def combine(parts: List[dict]) -> dict:
+        if len(parts) == 1:
+            return parts[0]
+        return {
+            "employees": set().union(*(x["employees"] for x in parts)),
+            "commenters": set().union(*(x["commenters"] for x in parts)),
+            "comments": sum(x["comments"] for x in parts),
+            "theme_intents": sum(x["theme_intents"] for x in parts),
+            "recortes": np.sort(np.concatenate([x["recortes"] for x in parts])),
+        }
+
+    totals: Dict[int, dict] = {}
+    for aid in tree.post_order():
+        totals[aid] = combine([leaf(aid)] + [totals[c] for c in tree.children(aid)])
+    return totals
+
+def _theme_counts_from_matrix(themes: List[str], matrix: np.ndarray) -> Dict[str, Dict[str, int]]:
+    """Equivalente a metric_theme_counts a partir da matriz tema × intenção da subárvore."""
+    out: Dict[str, Dict[str, int]] = {}
+    for t, tema in enumerate(themes):
+        row = matrix[t]
+        if not row.any():
+            continue
+        crit, sug, rec, neu = (int(v) for v in row[:4])
+        out[tema] = {
+            "critica": crit,
+            "sugestao": sug,
+            "reconhecimento": rec,
+            "neutro": neu,
+            "total": crit + sug + rec + neu
+        }
+    return out
+
 def compute_area_metrics_python(
     survey_id: int,
     df_notas_areas,
     min_level: int = 0,
     max_level: int = 999,
     min_commenters: int = 3,
+    area_ids: Optional[List[int]] = None,
 ) -> pd.DataFrame:
     """
     Calcula métricas por área em Python e retorna um DataFrame com:
@@ -482,6 +518,9 @@ def compute_area_metrics_python(
     - Todas as métricas consideram a subárvore (área + descendentes).
     - O JSON salvo em area_intents segue o formato já acordado.
     - Áreas de nível 0 são sempre calculadas, mesmo fora do range informado.
+    - area_ids restringe as linhas devolvidas (carga incremental); as subárvores
+      continuam completas.
+    - df_notas_areas=None reaproveita as notas das perguntas já gravadas no area_intents.
     """
 
     # --- Carrega dados da base
@@ -511,8 +550,8 @@ def compute_area_metrics_python(
         df_comments = df_comments.dropna(subset=["comment_employee_id"]).copy()
         df_comments["comment_employee_id"] = df_comments["comment_employee_id"].astype(int)
 
-    # --- Níveis e mapa de filhos
-    children = _build_children_map(df_areas)
+    # --- Organograma indexado (subárvores)
+    tree = OrgTree.from_frame(df_areas)
 
     # --- Percepções enriquecidas com employee_id e normalização de intenção
     perc = df_perc.copy()
@@ -545,75 +584,81 @@ def compute_area_metrics_python(
 
     rows = []
 
-    df_notas_areas = df_notas_areas[['area_id', 'pergunta', 'porcentagem insatisfeitos', 'nota', 'nota da empresa']].dropna()
+    if df_notas_areas is None:
+        notas_area = _stored_question_scores(survey_id)
+    else:
+        df_notas_areas = df_notas_areas[['area_id', 'pergunta', 'porcentagem insatisfeitos', 'nota', 'nota da empresa']].dropna()
+
+        # Agrupa por pergunta e transforma cada grupo em um dicionário (não depende da área)
+        notas_area = (
+            df_notas_areas
+            .groupby("pergunta")
+            .apply(lambda x: x.iloc[0].to_dict())  # Pega a primeira linha de cada pergunta
+            .to_dict()
+        )
+
+    only_ids = None if area_ids is None else {int(a) for a in area_ids}
+
+    # --- Contagens de cada área (sem descendentes), uma única passada por DataFrame
+    area_ids = list(dict.fromkeys(df_areas["area_id"].astype(int).tolist()))
+    own = _area_leaf_aggregates(area_ids, df_employees, df_comments, perc, survey_id)
+
+    # --- Acumula de baixo para cima (filhos -> pai)
+    totals = _rollup_area_aggregates(area_ids, tree, own)
+    themes, recortes_rows = own["themes"], own["recortes_rows"]
 
     # --- Processa cada área
     for _, area_row in df_areas.iterrows():
         aid = int(area_row["area_id"])
         lvl = int(area_row.get("area_level", 0))
 
+        if only_ids is not None and aid not in only_ids:
+            continue
+
         # --- NOVA REGRA: sempre incluir áreas de nível 0
         if lvl != 0 and (lvl < min_level or lvl > max_level):
             continue
 
-        # Subárvore (área + descendentes)
-        sub_ids = _descendants(aid, children)
-        sub_set = set(sub_ids)
-
-        # Agrupa por pergunta e transforma cada grupo em um dicionário
-        notas_area = (
-            df_notas_areas
-            .groupby("pergunta")
-            .apply(lambda x: x.iloc[0].to_dict())  # Pega a primeira linha de cada pergunta
-            .to_dict()
-        )
+        agg = totals[aid]
 
         # quantidade de pessoas da área (considerando sub-áreas)
-        sub_emp = df_employees[
-            (df_employees["employee_area_id"].isin(sub_set)) &
-            (df_employees["employee_survey_id"] == survey_id)
-        ]
-        area_employee_number = metric_employee_number(sub_emp)
-
-        # Comentários feitos por esses funcionários
-        if not df_comments.empty and area_employee_number > 0:
-            sub_com = df_comments[
-                (df_comments["comment_area_id"].isin(sub_set)) &
-                (df_comments["comment_survey_id"] == survey_id)
-            ]
-        else:
-            sub_com = df_comments.iloc[0:0]
+        area_employee_number = len(agg["employees"])
 
-        # Percepções ligadas a esses comentários
-        if not perc.empty and not sub_com.empty:
-            sub_perc = perc[
-                (perc["comment_area_id"].isin(sub_set)) &
-                (perc["comment_survey_id"] == survey_id)
-            ]
-
-        else:
-            sub_perc = perc.iloc[0:0]
+        # comentários/percepções só contam quando a subárvore tem funcionários
+        has_comments = area_employee_number > 0 and agg["comments"] > 0
 
         # quantidade de pessoas que comentaram na área (considerando sub-áreas)
-        area_commenters_number = int(sub_com["comment_employee_id"].nunique()) if not sub_com.empty else 0
+        area_commenters_number = len(agg["commenters"]) if has_comments else 0
         if area_commenters_number < min_commenters:
             continue
 
+        # Contagem por tema × intenção (linhas = temas, colunas = _INTENT_COLUMNS)
+        theme_matrix = agg["theme_intents"] if has_comments else np.zeros((len(themes), len(_INTENT_COLUMNS)), dtype=np.int64)
+        perceptions_number = int(theme_matrix.sum())
+
         # Contagens gerais por intenção
-        intent_counts = metric_intent_counts(sub_perc)
+        by_intent = theme_matrix.sum(axis=0)
+        intent_counts = {i: int(by_intent[j]) for j, i in enumerate(_INTENT_COLUMNS[:4])}
+        intent_counts["total"] = sum(intent_counts.values())
         crit = intent_counts["critica"]
         sug  = intent_counts["sugestao"]
         rec  = intent_counts["reconhecimento"]
 
-        # Contagem por tema × intenção
-        themes_counts = metric_theme_counts(sub_perc)
+        themes_counts = _theme_counts_from_matrix(themes, theme_matrix)
 
         response_rate = metric_response_rate(area_employee_number, area_commenters_number)
         peso_area     = (area_employee_number / employees_global) if commenters_global else 0.0
-        area_score    = metric_area_score(sub_perc, area_commenters_number, area_employee_number, employees_global)
+        area_score    = metric_area_score_from_counts(
+            intent_counts, perceptions_number, area_commenters_number, area_employee_number, employees_global
+        )
 
-        # Recortes organizados por tema × intenção
-        recortes_by_theme_intent = build_recortes_by_theme_intent(sub_perc)
+        # Recortes organizados por tema × intenção (mesma ordem das percepções)
+        recortes_by_theme_intent = {}
+        if has_comments:
+            for pos in agg["recortes"]:
+                tema, intent, clip = recortes_rows[pos]
+                bucket = recortes_by_theme_intent.setdefault(tema, {"critica": [], "sugestao": [], "reconhecimento": [], "neutro": []})
+                bucket[intent].append(clip)
 
         # JSON final (para gravar em area_intents)
         intents_json = metric_area_intents_json(
@@ -652,15 +697,37 @@ def compute_and_update_area_metrics_python(
     min_level: int,
     max_level: int,
     min_commenters: int,
+    area_ids: Optional[List[int]] = None,
 ) -> int:
     """
     Calcula métricas em Python e persiste no Postgres.
+    Com area_ids, só essas áreas são recalculadas e gravadas.
     Retorna quantas áreas foram atualizadas.
     """
 
-    df = compute_area_metrics_python(survey_id, df_notas_areas, min_level, max_level, min_commenters)
+    df = compute_area_metrics_python(survey_id, df_notas_areas, min_level, max_level, min_commenters, area_ids)
+    if df.empty:
+        return 0
     return update_area_metrics_bulk(survey_id, df)
 
+def _stored_question_scores(survey_id: int) -> dict:
+    """Notas das perguntas gravadas no area_intents (são as mesmas em todas as áreas)."""
+    df = fetch_survey_areas_with_intents(survey_id)
+    for raw in df.get("area_intents", pd.Series(dtype=object)).tolist():
+        notas = _parse_area_intents_json(raw).get("Nota das perguntas")
+        if notas:
+            return notas
+    return {}
+
+def areas_with_ancestors(df_areas: pd.DataFrame, area_ids) -> List[int]:
+    """Áreas informadas + todos os ancestrais no organograma (sem repetir)."""
+    tree = OrgTree.from_frame(df_areas)
+    out: Dict[int, None] = {}
+    for aid in area_ids:
+        for a in tree.ancestors(int(aid), include_self=True):
+            out[a] = None
+    return list(out)
+
 def compute_and_update_general_metrics(survey_id: int) -> int:
     """
     Consolida as métricas da área 'Geral' (area_id=0) a partir de suas filhas diretas (area_parent=0).
@@ -1150,7 +1217,6 @@ def generate_and_save_area_reviews(
     Gera resumos por área (apenas com area_intents != null e area_id != 0).
     Se on_progress for fornecido, é chamado por área com status: 'ok' | 'indisponivel' | 'erro'.
     """
-    client = get_openai_client()
     df_areas = df_plan if df_plan is not None else fetch_survey_areas_with_intents(survey_id)
     if df_areas.empty:
         return 0
@@ -1181,10 +1247,11 @@ def generate_and_save_area_reviews(
 
             #GERA RESUMO
             prompt = _build_area_review_prompt(area_name, intents_payload)
-            resp = client.chat.completions.create(
+            resp = chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
+                use_cache=False,
             )
             content = resp.choices[0].message.content.strip()
             
@@ -1194,10 +1261,11 @@ def generate_and_save_area_reviews(
 
             #REFINA RESUMO
             prompt_ajust = _build_ajust_area_review_prompt(area_name, intents_payload, content)
-            resp = client.chat.completions.create(
+            resp = chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt_ajust}],
                 temperature=temperature,
+                use_cache=False,
             )
             content_final = resp.choices[0].message.content.strip()            
 
@@ -1247,6 +1315,14 @@ def _parse_area_intents_json(s: str | dict | None) -> dict:
         return {}
 
 def ensure_general_parenting(survey_id: int, min_level: int = 0) -> None:
+    """
+    Reparenta as áreas de topo para a Geral (ver _reparent_to_general) e
+    recalcula os intervalos da subárvore (area_tree_in/area_tree_out).
+    """
+    _reparent_to_general(survey_id, min_level=min_level)
+    update_area_tree_intervals(survey_id, OrgTree.from_survey(survey_id).intervals())
+
+def _reparent_to_general(survey_id: int, min_level: int = 0) -> None:
     """
     Regras:
     - Garante a existência da área Geral (id=0, parent=0).
@@ -1467,7 +1543,6 @@ def generate_and_save_area_plans(survey_id: int, model: str, temperature: float,
     from service.areas_repository import save_area_plan
     
     df_plan = fetch_survey_areas_with_intents(survey_id)
-    client = get_openai_client()
 
     df_plan = df_plan[
         (df_plan["area_id"] != 0) &
@@ -1494,10 +1569,11 @@ def generate_and_save_area_plans(survey_id: int, model: str, temperature: float,
                 area_review=area_review
             )
 
-            resp = client.chat.completions.create(
+            resp = chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
-                temperature=temperature
+                temperature=temperature,
+                use_cache=False,
             )
             
             choices = resp.choices
@@ -1577,9 +1653,8 @@ def get_themes_intents(area_id, survey_id: int) -> pd.DataFrame:
 # ============================================================
 
 #OK
-def closed_question_classification (pergunta, temas):
+def closed_question_classification (pergunta, temas, use_cache=True):
     
-    client = get_openai_client()
     model: str = "gpt-4o"
     temperature: float = 0.0
 
@@ -1598,10 +1673,11 @@ Exeções:
 Output: somente o nome do tema
 """
     try:
-        resp = client.chat.completions.create(
+        resp = chat_completion(
             model=model,
             temperature=temperature,
             messages=[{"role": "user", "content": prompt_user}],
+            use_cache=use_cache,
         )
         tema = resp.choices[0].message.content.strip()
         return tema
@@ -1610,6 +1686,207 @@ Output: somente o nome do tema
         return "Erro na classificação"
 
 
+# perguntas por chamada e quantas vezes re-perguntar itens sem resposta válida
+CLOSED_QUESTION_BATCH_SIZE = 40
+CLOSED_QUESTION_MAX_ROUNDS = 3
+
+_NUMBERED_LINE_RE = re.compile(r"^[\s*_#>\-]*\[?(\d+)\]?\s*[:.)\-–]\s*(.+?)\s*$")
+
+def _normalize_theme(s: str | None) -> str:
+    s = unicodedata.normalize("NFKD", str(s or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.strip().strip("*\"'`").rstrip(".").strip()
+    return re.sub(r"\s+", " ", s).lower()
+
+def _build_closed_questions_prompt(perguntas: List[str], temas: List[str]) -> str:
+    numeradas = "\n".join(f"{i}. {p}" for i, p in enumerate(perguntas, start=1))
+    return f"""
+Você é um especialista em pesquisa de clima organizacional e precisa classificar cada questão abaixo em um dos temas disponíveis:
+
+Questões:
+{numeradas}
+
+Temas disponíveis:
+{temas}
+
+Exceções:
+- Questões de NPS (indicação para amigo ou familiar em uma escala de 0 a 10) normalmente são relacionadas a engajamento.
+
+Output - uma linha por questão, com o número da questão e somente o nome do tema (exatamente como na lista):
+<número>: <tema>
+<número>: <tema>...
+"""
+
+def _parse_closed_questions_output(content: str, n: int, temas_norm: Dict[str, str]) -> Dict[int, str]:
+    """
+    Lê linhas "<número>: <tema>" e devolve {posição (0..n-1): tema canônico}.
+    Números fora da faixa e temas que não estão na lista são descartados.
+    """
+    out: Dict[int, str] = {}
+    for linha in (content or "").splitlines():
+        m = _NUMBERED_LINE_RE.match(linha)
+        if not m:
+            continue
+        idx = int(m.group(1)) - 1
+        tema = temas_norm.get(_normalize_theme(m.group(2)))
+        if 0 <= idx < n and tema is not None and idx not in out:
+            out[idx] = tema
+    return out
+
+def closed_questions_classification_batch(
+    perguntas: List[str],
+    temas: List[str],
+    batch_size: int = CLOSED_QUESTION_BATCH_SIZE,
+    max_rounds: int = CLOSED_QUESTION_MAX_ROUNDS,
+    on_progress: Optional[Callable[[List[tuple]], None]] = None,
+) -> pd.DataFrame:
+    """
+    Classifica as perguntas fechadas em lotes (uma chamada por `batch_size` perguntas).
+    Cada resposta é validada contra `temas`; só os itens sem resposta válida são
+    enviados de novo (até `max_rounds` rodadas). O que sobrar cai no
+    closed_question_classification individual. Re-perguntas não usam o cache
+    do LLM e respostas incompletas saem dele (o mesmo prompt voltaria igual).
+    Retorna DataFrame [pergunta, tema] na ordem das perguntas distintas.
+    """
+    model: str = "gpt-4o"
+    temperature: float = 0.0
+
+    distintas = list(dict.fromkeys(p for p in perguntas if p is not None and not pd.isna(p)))
+    temas_norm = {_normalize_theme(t): t for t in temas}
+    resultado: Dict[str, str] = {}
+
+    pendentes = distintas
+    for rodada in range(max(1, max_rounds)):
+        if not pendentes:
+            break
+        falhas: List[str] = []
+        for i in range(0, len(pendentes), max(1, batch_size)):
+            lote = pendentes[i:i + batch_size]
+            call = dict(
+                model=model,
+                temperature=temperature,
+                messages=[{"role": "user", "content": _build_closed_questions_prompt(lote, temas)}],
+            )
+            try:
+                resp = chat_completion(use_cache=rodada == 0, **call)
+                parsed = _parse_closed_questions_output(resp.choices[0].message.content, len(lote), temas_norm)
+                if len(parsed) < len(lote):
+                    discard_cached_completion(**call)
+            except Exception as e:
+                print(f"Erro ao classificar lote de perguntas ({len(lote)})\n{e}")
+                parsed = {}
+
+            for pos, pergunta in enumerate(lote):
+                if pos in parsed:
+                    resultado[pergunta] = parsed[pos]
+                else:
+                    falhas.append(pergunta)
+            if on_progress:
+                on_progress([(p, resultado[p]) for p in distintas if p in resultado])
+        pendentes = falhas
+
+    for pergunta in pendentes:
+        resultado[pergunta] = closed_question_classification(pergunta, temas, use_cache=False)
+    if pendentes and on_progress:
+        on_progress([(p, resultado[p]) for p in distintas])
+
+    return pd.DataFrame(
+        [(p, resultado[p]) for p in distintas],
+        columns=["pergunta", "tema"],
+    )
+
+
+def classify_closed_questions(
+    perguntas: List[str],
+    temas: List[str],
+    on_progress: Optional[Callable[[List[tuple]], None]] = None,
+) -> pd.DataFrame:
+    """
+    Consulta primeiro o question_theme_map (perguntas já vistas em outras
+    pesquisas) e só manda ao LLM as perguntas inéditas; o que o LLM devolver
+    com tema válido entra no mapa para as próximas pesquisas.
+    Retorna DataFrame [pergunta, tema] na ordem das perguntas distintas.
+    """
+    distintas = list(dict.fromkeys(p for p in perguntas if p is not None and not pd.isna(p)))
+    validos = set(temas)
+
+    conhecidas = {
+        p: t for p, t in fetch_question_themes(distintas).items() if t in validos
+    }
+    ineditas = [p for p in distintas if p not in conhecidas]
+
+    def _progress(classificadas):
+        if on_progress:
+            on_progress([(p, conhecidas[p]) for p in distintas if p in conhecidas] + list(classificadas))
+
+    if conhecidas:
+        _progress([])
+
+    novas = pd.DataFrame(columns=["pergunta", "tema"])
+    if ineditas:
+        novas = closed_questions_classification_batch(ineditas, temas, on_progress=_progress)
+        upsert_question_themes(
+            [(p, t) for p, t in zip(novas["pergunta"], novas["tema"]) if t in validos],
+            source=SOURCE_LLM,
+        )
+
+    resultado = {**conhecidas, **dict(zip(novas["pergunta"], novas["tema"]))}
+    return pd.DataFrame(
+        [(p, resultado.get(p)) for p in distintas],
+        columns=["pergunta", "tema"],
+    )
+
+
+# colunas de saída -> colunas de df_notas_areas usadas na média ponderada
+_THEME_SCORE_COLUMNS = {
+    "nota": "nota",
+    "nota_diretos": "nota diretos",
+    "porcentagem_insatisfeitos": "porcentagem insatisfeitos",
+    "porcentagem_insatisfeitos_diretos": "porcentagem insatisfeitos diretos",
+}
+
+def compute_area_theme_scores(df_notas_areas: pd.DataFrame, df_pesos_area: pd.DataFrame) -> pd.DataFrame:
+    """
+    Média ponderada (peso da área) das notas e % de insatisfeitos por área × tema.
+
+    Espera df_notas_areas com area_id, tema e as colunas de _THEME_SCORE_COLUMNS
+    e df_pesos_area como em get_area_weights (employee_area_id, peso).
+    Mesma regra do cálculo por grupo: soma(x*peso) / soma(peso) — o denominador
+    inclui linhas com x nulo — e None quando o grupo não tem x, não tem peso
+    ou a soma dos pesos é <= 0. Tudo em um único groupby().sum().
+    """
+    out_cols = ["area_id", "tema", *_THEME_SCORE_COLUMNS]
+    if df_notas_areas is None or df_notas_areas.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    df = df_notas_areas.merge(
+        df_pesos_area[["employee_area_id", "peso"]],
+        left_on="area_id",
+        right_on="employee_area_id",
+        how="left"
+    ).drop(columns=["employee_area_id"])
+
+    peso = pd.to_numeric(df["peso"], errors="coerce")
+    parts = {
+        "area_id": df["area_id"],
+        "tema": df["tema"],
+        "_peso": peso,
+        "_peso_n": peso.notna(),
+    }
+    for out, col in _THEME_SCORE_COLUMNS.items():
+        parts[f"_{out}_num"] = df[col] * peso
+        parts[f"_{out}_n"] = df[col].notna()
+
+    g = pd.DataFrame(parts).groupby(["area_id", "tema"]).sum()
+
+    com_peso = (g["_peso_n"] > 0) & (g["_peso"] > 0)
+    res = pd.DataFrame(index=g.index)
+    for out in _THEME_SCORE_COLUMNS:
+        res[out] = (g[f"_{out}_num"] / g["_peso"]).where(com_peso & (g[f"_{out}_n"] > 0))
+
+    return res.reset_index()[out_cols]
+
+
 #OK
 def comment_score_calc(survey_id, df_areas):
     """
@@ -1633,82 +1910,56 @@ def comment_score_calc(survey_id, df_areas):
     df_perception = df_perception[df_perception["perception_intension"].isin(perception_weights.keys())]
     df_perception = df_perception[df_perception["perception_area_id"] != 0]
 
-    # === 3️⃣ Nota direta por (área, tema, intenção)
-    df_perception["peso"] = df_perception["perception_intension"].map(perception_weights)
-
-    df_direto = (
-        df_perception
-        .groupby(["perception_area_id", "perception_theme", "perception_intension"])
-        .size()
-        .reset_index(name="volume")
-    )
-
-    df_direto["nota_parcial"] = df_direto["volume"] * df_direto["perception_intension"].map(perception_weights)
+    # === 3️⃣ Nota direta por (área, tema): soma de volume × peso
+    df_perception = df_perception.assign(peso=df_perception["perception_intension"].map(perception_weights).astype(float))
 
     df_direto_final = (
-        df_direto
-        .groupby(["perception_area_id", "perception_theme"])["nota_parcial"]
+        df_perception
+        .groupby(["perception_area_id", "perception_theme"])["peso"]
         .sum()
         .reset_index()
         .rename(columns={
             "perception_area_id": "area_id",
             "perception_theme": "theme_name",
-            "nota_parcial": "nota_direta_bruta"
+            "peso": "nota_direta_bruta"
         })
     )
 
-    # === 4️⃣ Mapa de filhos (hierarquia)
-    children_map = {}
-    for _, row in df_areas.iterrows():
-        parent = row["area_parent"]
-        child = row["area_id"]
-        if parent is not None:
-            children_map.setdefault(parent, []).append(child)
-
-    def _descendants(aid, tree):
-        filhos = tree.get(aid, [])
-        todos = []
-        for filho in filhos:
-            todos.append(filho)
-            todos.extend(_descendants(filho, tree))
-        return todos
-
-    # === 5️⃣ Nota total (área + descendentes) com divisão pelo nº de áreas
-    rows = []
-
-    for _, area_row in df_areas.iterrows():
-        area_id = area_row["area_id"]
-        filhos = _descendants(area_id, children_map)
-        todos_ids = [area_id] + filhos
-        num_areas = len(todos_ids)
-
-        df_sub = df_perception[df_perception["perception_area_id"].isin(todos_ids)]
-
-        if df_sub.empty:
-            continue
-
-        df_total = (
-            df_sub
-            .groupby(["perception_theme", "perception_intension"])
-            .size()
-            .reset_index(name="volume")
-        )
-        df_total["nota_parcial"] = df_total["volume"] * df_total["perception_intension"].map(perception_weights)
-
-        df_total_final = (
-            df_total
-            .groupby("perception_theme")["nota_parcial"]
-            .sum()
-            .reset_index()
-        )
-        df_total_final["area_id"] = area_id
-        df_total_final["nota_total_bruta"] = df_total_final["nota_parcial"] #/ num_areas
-        df_total_final = df_total_final[["area_id", "perception_theme", "nota_total_bruta"]]
-        df_total_final = df_total_final.rename(columns={"perception_theme": "theme_name"})
-
-        rows.extend(df_total_final.to_dict("records"))
-
-    df_total_bruta = pd.DataFrame(rows)
+    # === 4️⃣ Organograma indexado (hierarquia)
+    tree = OrgTree.from_frame(df_areas)
+
+    # === 5️⃣ Nota total (área + descendentes)
+    # Matriz (posição na pré-ordem × tema) com soma dos pesos e nº de percepções;
+    # a subárvore de uma área é a faixa contígua [tin, tout], então os totais
+    # saem de somas acumuladas: S[tout + 1] - S[tin].
+    df_tot = df_perception.dropna(subset=["perception_theme"])
+    pos = tree.tin_of(df_tot["perception_area_id"])
+    df_tot = df_tot[~np.isnan(pos)]
+    pos = pos[~np.isnan(pos)].astype(np.int64)
+
+    themes = sorted(df_tot["perception_theme"].unique().tolist())
+    col = df_tot["perception_theme"].map({t: i for i, t in enumerate(themes)}).to_numpy(dtype=np.int64)
+
+    peso = np.zeros((len(tree) + 1, len(themes)))
+    volume = np.zeros((len(tree) + 1, len(themes)), dtype=np.int64)
+    np.add.at(peso, (pos + 1, col), df_tot["peso"].to_numpy(dtype=float))
+    np.add.at(volume, (pos + 1, col), 1)
+    peso = peso.cumsum(axis=0)
+    volume = volume.cumsum(axis=0)
+
+    area_ids = [aid for aid in dict.fromkeys(int(a) for a in df_areas["area_id"].tolist()) if aid in tree]
+    lo = np.array([tree.interval(a)[0] for a in area_ids], dtype=np.int64)
+    hi = np.array([tree.interval(a)[1] for a in area_ids], dtype=np.int64)
+    tot_peso = peso[hi + 1] - peso[lo]
+    tot_volume = volume[hi + 1] - volume[lo]
+
+    # só (área, tema) com alguma percepção na subárvore
+    a_idx, t_idx = np.nonzero(tot_volume > 0)
+    df_total_bruta = pd.DataFrame({
+        "area_id": [area_ids[i] for i in a_idx],
+        "theme_name": [themes[j] for j in t_idx],
+        "nota_total_bruta": tot_peso[a_idx, t_idx],
+    })
 
     # === 6️⃣ Merge direto + total
     df_final = pd.merge(
@@ -1728,13 +1979,8 @@ def comment_score_calc(survey_id, df_areas):
     max_score = all_scores.max()
     range_score = max_score - min_score if max_score != min_score else 1
 
-    def normalizar(valor):
-        if pd.isnull(valor):
-            return None
-        return round((valor - min_score) / range_score * 100, 2)
-
-    df_final["direto"] = df_final["nota_direta_bruta"].apply(normalizar)
-    df_final["total"] = df_final["nota_total_bruta"].apply(normalizar)
+    df_final["direto"] = ((df_final["nota_direta_bruta"] - min_score) / range_score * 100).round(2)
+    df_final["total"] = ((df_final["nota_total_bruta"] - min_score) / range_score * 100).round(2)
 
     # === 8️⃣ Resultado final
     df_final = df_final[["area_id", "theme_name", "direto", "total"]]
@@ -1744,8 +1990,36 @@ def comment_score_calc(survey_id, df_areas):
 
     return df_final
 
-
-
+def select_theme_scores_to_update(df_scores: pd.DataFrame, df_stored: pd.DataFrame, area_ids) -> pd.DataFrame:
+    """
+    Carga incremental: das notas de comment_score_calc, só as linhas das áreas
+    afetadas (area_ids) e as que mudaram em relação ao theme_ranking gravado.
+    A normalização 0-100 usa o mínimo/máximo do survey inteiro; se ele mudou com os
+    novos comentários, as demais áreas também entram (e só nesse caso).
+    """
+    if df_scores is None or df_scores.empty:
+        return df_scores
+
+    stored = df_stored[["area_id", "theme_name", "direct_comment_score", "comment_score"]].copy()
+    stored["area_id"] = pd.to_numeric(stored["area_id"], errors="coerce")
+    stored = stored.dropna(subset=["area_id"]).drop_duplicates(subset=["area_id", "theme_name"], keep="last")
+    stored["area_id"] = stored["area_id"].astype(int)
+
+    df = df_scores.copy()
+    df["area_id"] = pd.to_numeric(df["area_id"], errors="coerce")
+    df = df.dropna(subset=["area_id"])
+    df["area_id"] = df["area_id"].astype(int)
+    df = df.merge(stored, on=["area_id", "theme_name"], how="left")
+
+    def _changed(new: pd.Series, old: pd.Series) -> pd.Series:
+        new = pd.to_numeric(new, errors="coerce")
+        old = pd.to_numeric(old, errors="coerce")
+        same = (new.isna() & old.isna()) | ((new - old).abs() < 1e-6)
+        return ~same
+
+    affected = df["area_id"].isin({int(a) for a in area_ids})
+    changed = _changed(df["direto"], df["direct_comment_score"]) | _changed(df["total"], df["comment_score"])
+    return df.loc[affected | changed, ["area_id", "theme_name", "direto", "total"]].reset_index(drop=True)
 
 
 #OK
@@ -0,0 +1,149 @@
+# service/bulk_loader.py
+import datetime
+import io
+import logging
+import math
+from decimal import Decimal
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Carga em lote: COPY FROM STDIN -> execute_values -> executemany
+# ============================================================
+
+EXECUTE_VALUES_PAGE_SIZE = 1000
+
+def _is_missing(value) -> bool:
+    if value is None or value is pd.NA or value is pd.NaT:
+        return True
+    if isinstance(value, (float, np.floating)):
+        return math.isnan(value)
+    return False
+
+def _to_python(value):
+    """Converte escalares numpy/pandas para tipos nativos (ausentes -> None)."""
+    if _is_missing(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+def _csv_field(value) -> str:
+    """
+    Campo no formato CSV do COPY: vazio sem aspas = NULL, texto sempre entre aspas
+    (assim '' continua sendo string vazia).
+    """
+    value = _to_python(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        # 3.0 vindo de coluna float não pode quebrar uma coluna integer
+        return str(int(value)) if value.is_integer() else repr(value)
+    if isinstance(value, (int, Decimal)):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+def _normalize_rows(columns: Sequence[str], rows: Iterable) -> List[tuple]:
+    out = []
+    for r in rows:
+        if isinstance(r, dict):
+            out.append(tuple(_to_python(r.get(c)) for c in columns))
+        else:
+            out.append(tuple(_to_python(v) for v in r))
+    return out
+
+def _csv_buffer(rows: List[tuple]) -> io.StringIO:
+    buf = io.StringIO()
+    for r in rows:
+        buf.write(",".join(_csv_field(v) for v in r))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+def _copy(cursor, table: str, columns: Sequence[str], rows: List[tuple]) -> bool:
+    """COPY via psycopg2 (copy_expert) ou psycopg3 (cursor.copy). False se o driver não suporta."""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    buf = _csv_buffer(rows)
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(sql, buf)
+        return True
+    if hasattr(cursor, "copy"):
+        with cursor.copy(sql) as cp:
+            cp.write(buf.getvalue())
+        return True
+    return False
+
+def _execute_values(cursor, table: str, columns: Sequence[str], rows: List[tuple]) -> bool:
+    try:
+        from psycopg2.extras import execute_values
+    except ImportError:
+        return False
+    if not hasattr(cursor, "copy_expert"):
+        # execute_values só funciona com cursor psycopg2
+        return False
+    execute_values(
+        cursor,
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+        rows,
+        page_size=EXECUTE_VALUES_PAGE_SIZE,
+    )
+    return True
+
+def _is_data_error(exc: Exception) -> bool:
+    """Erros de dado/constraint (SQLSTATE 22xxx/23xxx) não melhoram trocando o método de carga."""
+    code = getattr(exc, "pgcode", None) or getattr(exc, "sqlstate", None) or ""
+    return code.startswith(("22", "23"))
+
+def bulk_insert(conn, table: str, columns: Sequence[str], rows: Iterable) -> int:
+    """
+    Insere `rows` (dicts ou tuplas na ordem de `columns`) em `table` usando a
+    conexão/transação SQLAlchemy recebida.
+    Tenta COPY FROM STDIN; se o driver não suportar ou der erro, execute_values;
+    por último executemany. Cada tentativa roda em SAVEPOINT para não abortar a
+    transação do chamador; erros de dado/constraint sobem direto.
+    Retorna o número de linhas enviadas.
+    """
+    columns = list(columns)
+    data = _normalize_rows(columns, rows)
+    if not data:
+        return 0
+
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        for name, loader in (("copy", _copy), ("execute_values", _execute_values)):
+            try:
+                with conn.begin_nested():
+                    if loader(cursor, table, columns, data):
+                        return len(data)
+            except Exception as e:
+                if _is_data_error(e):
+                    raise
+                logger.warning("bulk_insert(%s): %s falhou (%s); tentando próximo método", table, name, e)
+    finally:
+        cursor.close()
+
+    params = [dict(zip(columns, r)) for r in data]
+    sql = text(f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({', '.join(':' + c for c in columns)})
+    """)
+    conn.execute(sql, params)
+    return len(data)
+
+def bulk_insert_df(conn, table: str, df: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> int:
+    """Atalho para DataFrame (usa todas as colunas quando `columns` não é informado)."""
+    if df is None or df.empty:
+        return 0
+    columns = list(columns) if columns is not None else list(df.columns)
+    return bulk_insert(conn, table, columns, df[columns].itertuples(index=False, name=None))
@@ -2,15 +2,14 @@ import pandas as pd
 import re
 from typing import Dict, List
 from service.question_repository import insert_questions
-from service.comment_repository import employee_lookup_map, insert_comments
-from .openai_client import get_openai_client
+from service.comment_repository import employee_lookup_map, insert_comments, fetch_comment_keys, comment_text_hash
+from .openai_client import chat_completion
 from db_config import engine
-from sqlalchemy import text
+from service.bulk_loader import bulk_insert
 
 #FAZ VÍNCULO DAS CATEGORIAS COM OS TEMAS
 def define_category_themes (categorias, temas):
     
-    client = get_openai_client()
     model: str = "gpt-4o"
     temperature: float = 0.0
 
@@ -34,7 +33,7 @@ Output - traga somente a lista das categorias com o tema escolhido para ela:
 <categoria>: <tema>...
 """
     try:
-        resp = client.chat.completions.create(
+        resp = chat_completion(
             model=model,
             temperature=temperature,
             messages=[{"role": "user", "content": prompt_user}],
@@ -91,16 +90,12 @@ def save_themes_score(df_themes, survey_id):
 
     rows: List[dict] = df_to_insert.to_dict(orient="records")
 
-    sql = text("""
-        INSERT INTO theme_ranking (
-            area_id, theme_name, score, direct_score, dissatisfied_score, direct_dissatisfied_score, survey_id
-        ) VALUES (
-            :area_id, :theme_name, :score, :direct_score, :dissatisfied_score, :direct_dissatisfied_score, :survey_id
-        )
-    """)
-
+    columns = [
+        "area_id", "theme_name", "score", "direct_score",
+        "dissatisfied_score", "direct_dissatisfied_score", "survey_id",
+    ]
     with engine.begin() as conn:
-        conn.execute(sql, rows)
+        bulk_insert(conn, "theme_ranking", columns, rows)
 
     return True
 
@@ -123,16 +118,21 @@ def define_questions (df_campanha, survey_id, perguntas_abertas):
                 
     return True
 
-#OK
-def data_preprocessing(df_campanha, survey_id, df_employee, perguntas_abertas):
-      
-    perguntas_abertas = [int(i.strip()) for i in perguntas_abertas.split(",") if i.strip()]
-    nova_planilha = []
-    colunas = df_campanha.columns.tolist()
- 
-    # Valores indesejados para comentários
-    INVALID_COMMENTS = {".", "..", "...", "-", "--", "---", "NULL", "null", "NaN", "nan", "na", "N/A", "n/a", "N/a","N/D", "N/d", "n/d", "nd", "ND", "Nenhuma", "Nehuma.", "Não aplicável", "Não aplicável.", "Não tenho", "Não tenho.", "Nada a declarar", "Nada a declarar.", "Sem considerações", "Sem considerações.", "Sem comentários"}
-    
+def _to_text(serie: pd.Series) -> pd.Series:
+    """
+    Equivalente vetorizado do str(valor) feito linha a linha (iterrows): qualquer
+    ausente (None, NaN, NA) vira 'nan', como acontecia com a linha lida pelo iterrows.
+    """
+    texto = serie.astype(str).astype(object)
+    texto[serie.isna()] = "nan"
+    return texto.astype(str)
+
+def _open_question_columns(colunas, perguntas_abertas):
+    """
+    Percorre o cabeçalho e devolve, para cada pergunta aberta selecionada:
+    (coluna_categoria, coluna_pergunta, coluna_comentario | None, pergunta_texto).
+    """
+    blocos = []
     i = 0
     while i < len(colunas):
 
@@ -153,37 +153,7 @@ def data_preprocessing(df_campanha, survey_id, df_employee, perguntas_abertas):
                         coluna_comentario = proxima_coluna
 
                 pergunta_texto = re.sub(r'^\d+-', '', coluna_pergunta.strip())
-
-                for _, row in df_campanha.iterrows():
-                    email = row['Email']
-                    resposta = row[coluna_pergunta]
-                    categoria = row[coluna_categoria]
-                    categoria = re.sub(r'^\d+-', '', str(categoria).strip())
-
-                    if coluna_comentario:
-                        comentario = row.get(coluna_comentario, None)
-                        comentario_valido = pd.notna(comentario) and str(comentario).strip() != ""
-
-                        if comentario_valido:
-                            resposta = comentario
-                        else:
-                            continue
-                    else:
-                        if pd.isna(resposta) or str(resposta).strip() == "":
-                            continue
-
-                    # --- Filtro para remover comentários/respostas indesejadas ---
-                    resposta = str(resposta).strip()
-                    if resposta in INVALID_COMMENTS:
-                        continue
-
-                    nova_planilha.append({
-                        'email': email,
-                        'categoria': categoria,
-                        'pergunta': pergunta_texto,
-                        'resposta': resposta,
-                        'survey_id': survey_id
-                    })
+                blocos.append((coluna_categoria, coluna_pergunta, coluna_comentario, pergunta_texto))
 
                 i += 2
                 if coluna_comentario:
@@ -192,8 +162,42 @@ def data_preprocessing(df_campanha, survey_id, df_employee, perguntas_abertas):
                 i += 1
         else:
             i += 1
+    return blocos
+
+#OK
+def data_preprocessing(df_campanha, survey_id, df_employee, perguntas_abertas):
+      
+    perguntas_abertas = [int(i.strip()) for i in perguntas_abertas.split(",") if i.strip()]
+    colunas = df_campanha.columns.tolist()
+ 
+    # Valores indesejados para comentários
+    INVALID_COMMENTS = {".", "..", "...", "-", "--", "---", "NULL", "null", "NaN", "nan", "na", "N/A", "n/a", "N/a","N/D", "N/d", "n/d", "nd", "ND", "Nenhuma", "Nehuma.", "Não aplicável", "Não aplicável.", "Não tenho", "Não tenho.", "Nada a declarar", "Nada a declarar.", "Sem considerações", "Sem considerações.", "Sem comentários"}
 
-    df_resultado = pd.DataFrame(nova_planilha) 
+    # Formato longo (uma linha por respondente x pergunta), na ordem pergunta -> linha da planilha.
+    # Quando existe coluna de comentário ela substitui a resposta.
+    blocos = []
+    for coluna_categoria, coluna_pergunta, coluna_comentario, pergunta_texto in _open_question_columns(colunas, perguntas_abertas):
+        blocos.append(pd.DataFrame({
+            'email': df_campanha['Email'].to_numpy(),
+            'categoria': df_campanha[coluna_categoria].to_numpy(),
+            'pergunta': pergunta_texto,
+            'resposta': df_campanha[coluna_comentario or coluna_pergunta].to_numpy(),
+        }))
+
+    col_resultado = ['email', 'categoria', 'pergunta', 'resposta', 'survey_id']
+    if blocos:
+        df_longo = pd.concat(blocos, ignore_index=True)
+
+        # --- Filtro para remover comentários/respostas vazias ou indesejadas ---
+        df_longo = df_longo[df_longo['resposta'].notna()]
+        df_longo['resposta'] = _to_text(df_longo['resposta']).str.strip()
+        df_longo = df_longo[(df_longo['resposta'] != "") & ~df_longo['resposta'].isin(INVALID_COMMENTS)]
+
+        df_longo['categoria'] = _to_text(df_longo['categoria']).str.strip().str.replace(r'^\d+-', '', regex=True)
+        df_longo['survey_id'] = survey_id
+        df_resultado = df_longo[col_resultado].reset_index(drop=True)
+    else:
+        df_resultado = pd.DataFrame(columns=col_resultado)
     
     # Limpa emails internos mindsight
     #if not df_resultado.empty:
@@ -219,7 +223,7 @@ def data_preprocessing(df_campanha, survey_id, df_employee, perguntas_abertas):
     return df_final
 
 #OK
-def persist_questions_and_comments(df_final: pd.DataFrame) -> Dict[str, int]: 
+def persist_questions_and_comments(df_final: pd.DataFrame, only_new: bool = False) -> Dict[str, int]: 
 
     """
     Espera colunas: ['email','categoria','pergunta','resposta','survey_id','area_id','gestor_id'].
@@ -229,6 +233,10 @@ def persist_questions_and_comments(df_final: pd.DataFrame) -> Dict[str, int]:
       3) Insere comentários (comment).
     Retorna contadores: questions, comments, skipped_no_employee, skipped_no_question,
                        area_mismatch, gestor_mismatch.
+
+    only_new=True (carga incremental num survey existente): pula comentários que já
+    existem por (employee, pergunta, md5 do texto), inclusive repetidos no próprio
+    arquivo, e devolve também skipped_existing e new_area_ids (áreas dos inseridos).
     """
     df_final["area_id"] = pd.to_numeric(df_final["area_id"], errors="coerce")
     df_final["gestor_id"] = pd.to_numeric(df_final["gestor_id"], errors="coerce")
@@ -247,6 +255,9 @@ def persist_questions_and_comments(df_final: pd.DataFrame) -> Dict[str, int]:
         "area_mismatch": 0,
         "gestor_mismatch": 0,
     }
+    if only_new:
+        stats["skipped_existing"] = 0
+    new_area_ids = set()
 
     # processa por survey_id (caso haja múltiplos no DF)
     for survey_id, df_s in df_final.groupby("survey_id"):
@@ -265,6 +276,7 @@ def persist_questions_and_comments(df_final: pd.DataFrame) -> Dict[str, int]:
 
         # 2) mapa completo de employees por email (inclui area/gestor atuais no banco)
         emap = employee_lookup_map(sid)
+        existing = fetch_comment_keys(sid) if only_new else None
 
         # 3) montar payload de comments
         payload = []
@@ -300,6 +312,15 @@ def persist_questions_and_comments(df_final: pd.DataFrame) -> Dict[str, int]:
                 if int(emp["employee_manager_id"]) != df_gestor:
                     stats["gestor_mismatch"] += 1
 
+            if only_new:
+                key = (int(emp["employee_id"]), int(qid), comment_text_hash(text_comment))
+                if key in existing:
+                    stats["skipped_existing"] += 1
+                    continue
+                existing.add(key)
+                if aid is not None:
+                    new_area_ids.add(aid)
+
             payload.append({
                 "comment": text_comment,
                 "comment_employee_id": int(emp["employee_id"]),
@@ -311,4 +332,6 @@ def persist_questions_and_comments(df_final: pd.DataFrame) -> Dict[str, int]:
         inserted = insert_comments(payload)
         stats["comments"] += inserted
 
+    if only_new:
+        stats["new_area_ids"] = sorted(new_area_ids)
     return stats
\ No newline at end of file
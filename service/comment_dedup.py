@@ -0,0 +1,159 @@
+# service/comment_dedup.py
+import os
+import re
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ============================================================
+# Deduplicação de comentários (hash exato + MinHash/LSH)
+# ============================================================
+
+# opt-in: membros de grupo quase igual herdam tema/intenção do representante
+COMMENT_DEDUP_ENABLED = os.environ.get("COMMENT_DEDUP_ENABLED", "0") in ("1", "true", "True")
+# similaridade de Jaccard (pares de palavras) para considerar dois comentários o mesmo
+COMMENT_DEDUP_THRESHOLD = float(os.environ.get("COMMENT_DEDUP_THRESHOLD", "0.85"))
+# comentários curtos dependem da pergunta para serem classificados: só agrupam dentro da mesma pergunta
+COMMENT_DEDUP_MIN_WORDS_GLOBAL = int(os.environ.get("COMMENT_DEDUP_MIN_WORDS_GLOBAL", "6"))
+
+NUM_PERM = 64
+BANDS = 16           # 16 bandas x 4 linhas: candidatos a partir de ~0.5 de similaridade
+_PRIME = (1 << 61) - 1
+# no máximo quantos candidatos (os de maior concordância MinHash) passam pelo Jaccard exato
+MAX_CANDIDATES = 32
+
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, 1 << 29, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+
+def normalize_comment(text: str) -> str:
+    """Minúsculas, sem acento, sem pontuação e com espaços colapsados."""
+    s = unicodedata.normalize("NFKD", str(text or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+def _shingles(norm: str) -> frozenset:
+    # pares de palavras consecutivas (uma palavra só vira o próprio token)
+    words = norm.split()
+    grams = [" ".join(words[i:i + 2]) for i in range(max(1, len(words) - 1))]
+    return frozenset(zlib.crc32(g.encode("utf-8")) for g in grams)
+
+def _minhash(shingles: frozenset) -> np.ndarray:
+    # (a*x + b) mod p com a < 2^29 e x < 2^32: cabe em uint64 sem overflow
+    x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    return ((x[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % _PRIME).min(axis=0)
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    inter = len(a & b)
+    union = len(a) + len(b) - inter
+    return inter / union if union else 1.0
+
+def dedupe_comments(
+    items: List[dict],
+    threshold: Optional[float] = None,
+    min_words_global: Optional[int] = None,
+) -> Tuple[List[dict], Dict[int, List[dict]]]:
+    """
+    Agrupa comentários iguais (após normalização) ou quase iguais (Jaccard >= threshold).
+    Cada grupo é comparado só com o seu representante (primeiro da ordem), sem
+    encadear A~B~C. Comentários com menos de `min_words_global` palavras só
+    agrupam com a mesma pergunta.
+    Retorna (representantes na ordem original,
+             {comment_id do representante: [representante, membro, ...]} só para grupos com membros).
+    """
+    threshold = COMMENT_DEDUP_THRESHOLD if threshold is None else float(threshold)
+    min_words_global = COMMENT_DEDUP_MIN_WORDS_GLOBAL if min_words_global is None else int(min_words_global)
+    rows_per_band = NUM_PERM // BANDS
+    use_lsh = threshold < 1.0
+
+    exact: Dict[Tuple, int] = {}
+    buckets: Dict[Tuple, List[int]] = {}
+    # por representante (índice r): item, shingles e assinatura MinHash
+    rep_items: List[dict] = []
+    rep_shingles: List[frozenset] = []
+    rep_sigs = np.empty((len(items), NUM_PERM), dtype=np.uint64)
+    representatives: List[dict] = []
+    clusters: Dict[int, List[dict]] = {}
+
+    for it in items:
+        norm = normalize_comment(it.get("comment"))
+        if not norm:
+            representatives.append(it)
+            continue
+        scope = None if len(norm.split()) >= min_words_global else normalize_comment(it.get("question"))
+
+        # 1) hash exato
+        r = exact.get((scope, norm))
+
+        # 2) LSH: candidatos que colidem em alguma banda; a concordância das
+        #    assinaturas filtra e ordena, o Jaccard real confirma
+        sh = sig = keys = None
+        if r is None and use_lsh:
+            sh = _shingles(norm)
+            sig = _minhash(sh)
+            keys = [
+                (scope, b, sig[b * rows_per_band:(b + 1) * rows_per_band].tobytes())
+                for b in range(BANDS)
+            ]
+            cands = {c for key in keys for c in buckets.get(key, ())}
+            if cands:
+                cands = np.fromiter(cands, dtype=np.int64, count=len(cands))
+                agree = (rep_sigs[cands] == sig).mean(axis=1)
+                order = np.argsort(-agree, kind="stable")[:MAX_CANDIDATES]
+                for k in order:
+                    if agree[k] < threshold - 0.15:
+                        break
+                    c = int(cands[k])
+                    if _jaccard(sh, rep_shingles[c]) >= threshold:
+                        r = c
+                        break
+
+        if r is not None:
+            clusters[rep_items[r]["comment_id"]].append(it)
+            continue
+
+        r = len(rep_items)
+        rep_items.append(it)
+        exact[(scope, norm)] = r
+        if use_lsh:
+            rep_shingles.append(sh)
+            rep_sigs[r] = sig
+            for key in keys:
+                buckets.setdefault(key, []).append(r)
+        representatives.append(it)
+        clusters[it["comment_id"]] = [it]
+
+    return representatives, {cid: c for cid, c in clusters.items() if len(c) > 1}
+
+def fan_out_perceptions(payload: List[dict], clusters: Dict[int, List[dict]]) -> List[dict]:
+    """
+    Replica as percepções do representante para todos os membros do grupo
+    (comment_id e área de cada membro): todo comentário marcado 'done' tem as
+    suas percepções. Membro igual ao representante após normalização herda o
+    recorte; membro só parecido leva o próprio comentário como recorte.
+    """
+    if not clusters:
+        return payload
+    by_rep: Dict[int, List[dict]] = {}
+    for p in payload:
+        by_rep.setdefault(p["perception_comment_id"], []).append(p)
+
+    out = list(payload)
+    for rep_id, percs in by_rep.items():
+        group = clusters.get(rep_id)
+        if not group:
+            continue
+        rep_norm = normalize_comment(group[0].get("comment"))
+        for m in group[1:]:
+            own = None
+            if normalize_comment(m.get("comment")) != rep_norm:
+                own = str(m.get("comment") or "").strip()[:1000] or None
+            for p in percs:
+                member = {**p, "perception_comment_id": m["comment_id"], "perception_area_id": m.get("area_id")}
+                if own is not None:
+                    member["perception_comment_clipping"] = own
+                out.append(member)
+    return out
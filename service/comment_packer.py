@@ -0,0 +1,146 @@
+# service/comment_packer.py
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # opcional: sem tiktoken usamos a estimativa por caracteres
+    tiktoken = None
+
+# ============================================================
+# Empacotamento de comentários por orçamento de tokens
+# ============================================================
+
+# alvo de tokens de entrada por requisição (prompt system + user)
+PERCEPTION_TOKEN_BUDGET = int(os.environ.get("PERCEPTION_TOKEN_BUDGET", "6000"))
+# mesma estimativa do LLMClient quando não há tokenizer
+CHARS_PER_TOKEN = 4
+
+_encoders: Dict[str, object] = {}
+_encoders_lock = threading.Lock()
+
+def _get_encoder(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    key = model or ""
+    with _encoders_lock:
+        if key not in _encoders:
+            try:
+                _encoders[key] = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _encoders[key] = tiktoken.get_encoding("o200k_base")
+        return _encoders[key]
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Tokens de `text` (tiktoken quando instalado; senão ~4 caracteres por token)."""
+    text = str(text or "")
+    enc = _get_encoder(model)
+    if enc is not None:
+        return len(enc.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+def _split_text(text: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """
+    Quebra `text` em pedaços de até `max_tokens`: por frase, depois por palavra
+    e, em último caso (palavra gigante), por caracteres.
+    """
+    if count(text) <= max_tokens:
+        return [text]
+
+    pieces: List[str] = []
+    for sentence in (s for s in _SENTENCE_RE.split(text) if s and s.strip()):
+        if count(sentence) <= max_tokens:
+            pieces.append(sentence.strip())
+            continue
+        for word in sentence.split():
+            if count(word) <= max_tokens:
+                pieces.append(word)
+            else:
+                step = max(1, max_tokens * CHARS_PER_TOKEN // 2)
+                pieces.extend(word[i:i + step] for i in range(0, len(word), step))
+
+    chunks: List[str] = []
+    cur = ""
+    for piece in pieces:
+        cand = f"{cur} {piece}" if cur else piece
+        if cur and count(cand) > max_tokens:
+            chunks.append(cur)
+            cur = piece
+        else:
+            cur = cand
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+def split_long_items(
+    items: List[dict],
+    max_item_tokens: int,
+    render: Callable[[dict], str],
+    model: Optional[str] = None,
+) -> List[dict]:
+    """
+    Comentários que sozinhos passam de `max_item_tokens` viram vários itens com o
+    mesmo comment_id (cada parte com 'part' = 1, 2, ...); os demais seguem iguais.
+    """
+    count = lambda t: count_tokens(t, model)
+    out: List[dict] = []
+    for it in items:
+        size = count(render(it))
+        if size <= max_item_tokens:
+            out.append(it)
+            continue
+        # orçamento do texto = orçamento do item - o que não é comentário (tag, pergunta)
+        fixed = count(render({**it, "comment": ""}))
+        parts = _split_text(str(it["comment"]), max(1, max_item_tokens - fixed), count)
+        for n, part in enumerate(parts, start=1):
+            out.append({**it, "comment": part, "part": n})
+    return out
+
+def pack_items(
+    groups: List[List[dict]],
+    budget: int,
+    overhead: int,
+    render: Callable[[dict], str],
+    model: Optional[str] = None,
+) -> List[List[dict]]:
+    """
+    Junta itens de vários employees (`groups`, um grupo por employee) em
+    requisições de até `budget` tokens, contando `overhead` (prompt fixo) em cada.
+    Um employee só é dividido entre requisições quando não cabe inteiro numa vazia.
+    Itens maiores que o espaço livre são partidos antes (split_long_items).
+    """
+    room = max(1, budget - overhead)
+    requests: List[List[dict]] = []
+    cur: List[dict] = []
+    used = 0
+
+    def _flush():
+        nonlocal cur, used
+        if cur:
+            requests.append(cur)
+        cur, used = [], 0
+
+    for items in groups:
+        items = split_long_items(items, room, render, model)
+        sizes = [count_tokens(render(it), model) for it in items]
+        total = sum(sizes)
+
+        if total <= room:
+            if used + total > room:
+                _flush()
+            cur.extend(items)
+            used += total
+            continue
+
+        # employee maior que uma requisição: item a item
+        for it, size in zip(items, sizes):
+            if used + size > room:
+                _flush()
+            cur.append(it)
+            used += size
+    _flush()
+    return requests
@@ -1,6 +1,8 @@
-from typing import Dict, List
+import hashlib
+from typing import Dict, List, Set, Tuple
 from sqlalchemy import text
 from db_config import engine
+from service.bulk_loader import bulk_insert
 import pandas as pd
 
 def employee_lookup_map(survey_id: int) -> Dict[str, dict]:
@@ -35,13 +37,27 @@ def insert_comments(rows: List[dict]) -> int:
     """
     if not rows:
         return 0
+    columns = ["comment", "comment_employee_id", "comment_question_id", "comment_survey_id", "comment_area_id"]
+    with engine.begin() as conn:
+        return bulk_insert(conn, "comment", columns, rows)
+
+def comment_text_hash(comment: str) -> str:
+    """md5 do texto do comentário (igual ao md5() do Postgres sobre o texto gravado)."""
+    return hashlib.md5(str(comment).encode("utf-8")).hexdigest()
+
+def fetch_comment_keys(survey_id: int) -> Set[Tuple[int, int, str]]:
+    """
+    Chaves dos comentários já gravados no survey: (employee_id, question_id, md5 do texto).
+    Usa o índice comment_survey_employee_question_idx.
+    """
     sql = text("""
-        INSERT INTO comment (comment, comment_employee_id, comment_question_id, comment_survey_id, comment_area_id)
-        VALUES (:comment, :comment_employee_id, :comment_question_id, :comment_survey_id, :comment_area_id)
+        SELECT comment_employee_id, comment_question_id, md5(comment)
+        FROM comment
+        WHERE comment_survey_id = :sid
     """)
     with engine.begin() as conn:
-        conn.execute(sql, rows)
-    return len(rows)
+        rows = conn.execute(sql, {"sid": survey_id}).fetchall()
+    return {(int(r[0]), int(r[1]), r[2]) for r in rows}
 
 #------------------------------
 # NOVO 
@@ -54,18 +70,9 @@ def insert_themes(rows: List[dict]) -> int:
     if not rows:
         return 0
 
-    sql = text("""
-        INSERT INTO theme_ranking (
-            area_id, theme_name, score, dissatisfied_score, survey_id
-        ) VALUES (
-            :area_id, :theme_name, :score, :dissatisfied_score, :survey_id
-        )
-    """)
-
+    columns = ["area_id", "theme_name", "score", "dissatisfied_score", "survey_id"]
     with engine.begin() as conn:
-        conn.execute(sql, rows)
-
-    return len(rows)
+        return bulk_insert(conn, "theme_ranking", columns, rows)
 
 #OK
 def get_comment_perceptions_search(survey_id: int, area_id: int, intention: str, theme: str):
@@ -8,6 +8,7 @@ from sqlalchemy import text
 from typing import Union
 import re
 from db_config import engine
+from service.bulk_loader import bulk_insert
 
 from .areas_repository import (
     fetch_survey_areas,
@@ -16,7 +17,7 @@ from .areas_repository import (
     update_area_review
 )
 
-from .openai_client import get_openai_client
+from .openai_client import chat_completion
 from .areas_service import _compute_area_levels
 
 from service.config import (
@@ -332,19 +333,20 @@ def generate_and_save_general_review(
 
     prompt = _build_general_review_prompt(area_reviews_text)
 
-    client = get_openai_client()
-    resp = client.chat.completions.create(
+    resp = chat_completion(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=temperature,
+        use_cache=False,
     )
     content = resp.choices[0].message.content.strip()
 
     prompt_ajust = _build_general_ajust_review_prompt(content)
-    resp = client.chat.completions.create(
+    resp = chat_completion(
         model=model,
         messages=[{"role": "user", "content": prompt_ajust}],
         temperature=temperature,
+        use_cache=False,
     )
     content_ajust = resp.choices[0].message.content.strip()   
 
@@ -477,13 +479,13 @@ def generate_general_area_review(
         if row and str(row[0] or "").strip():
             return False
 
-    client = get_openai_client()
     prompt = _build_general_review_prompt(s)
     try:
-        resp = client.chat.completions.create(
+        resp = chat_completion(
             model=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=temperature,
+            use_cache=False,
         )
         content = resp.choices[0].message.content.strip()
 
@@ -579,11 +581,11 @@ def generate_and_save_general_plan(
     # ---- Prompt e chamada ao modelo
     prompt = _build_general_plan_prompt(intents_json_str, areas_review, objetivos, restricoes)
 
-    client = get_openai_client()
-    resp = client.chat.completions.create(
+    resp = chat_completion(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=temperature,
+        use_cache=False,
     )
     content = resp.choices[0].message.content.strip()
     match = re.search(r'<div id="show_review">.*?</div>\s*$', content, flags=re.DOTALL)
@@ -747,16 +749,9 @@ def save_general_ranking(ranking):
     df_to_insert = df_to_insert.where(pd.notnull(df_to_insert), None)
     rows: List[dict] = df_to_insert.to_dict(orient="records")
 
-    sql = text("""
-        INSERT INTO theme_ranking (
-            theme_name, score, direct_score, survey_id, ranking, direct_ranking, area_id
-        ) VALUES (
-            :theme_name, :score, :direct_score, :survey_id, :ranking, :direct_ranking, :area_id
-        )
-    """)
-
+    columns = ["theme_name", "score", "direct_score", "survey_id", "ranking", "direct_ranking", "area_id"]
     with engine.begin() as conn:
-        conn.execute(sql, rows)
+        bulk_insert(conn, "theme_ranking", columns, rows)
 
 def get_critical_theme_ranking(survey_id):
 
@@ -869,7 +864,6 @@ def _build_prompt_for_theme(theme_name, recortes, actions, survey_id):
         actions_text += bloco
         problemas_text += "- "+problema+"\n"
 
-    client = get_openai_client()
     model = "gpt-4o"
     temperature = 0.0
 
@@ -917,10 +911,11 @@ No output, traga somente a lista com o nome dos problemas identificados:
 - <problema 2>:
     """
     
-    response = client.chat.completions.create(
+    response = chat_completion(
     model=model,
     messages=[{"role": "user", "content": prompt_problemas}],
     temperature=temperature,
+    use_cache=False,
 )
     problems = response.choices[0].message.content.strip()
     
@@ -1000,7 +995,6 @@ def generate_action_plans(critical_df, predefined_plans_json, survey_id):
     """
     Para cada tema crítico no DataFrame, gera um plano de ação baseado nos comentários e planos disponíveis.
     """
-    client = get_openai_client()
     model = "gpt-4o"
     temperature = 0.0
 
@@ -1024,10 +1018,11 @@ def generate_action_plans(critical_df, predefined_plans_json, survey_id):
         )
         
         try:
-            response = client.chat.completions.create(
+            response = chat_completion(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
+                use_cache=False,
             )
             content = response.choices[0].message.content.strip()
 
@@ -1080,10 +1075,11 @@ Retorne no formato markdown
     """
 
     try:
-        response = client.chat.completions.create(
+        response = chat_completion(
             model=model,
             messages=[{"role": "user", "content": overview_prompt}],
             temperature=temperature,
+            use_cache=False,
         )
         plan_review = response.choices[0].message.content.strip()
         insert_action_plan("Geral", plan_review, survey_id, type = 0)
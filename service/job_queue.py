@@ -0,0 +1,294 @@
+# service/job_queue.py
+import importlib
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+from .progress import progress_bus, JobCancelled
+from .job_repository import (
+    insert_job,
+    claim_next_job,
+    fetch_job_files,
+    update_job_progress,
+    heartbeat_jobs,
+    finish_job,
+    request_job_cancel,
+    requeue_stale_jobs,
+    get_job,
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_CANCELLED,
+    TERMINAL_STATUSES,
+)
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Fila de jobs no Postgres (tabela job + SKIP LOCKED)
+# ============================================================
+
+# processos de worker do `python worker.py`
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# threads de worker dentro do próprio processo web (0 = só worker.py)
+JOB_EMBEDDED_WORKERS = int(os.environ.get("JOB_EMBEDDED_WORKERS", "0"))
+# espera entre consultas à fila vazia (segundos)
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))
+JOB_HEARTBEAT_INTERVAL = int(os.environ.get("JOB_HEARTBEAT_INTERVAL", "30"))
+# sem heartbeat por esse tempo o job volta para a fila (worker morreu)
+JOB_STALE_AFTER = int(os.environ.get("JOB_STALE_AFTER", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# tipos que não voltam para a fila quando o worker morre: o pipeline cria a
+# pesquisa de novo a cada execução (o que já foi gravado continua em
+# /surveys/<id>/resume, com o survey_id do evento 'survey')
+JOB_NO_REQUEUE = tuple(
+    t.strip() for t in os.environ.get("JOB_NO_REQUEUE", "pipeline").split(",") if t.strip()
+)
+
+Handlers = Dict[str, Callable]
+
+# jobs rodando neste processo: {job_id -> {"error": última mensagem de erro publicada, "done": bool}}
+_running: Dict[str, dict] = {}
+_running_lock = threading.Lock()
+_process_started = False
+_process_lock = threading.Lock()
+
+def submit_job(job_type: str, payload: dict, priority: int = 0, files: Optional[Dict[str, bytes]] = None) -> str:
+    """
+    Enfileira um job e retorna o job_id. `files` ({chave -> conteúdo}) é gravado
+    no banco; o worker recria os arquivos e passa `paths` ({chave -> caminho}) ao handler.
+    """
+    job_id = str(uuid.uuid4())
+    return insert_job(job_id, job_type, payload, priority, files)
+
+def cancel_job(job_id: str) -> Optional[str]:
+    """
+    Pede o cancelamento e retorna o status (None se o job não existe). Job que
+    ainda estava na fila é encerrado aqui mesmo (nenhum worker vai publicar o 'done').
+    """
+    status = request_job_cancel(job_id)
+    if status == STATUS_CANCELLED:
+        progress_bus.put(job_id, {"event": "cancelled"})
+        progress_bus.put(job_id, {"event": "done"})
+    return status
+
+def job_status(job_id: str) -> Optional[dict]:
+    job = get_job(job_id)
+    if job is None:
+        return None
+    for k in ("created_at", "started_at", "heartbeat_at", "finished_at"):
+        if job.get(k) is not None:
+            job[k] = job[k].isoformat()
+    return job
+
+# ---------------- SSE ----------------
+def stream_job_events(job_id: str, last_event_id: Optional[int] = None):
+    """
+    Generator para SSE do job: replay a partir de `last_event_id` + eventos novos
+    (de qualquer processo, com PROGRESS_BACKEND=postgres). Job inexistente encerra
+    na hora; job já encerrado cujos eventos expiraram também.
+    """
+    if get_job(job_id) is None:
+        yield "event: done\ndata: {}\n\n"
+        return
+
+    def _finished() -> bool:
+        job = get_job(job_id)
+        return job is None or job["status"] in TERMINAL_STATUSES
+
+    yield from progress_bus.stream(job_id, last_event_id, is_finished=_finished)
+
+# ---------------- execução ----------------
+def _on_progress(job_id: str, payload: dict):
+    """
+    Observador do progress_bus nos processos de worker: grava o evento no job e
+    interrompe o job (JobCancelled) se o cancelamento foi pedido.
+    """
+    state = _running.get(job_id)
+    if state is None:
+        return
+    event = payload.get("event")
+    if event == "done":
+        state["done"] = True
+        return
+    if event == "error":
+        state["error"] = str(payload.get("message") or "erro")
+    try:
+        cancel = update_job_progress(job_id, payload)
+    except Exception as e:
+        # progresso é informativo: falha ao gravar não derruba o job
+        logger.warning("progresso do job %s não gravado: %s", job_id, e)
+        return
+    if cancel and event != "error":
+        progress_bus.backend.publish(job_id, {"event": "cancelled"})
+        raise JobCancelled(job_id)
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _running_lock:
+            ids = list(_running)
+        try:
+            heartbeat_jobs(ids)
+        except Exception as e:
+            logger.warning("heartbeat dos jobs falhou: %s", e)
+
+def _ensure_process_setup():
+    global _process_started
+    with _process_lock:
+        if _process_started:
+            return
+        progress_bus.add_observer(_on_progress)
+        threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True).start()
+        _process_started = True
+
+def _materialize_files(job_id: str) -> Optional[dict]:
+    files = fetch_job_files(job_id)
+    if not files:
+        return None
+    tmpdir = tempfile.mkdtemp(prefix=f"clima_job_{job_id[:8]}_")
+    paths = {}
+    for key, content in files.items():
+        path = os.path.join(tmpdir, f"{key}.csv")
+        with open(path, "wb") as f:
+            f.write(content)
+        paths[key] = path
+    return paths
+
+def _run_job(job: dict, handler: Callable) -> str:
+    job_id = job["job_id"]
+    state = {"error": None, "done": False}
+    with _running_lock:
+        _running[job_id] = state
+
+    paths = None
+    try:
+        kwargs = dict(job.get("payload") or {})
+        paths = _materialize_files(job_id)
+        if paths is not None:
+            kwargs["paths"] = paths
+        handler(job_id, **kwargs)
+        # os workers tratam as próprias exceções e publicam 'error'
+        status, error = (STATUS_FAILED, state["error"]) if state["error"] else (STATUS_DONE, None)
+    except JobCancelled:
+        status, error = STATUS_CANCELLED, None
+    except Exception as e:
+        traceback.print_exc()
+        status, error = STATUS_FAILED, str(e)
+    finally:
+        with _running_lock:
+            _running.pop(job_id, None)
+        if paths:
+            shutil.rmtree(os.path.dirname(next(iter(paths.values()))), ignore_errors=True)
+
+    finish_job(job_id, status, error)
+    # handler que não chegou a publicar o fim (erro antes do try dele)
+    if not state["done"]:
+        if status == STATUS_FAILED and not state["error"]:
+            progress_bus.put(job_id, {"event": "error", "message": error})
+        progress_bus.put(job_id, {"event": "done"})
+    return status
+
+def run_worker(handlers: Handlers, worker_id: Optional[str] = None, stop: Optional[threading.Event] = None):
+    """
+    Laço de um worker: pega o próximo job da fila, executa o handler do job_type
+    (`handler(job_id, **payload)`) e grava o status final. Para quando `stop` é setado
+    (o job em andamento termina antes).
+    """
+    _ensure_process_setup()
+    stop = stop or threading.Event()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    job_types = list(handlers)
+    last_sweep = 0.0
+
+    while not stop.is_set():
+        try:
+            if time.monotonic() - last_sweep >= JOB_HEARTBEAT_INTERVAL:
+                last_sweep = time.monotonic()
+                n = requeue_stale_jobs(JOB_STALE_AFTER, JOB_MAX_ATTEMPTS, JOB_NO_REQUEUE)
+                if n:
+                    logger.warning("%d job(s) sem heartbeat devolvidos à fila ou encerrados", n)
+
+            job = claim_next_job(worker_id, job_types)
+        except Exception as e:
+            logger.warning("fila de jobs indisponível (%s); tentando de novo", e)
+            stop.wait(max(JOB_POLL_INTERVAL, 5.0))
+            continue
+
+        if job is None:
+            stop.wait(JOB_POLL_INTERVAL)
+            continue
+
+        logger.info("job %s (%s) iniciado por %s", job["job_id"], job["job_type"], worker_id)
+        status = _run_job(job, handlers[job["job_type"]])
+        logger.info("job %s terminou: %s", job["job_id"], status)
+
+def start_embedded_workers(handlers: Handlers, n: Optional[int] = None) -> list:
+    """Sobe `n` workers como threads no processo atual (desenvolvimento local)."""
+    n = JOB_EMBEDDED_WORKERS if n is None else int(n)
+    threads = []
+    for i in range(n):
+        th = threading.Thread(target=run_worker, args=(handlers,), name=f"job-worker-{i}", daemon=True)
+        th.start()
+        threads.append(th)
+    return threads
+
+# ---------------- pool de processos (worker.py) ----------------
+def _load_handlers(handlers_ref: str) -> Handlers:
+    module, attr = handlers_ref.split(":", 1)
+    return getattr(importlib.import_module(module), attr)
+
+def _process_main(handlers_ref: str):
+    global JOB_EMBEDDED_WORKERS
+    # o módulo dos handlers (main) não deve subir workers embutidos dentro do worker
+    JOB_EMBEDDED_WORKERS = 0
+    # processos spawn não herdam a configuração de log do pai
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    run_worker(_load_handlers(handlers_ref), stop=stop)
+
+def run_worker_pool(handlers_ref: str, n: Optional[int] = None):
+    """
+    Sobe `n` processos de worker (spawn: cada um com seu engine/pool de conexões)
+    e os mantém vivos até SIGTERM/SIGINT. `handlers_ref` = "modulo:ATRIBUTO" com o
+    dict {job_type -> handler}.
+    """
+    n = max(1, JOB_WORKERS if n is None else int(n))
+    ctx = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+
+    def _stop(*_):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    def _spawn(i: int):
+        p = ctx.Process(target=_process_main, args=(handlers_ref,), name=f"job-worker-{i}")
+        p.start()
+        return p
+
+    procs = [_spawn(i) for i in range(n)]
+    logger.info("%d worker(s) de jobs iniciados", n)
+    while not stopping.is_set():
+        for i, p in enumerate(procs):
+            if not p.is_alive():
+                logger.warning("worker %s saiu (código %s); reiniciando", p.name, p.exitcode)
+                procs[i] = _spawn(i)
+        stopping.wait(JOB_POLL_INTERVAL * 5)
+
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+    for p in procs:
+        p.join()
@@ -0,0 +1,228 @@
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from db_config import engine
+
+# job.status
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+TERMINAL_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+def insert_job(job_id: str, job_type: str, payload: dict, priority: int = 0, files: Optional[Dict[str, bytes]] = None) -> str:
+    """
+    Enfileira um job (status 'queued') e os arquivos dele (job_file) na mesma transação.
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO job (job_id, job_type, payload, priority)
+                VALUES (:job_id, :job_type, CAST(:payload AS jsonb), :priority)
+            """),
+            {"job_id": job_id, "job_type": job_type, "payload": json.dumps(payload or {}, ensure_ascii=False), "priority": int(priority)}
+        )
+        if files:
+            conn.execute(
+                text("INSERT INTO job_file (job_id, file_key, content) VALUES (:job_id, :file_key, :content)"),
+                [{"job_id": job_id, "file_key": k, "content": v} for k, v in files.items()]
+            )
+    return job_id
+
+def claim_next_job(worker_id: str, job_types: Sequence[str]) -> Optional[dict]:
+    """
+    Pega o próximo job 'queued' (maior prioridade, mais antigo) e marca como 'running'.
+    FOR UPDATE SKIP LOCKED: workers concorrentes nunca pegam o mesmo job e não
+    esperam um pelo outro (índice parcial job_queue_idx).
+    """
+    sql = text("""
+        WITH next AS (
+            SELECT job_id
+            FROM job
+            WHERE status = 'queued'
+              AND job_type = ANY(:types)
+            ORDER BY priority DESC, created_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE job j
+           SET status       = 'running',
+               attempts     = j.attempts + 1,
+               worker_id    = :worker_id,
+               started_at   = now(),
+               heartbeat_at = now()
+          FROM next
+         WHERE j.job_id = next.job_id
+        RETURNING j.job_id, j.job_type, j.payload, j.priority, j.attempts
+    """)
+    with engine.begin() as conn:
+        row = conn.execute(sql, {"types": list(job_types), "worker_id": worker_id}).mappings().first()
+    return dict(row) if row else None
+
+def fetch_job_files(job_id: str) -> Dict[str, bytes]:
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text("SELECT file_key, content FROM job_file WHERE job_id = :job_id"),
+            {"job_id": job_id}
+        ).fetchall()
+    return {r[0]: bytes(r[1]) for r in rows}
+
+def update_job_progress(job_id: str, event: dict) -> bool:
+    """
+    Guarda o último evento de progresso do job (e renova o heartbeat).
+    Retorna True se o cancelamento foi pedido.
+    """
+    with engine.begin() as conn:
+        row = conn.execute(
+            text("""
+                UPDATE job
+                   SET progress     = CAST(:event AS jsonb),
+                       heartbeat_at = now()
+                 WHERE job_id = :job_id
+                RETURNING cancel_requested
+            """),
+            {"job_id": job_id, "event": json.dumps(event, ensure_ascii=False, default=str)}
+        ).first()
+    return bool(row and row[0])
+
+def heartbeat_jobs(job_ids: List[str]) -> int:
+    if not job_ids:
+        return 0
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("UPDATE job SET heartbeat_at = now() WHERE job_id = ANY(:ids) AND status = 'running'"),
+            {"ids": list(job_ids)}
+        )
+        return result.rowcount or 0
+
+def finish_job(job_id: str, status: str, error: Optional[str] = None) -> None:
+    """Status final do job; os arquivos de entrada não são mais necessários."""
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                UPDATE job
+                   SET status      = :status,
+                       error       = :error,
+                       finished_at = now()
+                 WHERE job_id = :job_id
+            """),
+            {"job_id": job_id, "status": status, "error": error}
+        )
+        conn.execute(text("DELETE FROM job_file WHERE job_id = :job_id"), {"job_id": job_id})
+
+def request_job_cancel(job_id: str) -> Optional[str]:
+    """
+    Pede o cancelamento. Job ainda na fila já vira 'cancelled'; job rodando é
+    interrompido pelo worker no próximo evento de progresso.
+    Retorna o status atual (None se o job não existe).
+    """
+    with engine.begin() as conn:
+        row = conn.execute(
+            text("""
+                UPDATE job
+                   SET cancel_requested = true,
+                       status      = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                       finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END
+                 WHERE job_id = :job_id
+                RETURNING status
+            """),
+            {"job_id": job_id}
+        ).first()
+    return row[0] if row else None
+
+def requeue_stale_jobs(stale_seconds: int, max_attempts: int, no_requeue_types: Sequence[str] = ()) -> int:
+    """
+    Jobs 'running' sem heartbeat há `stale_seconds` (worker morreu/reiniciou)
+    voltam para a fila; depois de `max_attempts` tentativas (ou com cancelamento
+    pedido) são encerrados. Tipos em `no_requeue_types` (não idempotentes:
+    refazer do início duplicaria dados) falham direto.
+    """
+    sql = text("""
+        UPDATE job
+           SET status      = CASE
+                                 WHEN cancel_requested THEN 'cancelled'
+                                 WHEN attempts >= :max_attempts OR job_type = ANY(:no_requeue) THEN 'failed'
+                                 ELSE 'queued'
+                             END,
+               error       = CASE
+                                 WHEN cancel_requested THEN error
+                                 WHEN job_type = ANY(:no_requeue)
+                                 THEN 'worker interrompido (job não é reexecutado; use a retomada da pesquisa)'
+                                 WHEN attempts >= :max_attempts
+                                 THEN 'worker interrompido (tentativas esgotadas)'
+                                 ELSE error
+                             END,
+               finished_at = CASE
+                                 WHEN cancel_requested OR attempts >= :max_attempts OR job_type = ANY(:no_requeue)
+                                 THEN now()
+                                 ELSE NULL
+                             END,
+               worker_id   = NULL
+         WHERE status = 'running'
+           AND heartbeat_at < now() - make_interval(secs => :stale)
+    """)
+    params = {"stale": int(stale_seconds), "max_attempts": int(max_attempts), "no_requeue": list(no_requeue_types)}
+    with engine.begin() as conn:
+        result = conn.execute(sql, params)
+        return result.rowcount or 0
+
+def get_job(job_id: str) -> Optional[dict]:
+    with engine.begin() as conn:
+        row = conn.execute(
+            text("""
+                SELECT job_id, job_type, priority, status, error, attempts, cancel_requested,
+                       worker_id, created_at, started_at, heartbeat_at, finished_at,
+                       progress
+                FROM job
+                WHERE job_id = :job_id
+            """),
+            {"job_id": job_id}
+        ).mappings().first()
+    return dict(row) if row else None
+
+# ---------------- job_event (progresso com replay) ----------------
+def insert_job_event(job_id: str, payload: dict, channel: str) -> int:
+    """
+    Grava um evento de progresso e avisa (NOTIFY `channel`, payload = job_id)
+    na mesma transação. Retorna o event_id (crescente).
+    """
+    sql = text("""
+        WITH ins AS (
+            INSERT INTO job_event (job_id, payload)
+            VALUES (:job_id, CAST(:payload AS jsonb))
+            RETURNING event_id
+        )
+        SELECT event_id, pg_notify(:channel, :job_id) FROM ins
+    """)
+    with engine.begin() as conn:
+        row = conn.execute(sql, {
+            "job_id": job_id,
+            "payload": json.dumps(payload, ensure_ascii=False, default=str),
+            "channel": channel,
+        }).first()
+    return int(row[0])
+
+def fetch_job_events(job_id: str, after_id: int = 0) -> List[Tuple[int, dict]]:
+    """Eventos do job com event_id > after_id, em ordem (índice job_event_job_idx)."""
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT event_id, payload
+                FROM job_event
+                WHERE job_id = :job_id
+                  AND event_id > :after_id
+                ORDER BY event_id
+            """),
+            {"job_id": job_id, "after_id": int(after_id)}
+        ).fetchall()
+    return [(int(r[0]), r[1]) for r in rows]
+
+def purge_job_events(ttl_seconds: int) -> int:
+    """Remove eventos mais velhos que o TTL."""
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("DELETE FROM job_event WHERE created_at < now() - make_interval(secs => :ttl)"),
+            {"ttl": int(ttl_seconds)}
+        )
+        return result.rowcount or 0
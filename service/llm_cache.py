@@ -0,0 +1,269 @@
+# service/llm_cache.py
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Cache persistente das respostas do LLM (SQLite local)
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL_DAYS = float(os.environ.get("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", "512"))
+# Varredura completa de TTL/LRU a cada N gravações (ou antes, se os totais passarem do limite)
+LLM_CACHE_EVICT_EVERY = int(os.environ.get("LLM_CACHE_EVICT_EVERY", "200"))
+# Contadores acumulam em memória e são gravados no arquivo a cada N segundos
+LLM_CACHE_COUNTER_FLUSH_SECONDS = float(os.environ.get("LLM_CACHE_COUNTER_FLUSH_SECONDS", "30"))
+
+_COUNTERS = ("hits", "misses", "writes", "evictions", "tokens_saved")
+
+def make_cache_key(kwargs: dict) -> str:
+    """
+    Hash do conteúdo da chamada: modelo, temperatura, mensagens (system + user)
+    e qualquer outro parâmetro que altere a resposta (ex.: response_format).
+    """
+    payload = {
+        "model": kwargs.get("model"),
+        "temperature": kwargs.get("temperature"),
+        "messages": [
+            {"role": m.get("role"), "content": m.get("content")} if isinstance(m, dict) else m
+            for m in (kwargs.get("messages") or [])
+        ],
+    }
+    extra = {k: v for k, v in kwargs.items() if k not in ("model", "temperature", "messages")}
+    if extra:
+        payload["extra"] = extra
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """
+    Cache endereçado por conteúdo com expiração por TTL e remoção LRU
+    quando passa do limite de entradas ou de tamanho.
+
+    Totais de entradas/bytes são mantidos em memória (recontados a cada
+    varredura); os contadores (hits, misses...) acumulam em memória e vão
+    para a tabela llm_cache_counter de tempos em tempos. Processos que usam o
+    mesmo arquivo (mesmo LLM_CACHE_PATH, mesmo disco) somam juntos; em
+    máquinas separadas (web e worker do Procfile em dynos diferentes) cada
+    um tem o seu arquivo e as suas estatísticas.
+    """
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_seconds: float = LLM_CACHE_TTL_DAYS * 86400,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_bytes: int = int(LLM_CACHE_MAX_MB * 1024 * 1024),
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._last_flush = time.time()
+        self._writes_since_evict = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key          TEXT PRIMARY KEY,
+                model        TEXT,
+                response     TEXT NOT NULL,
+                size         INTEGER NOT NULL,
+                tokens       INTEGER NOT NULL DEFAULT 0,
+                created_at   REAL NOT NULL,
+                last_access  REAL NOT NULL,
+                hits         INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access_idx ON llm_cache (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at_idx ON llm_cache (created_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache_counter (
+                name   TEXT PRIMARY KEY,
+                value  INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._entries, self._bytes = self._totals()
+        atexit.register(self.flush_counters)
+
+    def _totals(self):
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        return int(count), int(total)
+
+    def _count(self, key: str, value: int = 1):
+        self._pending[key] = self._pending.get(key, 0) + int(value)
+        if time.time() - self._last_flush >= LLM_CACHE_COUNTER_FLUSH_SECONDS:
+            try:
+                self._flush_counters()
+            except sqlite3.Error:
+                pass  # fica para a próxima gravação
+
+    def _flush_counters(self):
+        self._last_flush = time.time()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                """
+                INSERT INTO llm_cache_counter (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+                """,
+                list(pending.items()),
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            for k, v in pending.items():
+                self._pending[k] = self._pending.get(k, 0) + v
+            raise
+
+    def flush_counters(self):
+        """Grava os contadores pendentes (chamado também na saída do processo)."""
+        with self._lock:
+            try:
+                self._flush_counters()
+            except sqlite3.Error:
+                pass
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, tokens, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and row[2] < now - self.ttl_seconds):
+                self._count("misses")
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self._count("hits")
+            self._count("tokens_saved", int(row[1] or 0))
+            return row[0]
+
+    def set(self, key: str, model: Optional[str], response: str, tokens: int = 0):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                """
+                INSERT INTO llm_cache (key, model, response, size, tokens, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    response = excluded.response,
+                    size = excluded.size,
+                    tokens = excluded.tokens,
+                    created_at = excluded.created_at,
+                    last_access = excluded.last_access
+                """,
+                (key, model, response, size, int(tokens or 0), now, now),
+            )
+            if old is None:
+                self._entries += 1
+                self._bytes += size
+            else:
+                self._bytes += size - int(old[0])
+            self._count("writes")
+            self._writes_since_evict += 1
+            if (
+                self._writes_since_evict >= LLM_CACHE_EVICT_EVERY
+                or (self.max_entries and self._entries > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """TTL primeiro; depois LRU até respeitar max_entries e max_bytes."""
+        self._writes_since_evict = 0
+        evicted = 0
+        if self.ttl_seconds:
+            cur = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            evicted += max(cur.rowcount, 0)
+
+        # recontagem: outros processos podem gravar no mesmo arquivo
+        count, total = self._totals()
+        if self.max_entries and count > self.max_entries:
+            cur = self._conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?
+                )
+                """,
+                (count - self.max_entries,),
+            )
+            evicted += max(cur.rowcount, 0)
+            count, total = self._totals()
+
+        if self.max_bytes and total > self.max_bytes:
+            # percorre o índice de last_access só até cobrir o excesso
+            excess = total - self.max_bytes
+            victims = []
+            for k, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC"):
+                if excess <= 0:
+                    break
+                victims.append((k,))
+                excess -= size
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+            evicted += len(victims)
+            count, total = self._totals()
+
+        self._entries, self._bytes = count, total
+        if evicted:
+            self._count("evictions", evicted)
+
+    def delete(self, key: str) -> bool:
+        """Remove uma entrada (resposta rejeitada pelo chamador)."""
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._entries -= 1
+            self._bytes -= int(row[0])
+            return True
+
+    def clear(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM llm_cache")
+            self._entries, self._bytes = 0, 0
+            return max(cur.rowcount, 0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._flush_counters()
+            out = dict.fromkeys(_COUNTERS, 0)
+            out.update(self._conn.execute("SELECT name, value FROM llm_cache_counter").fetchall())
+            count, total = self._totals()
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+        out["entries"] = int(count)
+        out["size_bytes"] = int(total)
+        return out
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Instância única por processo; None quando o cache está desligado."""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMCache()
+    return _llm_cache
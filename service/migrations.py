@@ -0,0 +1,169 @@
+# service/migrations.py
+import hashlib
+import logging
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from db_config import engine
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Migrações versionadas (arquivos SQL em migrations/)
+# ============================================================
+# NNNN_descricao.sql, aplicados em ordem e registrados em schema_migration.
+# Arquivo que começa com "-- migrate: no-transaction" roda comando a comando
+# fora de transação (CREATE INDEX CONCURRENTLY); os demais rodam inteiros numa
+# transação só. classificacao_clima.sql já traz o resultado de todas elas.
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+NO_TRANSACTION_MARK = "-- migrate: no-transaction"
+# dois runners ao mesmo tempo (deploy com várias réplicas) esperam um pelo outro
+_ADVISORY_LOCK_ID = 72_110_024
+
+_FILE_RE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+_CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE
+)
+
+class Migration:
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.sql = f.read()
+        self.checksum = hashlib.md5(self.sql.encode("utf-8")).hexdigest()
+        self.transactional = not self.sql.lstrip().startswith(NO_TRANSACTION_MARK)
+
+    def statements(self) -> List[str]:
+        """Comandos do arquivo (só para no-transaction: sem blocos $$ ... $$)."""
+        body = "\n".join(l for l in self.sql.splitlines() if not l.strip().startswith("--"))
+        return [s.strip() for s in body.split(";") if s.strip()]
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for fname in sorted(os.listdir(directory)):
+        m = _FILE_RE.match(fname)
+        if m:
+            migrations.append(Migration(int(m.group(1)), m.group(2), os.path.join(directory, fname)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"versões de migração repetidas em {directory}")
+    return migrations
+
+def _ensure_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS public.schema_migration (
+            version integer PRIMARY KEY,
+            name text NOT NULL,
+            checksum character varying(32) NOT NULL,
+            applied_at timestamp without time zone DEFAULT now() NOT NULL
+        )
+    """))
+
+def applied_migrations() -> dict:
+    """{version -> {name, checksum, applied_at}} das migrações já aplicadas."""
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        rows = conn.execute(text("SELECT version, name, checksum, applied_at FROM schema_migration")).mappings().all()
+    return {r["version"]: dict(r) for r in rows}
+
+def migration_status(directory: str = MIGRATIONS_DIR) -> List[dict]:
+    applied = applied_migrations()
+    out = []
+    for m in load_migrations(directory):
+        row = applied.get(m.version)
+        out.append({
+            "version": m.version,
+            "name": m.name,
+            "applied_at": row["applied_at"] if row else None,
+            "checksum_ok": None if row is None else row["checksum"] == m.checksum,
+        })
+    return out
+
+def _drop_invalid_indexes(conn, migration: Migration):
+    # CREATE INDEX CONCURRENTLY que falhou deixa um índice INVALID com o nome;
+    # o IF NOT EXISTS da nova tentativa pularia esse índice
+    names = _CONCURRENT_INDEX_RE.findall(migration.sql)
+    if not names:
+        return
+    invalid = conn.execute(
+        text("""
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE NOT i.indisvalid AND c.relname = ANY(:names)
+        """),
+        {"names": names}
+    ).scalars().all()
+    for name in invalid:
+        logger.warning("removendo índice inválido %s (tentativa anterior falhou)", name)
+        conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS public."{name}"')
+
+def _execute_raw(conn, sql: str) -> int:
+    # cursor do driver sem parâmetros: o SQL vai como está (format('%I') etc.)
+    cur = conn.connection.dbapi_connection.cursor()
+    try:
+        cur.execute(sql)
+        return cur.rowcount
+    finally:
+        cur.close()
+
+def _summary(stmt: str) -> str:
+    return " ".join(stmt.split())[:80]
+
+def _apply(migration: Migration):
+    record = text("INSERT INTO schema_migration (version, name, checksum) VALUES (:v, :n, :c)")
+    params = {"v": migration.version, "n": migration.name, "c": migration.checksum}
+    if migration.transactional:
+        with engine.begin() as conn:
+            # DDL em tabela grande passa do statement_timeout da aplicação
+            conn.exec_driver_sql("SET LOCAL statement_timeout = 0")
+            _execute_raw(conn, migration.sql)
+            conn.execute(record, params)
+        return
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.exec_driver_sql("SET statement_timeout = 0")
+        try:
+            _drop_invalid_indexes(conn, migration)
+            for stmt in migration.statements():
+                n = _execute_raw(conn, stmt)
+                # UPDATE/DELETE de correção de dados (órfãs, duplicadas): registra quantas linhas
+                if n and n > 0:
+                    logger.info("%04d_%s: %d linha(s) em: %s", migration.version, migration.name, n, _summary(stmt))
+            conn.execute(record, params)
+        finally:
+            conn.exec_driver_sql("RESET statement_timeout")
+
+def migrate(target: Optional[int] = None, directory: str = MIGRATIONS_DIR) -> List[int]:
+    """
+    Aplica as migrações pendentes (até `target`, se informado) e retorna as
+    versões aplicadas. Migração já aplicada com arquivo alterado só gera aviso.
+    """
+    migrations = load_migrations(directory)
+    done = []
+    with engine.connect() as lock_conn:
+        lock_conn = lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        lock_conn.exec_driver_sql("SET statement_timeout = 0")
+        lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _ADVISORY_LOCK_ID})
+        try:
+            applied = applied_migrations()
+            for m in migrations:
+                if target is not None and m.version > target:
+                    break
+                row = applied.get(m.version)
+                if row is not None:
+                    if row["checksum"] != m.checksum:
+                        logger.warning("migração %04d_%s mudou depois de aplicada", m.version, m.name)
+                    continue
+                logger.info("aplicando migração %04d_%s", m.version, m.name)
+                _apply(m)
+                done.append(m.version)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _ADVISORY_LOCK_ID})
+            lock_conn.exec_driver_sql("RESET statement_timeout")
+    return done
@@ -1,5 +1,20 @@
 import os
-from openai import OpenAI
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from openai import (
+    OpenAI,
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    RateLimitError,
+)
+from openai.types.chat import ChatCompletion
+
+from .llm_cache import get_llm_cache, make_cache_key
 
 def get_openai_client() -> OpenAI:
     #api_key = os.getenv("OPENAI_API_KEY")
@@ -7,3 +22,243 @@ def get_openai_client() -> OpenAI:
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY não definido no ambiente.")
     return OpenAI(api_key=api_key)
+
+# ============================================================
+# Cliente compartilhado: rate limit (RPM/TPM) + retry com backoff
+# ============================================================
+
+# Limites iniciais; são ajustados pelos headers x-ratelimit-* das respostas
+LLM_RPM = int(os.environ.get("LLM_RPM", "500"))
+LLM_TPM = int(os.environ.get("LLM_TPM", "30000"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "6"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "60.0"))
+# estimativa de tokens de saída quando a chamada não informa max_tokens
+LLM_COMPLETION_ESTIMATE = int(os.environ.get("LLM_COMPLETION_ESTIMATE", "800"))
+
+_DURATION_RE = re.compile(r"(?P<value>\d+(?:\.\d+)?)(?P<unit>ms|h|m|s)")
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Converte durações dos headers da OpenAI ('1s', '6m0s', '20ms', '0.5') em segundos.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    total = 0.0
+    found = False
+    for m in _DURATION_RE.finditer(value):
+        total += float(m.group("value")) * units[m.group("unit")]
+        found = True
+    return total if found else None
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    Balde de tokens com reposição contínua (capacidade = limite por minuto).
+    `reserve` debita na hora e devolve quanto tempo esperar; o saldo pode ficar
+    negativo, o que mantém a ordem de chegada entre threads.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        rate = self.capacity / 60.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= min(float(amount), self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / (self.capacity / 60.0)
+
+    def adjust(self, delta: float):
+        """Corrige o débito de uma reserva (ex.: tokens reais x estimados)."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens - float(delta))
+
+    def sync(self, limit: Optional[int], remaining: Optional[int], reset_seconds: Optional[float]):
+        """Alinha o balde com o que o provedor informou nos headers."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit and limit > 0:
+                self.capacity = float(limit)
+            if remaining is not None:
+                # o provedor é a fonte da verdade: nunca acreditamos ter mais saldo que ele
+                self.tokens = min(self.tokens, float(remaining))
+                if remaining <= 0 and reset_seconds:
+                    self.tokens = min(self.tokens, -reset_seconds * self.capacity / 60.0)
+
+class LLMClient:
+    """
+    Wrapper único para chat.completions.create usado por todos os serviços.
+      - limita requisições/min e tokens/min (token bucket)
+      - atualiza os limites a partir dos headers x-ratelimit-*
+      - refaz a chamada em 429/5xx/erros de conexão com backoff exponencial + jitter
+      - responde do cache (service/llm_cache.py) quando o mesmo prompt já foi pago
+    """
+    def __init__(
+        self,
+        client: Optional[OpenAI] = None,
+        rpm: int = LLM_RPM,
+        tpm: int = LLM_TPM,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        # retries ficam por nossa conta (o SDK faria retry sem respeitar o limiter)
+        self._client = (client or get_openai_client()).with_options(max_retries=0)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "throttled_sec": 0.0}
+
+    @staticmethod
+    def _estimate_tokens(kwargs: dict) -> int:
+        chars = 0
+        for msg in kwargs.get("messages") or []:
+            content = msg.get("content") if isinstance(msg, dict) else None
+            chars += len(str(content or ""))
+        completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or LLM_COMPLETION_ESTIMATE
+        return chars // 4 + int(completion)
+
+    def _count(self, key: str, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _acquire(self, est_tokens: int):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(est_tokens))
+        if wait > 0:
+            self._count("throttled_sec", wait)
+            time.sleep(wait)
+
+    def _update_limits(self, headers):
+        if headers is None:
+            return
+        self.requests.sync(
+            _parse_int(headers.get("x-ratelimit-limit-requests")),
+            _parse_int(headers.get("x-ratelimit-remaining-requests")),
+            _parse_duration(headers.get("x-ratelimit-reset-requests")),
+        )
+        self.tokens.sync(
+            _parse_int(headers.get("x-ratelimit-limit-tokens")),
+            _parse_int(headers.get("x-ratelimit-remaining-tokens")),
+            _parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    def _backoff(self, attempt: int, headers=None) -> float:
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+        if headers is not None:
+            retry_after = _parse_duration(headers.get("retry-after-ms"))
+            if retry_after is not None:
+                retry_after = retry_after / 1000.0
+            else:
+                retry_after = _parse_duration(headers.get("retry-after"))
+            if retry_after:
+                delay = max(delay, min(retry_after, LLM_BACKOFF_MAX))
+        return delay
+
+    def chat_completion(self, use_cache: bool = True, **kwargs):
+        """
+        Mesmos argumentos de client.chat.completions.create; devolve o ChatCompletion.
+        Com use_cache=False não lê o cache (nova tentativa depois de uma resposta
+        rejeitada); a resposta nova substitui a que estava guardada. Textos
+        livres (resumos, planos de ação) usam use_cache=False: regerar tem que
+        trazer um texto novo.
+        """
+        cache = get_llm_cache()
+        cache_key = make_cache_key(kwargs) if cache is not None else None
+        if cache is not None and use_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return ChatCompletion.model_validate_json(cached)
+
+        est_tokens = self._estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            self._acquire(est_tokens)
+            self._count("requests")
+            try:
+                raw = self._client.chat.completions.with_raw_response.create(**kwargs)
+            except (RateLimitError, APIStatusError, APIConnectionError, APITimeoutError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = (
+                    isinstance(e, (RateLimitError, APIConnectionError, APITimeoutError))
+                    or (status is not None and status >= 500)
+                )
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                # chamada recusada não consome a cota de tokens estimada
+                self.tokens.adjust(-est_tokens)
+                response = getattr(e, "response", None)
+                headers = response.headers if response is not None else None
+                self._update_limits(headers)
+                self._count("retries")
+                time.sleep(self._backoff(attempt, headers))
+                attempt += 1
+                continue
+
+            self._update_limits(raw.headers)
+            resp = raw.parse()
+            usage = getattr(resp, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None) is not None:
+                self.tokens.adjust(int(usage.total_tokens) - est_tokens)
+            if cache is not None:
+                cache.set(
+                    cache_key,
+                    kwargs.get("model"),
+                    resp.model_dump_json(),
+                    tokens=getattr(usage, "total_tokens", 0) if usage is not None else 0,
+                )
+            return resp
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["throttled_sec"] = round(out["throttled_sec"], 3)
+        cache = get_llm_cache()
+        out["cache"] = cache.stats() if cache is not None else None
+        return out
+
+_llm_client: Optional[LLMClient] = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+    """Instância única por processo (o limiter precisa ser compartilhado)."""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient()
+    return _llm_client
+
+def chat_completion(use_cache: bool = True, **kwargs):
+    """Atalho para get_llm_client().chat_completion(...)."""
+    return get_llm_client().chat_completion(use_cache=use_cache, **kwargs)
+
+def discard_cached_completion(**kwargs) -> bool:
+    """
+    Tira do cache a resposta de uma chamada (mesmos argumentos do chat_completion)
+    que o chamador rejeitou, para a próxima execução perguntar de novo.
+    """
+    cache = get_llm_cache()
+    return cache.delete(make_cache_key(kwargs)) if cache is not None else False
@@ -0,0 +1,180 @@
+# service/org_tree.py
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# Organograma indexado (intervalos de entrada/saída - Euler tour)
+# ============================================================
+
+def _to_int_or_none(x) -> Optional[int]:
+    try:
+        if x is None or pd.isna(x) or str(x).strip() == "":
+            return None
+        return int(x)
+    except Exception:
+        return None
+
+class OrgTree:
+    """
+    Árvore de áreas de um survey, montada uma vez e consultada em O(1).
+
+    Cada área recebe um intervalo [tin, tout] na ordem de visita (pré-ordem):
+    Y está na subárvore de X  <=>  tin[X] <= tin[Y] <= tout[X].
+    Assim "todas as linhas da subárvore" vira um filtro de intervalo vetorizado
+    (ou um range no SQL, via area_tree_in/area_tree_out).
+
+    Saneamento (determinístico):
+      - parent nulo, inexistente ou igual à própria área -> raiz
+      - a área 0 (Geral) é sempre raiz
+      - ciclos (A->B->A) são quebrados na área de menor id, que vira raiz
+      - área repetida: vale a primeira ocorrência
+    Filhos e raízes são visitados em ordem crescente de id.
+    """
+
+    def __init__(self, parents: Dict[int, Optional[int]]):
+        self.area_ids: List[int] = list(parents)
+        nodes = set(self.area_ids)
+
+        parent: Dict[int, Optional[int]] = {}
+        for aid, pid in parents.items():
+            parent[aid] = pid if (pid is not None and pid != aid and pid in nodes and aid != 0) else None
+
+        # quebra ciclos: cada caminhada marca os nós com o id de onde começou
+        walk: Dict[int, int] = {}
+        for start in sorted(nodes):
+            path = []
+            cur = start
+            while cur is not None and cur not in walk:
+                walk[cur] = start
+                path.append(cur)
+                cur = parent[cur]
+            if cur is not None and walk[cur] == start:
+                cycle = path[path.index(cur):]
+                parent[min(cycle)] = None
+
+        children: Dict[int, List[int]] = {}
+        for aid in sorted(nodes):
+            pid = parent[aid]
+            if pid is not None:
+                children.setdefault(pid, []).append(aid)
+
+        self._parent = parent
+        self._children = children
+        self.roots: List[int] = [aid for aid in sorted(nodes) if parent[aid] is None]
+
+        # pré-ordem iterativa (sem limite de recursão)
+        order: List[int] = []
+        tin: Dict[int, int] = {}
+        tout: Dict[int, int] = {}
+        depth: Dict[int, int] = {}
+        for root in self.roots:
+            depth[root] = 0
+            stack = [(root, False)]
+            while stack:
+                cur, done = stack.pop()
+                if done:
+                    tout[cur] = len(order) - 1
+                    continue
+                tin[cur] = len(order)
+                order.append(cur)
+                stack.append((cur, True))
+                for ch in reversed(children.get(cur, [])):
+                    depth[ch] = depth[cur] + 1
+                    stack.append((ch, False))
+
+        self._order = order
+        self._tin = tin
+        self._tout = tout
+        self._depth = depth
+
+    # ---------------- construção ----------------
+    @classmethod
+    def from_frame(cls, df_areas: pd.DataFrame) -> "OrgTree":
+        """Espera colunas area_id e area_parent (como em fetch_survey_areas)."""
+        parents: Dict[int, Optional[int]] = {}
+        if df_areas is not None and not df_areas.empty:
+            for aid, pid in zip(df_areas["area_id"].tolist(), df_areas["area_parent"].tolist()):
+                aid = _to_int_or_none(aid)
+                if aid is None or aid in parents:
+                    continue
+                parents[aid] = _to_int_or_none(pid)
+        return cls(parents)
+
+    @classmethod
+    def from_survey(cls, survey_id: int) -> "OrgTree":
+        from .areas_repository import fetch_survey_areas
+        return cls.from_frame(fetch_survey_areas(survey_id))
+
+    # ---------------- consultas ----------------
+    def __contains__(self, area_id) -> bool:
+        return area_id in self._tin
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def parent(self, area_id: int) -> Optional[int]:
+        return self._parent.get(area_id)
+
+    def children(self, area_id: int) -> List[int]:
+        return list(self._children.get(area_id, []))
+
+    def level(self, area_id: int) -> int:
+        return self._depth[area_id]
+
+    def levels(self) -> Dict[int, int]:
+        return {aid: self._depth[aid] for aid in self.area_ids}
+
+    def interval(self, area_id: int) -> tuple:
+        return self._tin[area_id], self._tout[area_id]
+
+    def is_descendant(self, area_id: int, of: int, include_self: bool = True) -> bool:
+        """True se `area_id` está na subárvore de `of`."""
+        if area_id not in self._tin or of not in self._tin:
+            return False
+        if area_id == of:
+            return include_self
+        return self._tin[of] <= self._tin[area_id] <= self._tout[of]
+
+    def descendants(self, area_id: int, include_self: bool = True) -> List[int]:
+        """Subárvore em pré-ordem (fatia contígua da ordem de visita)."""
+        if area_id not in self._tin:
+            return [area_id] if include_self else []
+        lo, hi = self._tin[area_id], self._tout[area_id]
+        return self._order[lo if include_self else lo + 1: hi + 1]
+
+    def ancestors(self, area_id: int, include_self: bool = False) -> List[int]:
+        out = [area_id] if include_self else []
+        cur = self._parent.get(area_id)
+        while cur is not None:
+            out.append(cur)
+            cur = self._parent.get(cur)
+        return out
+
+    def post_order(self) -> List[int]:
+        """Filhos sempre antes do pai (pré-ordem invertida)."""
+        return self._order[::-1]
+
+    def tin_of(self, area_ids: Iterable) -> np.ndarray:
+        """Posição de entrada de cada valor (NaN para áreas fora da árvore)."""
+        s = area_ids if isinstance(area_ids, pd.Series) else pd.Series(list(area_ids), dtype=object)
+        return pd.to_numeric(s, errors="coerce").map(self._tin).to_numpy(dtype=float)
+
+    def subtree_mask(self, area_ids: Iterable, area_id: int) -> np.ndarray:
+        """Máscara vetorizada: quais valores de `area_ids` estão na subárvore de `area_id`."""
+        t = self.tin_of(area_ids)
+        if area_id not in self._tin:
+            return np.zeros(len(t), dtype=bool)
+        lo, hi = self._tin[area_id], self._tout[area_id]
+        return (t >= lo) & (t <= hi)
+
+    def intervals(self) -> pd.DataFrame:
+        """area_id, area_tree_in, area_tree_out, area_level (para persistir em `area`)."""
+        return pd.DataFrame({
+            "area_id": self.area_ids,
+            "area_tree_in": [self._tin[a] for a in self.area_ids],
+            "area_tree_out": [self._tout[a] for a in self.area_ids],
+            "area_level": [self._depth[a] for a in self.area_ids],
+        })
@@ -0,0 +1,240 @@
+# service/partitioning.py
+import logging
+import time
+from typing import List, Optional
+
+from sqlalchemy import text
+from db_config import engine
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Particionamento opcional de comment / perception por pesquisa
+# ============================================================
+# Layout padrão (classificacao_clima.sql): uma tabela só para todas as pesquisas.
+# Com `python migrate.py partition` as duas tabelas viram LIST por survey id:
+# uma partição por pesquisa (comment_s<id>, perception_s<id>) + uma DEFAULT
+# para o que chegar antes da partição existir. Apagar/reprocessar uma pesquisa
+# vira DROP/TRUNCATE da partição (sem DELETE em massa nem bloat) e as consultas
+# com filtro de pesquisa só leem a partição dela.
+# O código detecta o layout em tempo de execução; sem particionamento tudo
+# segue com DELETE normal.
+
+# tabela -> coluna da chave de partição (ordem: comment antes de perception, que a referencia)
+PARTITIONED_TABLES = {
+    "comment": "comment_survey_id",
+    "perception": "perception_survey_id",
+}
+# sem particionamento, reconsulta o catálogo a cada N segundos (a conversão roda em outro processo)
+_LAYOUT_RECHECK = 60.0
+_layout = {"partitioned": False, "checked_at": 0.0}
+
+def partition_name(table: str, survey_id: int) -> str:
+    return f"{table}_s{int(survey_id)}"
+
+def survey_partitioning_enabled(conn=None) -> bool:
+    """True se comment/perception estão particionadas (resultado em cache no processo)."""
+    if _layout["partitioned"]:
+        return True
+    now = time.monotonic()
+    if now - _layout["checked_at"] < _LAYOUT_RECHECK:
+        return False
+    sql = text("""
+        SELECT count(*)
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname IN ('comment', 'perception')
+    """)
+    if conn is None:
+        with engine.begin() as c:
+            n = c.execute(sql).scalar()
+    else:
+        n = conn.execute(sql).scalar()
+    _layout["partitioned"] = n == len(PARTITIONED_TABLES)
+    _layout["checked_at"] = now
+    return _layout["partitioned"]
+
+def _exists(conn, relname: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:r) IS NOT NULL"), {"r": f"public.{relname}"}).scalar()
+
+# ---------------- partições por pesquisa ----------------
+def ensure_survey_partitions(conn, survey_id: int) -> bool:
+    """
+    Cria as partições da pesquisa (na transação de `conn`). Linhas da pesquisa
+    que já caíram na DEFAULT são movidas para a partição nova. False se o
+    layout não é particionado.
+    """
+    if not survey_partitioning_enabled(conn):
+        return False
+    sid = int(survey_id)
+    missing = [t for t in PARTITIONED_TABLES if not _exists(conn, partition_name(t, sid))]
+    if not missing:
+        return True
+
+    # DEFAULT com linhas dessa pesquisa impede o CREATE ... PARTITION OF
+    in_default = {
+        t: conn.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM public.{t}_default WHERE {PARTITIONED_TABLES[t]} = :sid)"),
+            {"sid": sid}
+        ).scalar()
+        for t in missing
+    }
+    if not any(in_default.values()):
+        for t in missing:
+            conn.exec_driver_sql(
+                f"CREATE TABLE public.{partition_name(t, sid)} PARTITION OF public.{t} FOR VALUES IN ({sid})"
+            )
+        return True
+
+    # move: percepções saem da DEFAULT antes dos comentários que elas referenciam
+    # e só voltam (ATTACH, com checagem da FK) depois deles
+    for t in reversed(missing):
+        part, col = partition_name(t, sid), PARTITIONED_TABLES[t]
+        conn.exec_driver_sql(f"CREATE TABLE public.{part} (LIKE public.{t} INCLUDING DEFAULTS)")
+        conn.exec_driver_sql(f"INSERT INTO public.{part} SELECT * FROM public.{t}_default WHERE {col} = {sid}")
+        conn.exec_driver_sql(f"DELETE FROM public.{t}_default WHERE {col} = {sid}")
+    for t in missing:
+        conn.exec_driver_sql(
+            f"ALTER TABLE public.{t} ATTACH PARTITION public.{partition_name(t, sid)} FOR VALUES IN ({sid})"
+        )
+    logger.info("pesquisa %s: linhas movidas da partição DEFAULT", sid)
+    return True
+
+def truncate_survey_partition(conn, table: str, survey_id: int) -> Optional[int]:
+    """
+    Esvazia a partição da pesquisa (TRUNCATE) e retorna quantas linhas tinha;
+    linhas da pesquisa que ainda estejam na DEFAULT também saem (DELETE).
+    None se não há partição (layout normal ou dados só na DEFAULT).
+    """
+    if not survey_partitioning_enabled(conn):
+        return None
+    part = partition_name(table, survey_id)
+    if not _exists(conn, part):
+        return None
+    n = conn.execute(text(f"SELECT count(*) FROM public.{part}")).scalar()
+    conn.exec_driver_sql(f"TRUNCATE TABLE public.{part}")
+    res = conn.execute(
+        text(f"DELETE FROM public.{table}_default WHERE {PARTITIONED_TABLES[table]} = :sid"),
+        {"sid": int(survey_id)}
+    )
+    return int(n or 0) + (res.rowcount or 0)
+
+def drop_survey_partitions(conn, survey_id: int) -> List[str]:
+    """
+    DETACH + DROP das partições da pesquisa (perception antes de comment).
+    Linhas da pesquisa que estejam na DEFAULT continuam lá (o DELETE da pesquisa
+    as remove via FK). Retorna as tabelas removidas.
+    """
+    if not survey_partitioning_enabled(conn):
+        return []
+    dropped = []
+    for t in reversed(list(PARTITIONED_TABLES)):
+        part = partition_name(t, survey_id)
+        if _exists(conn, part):
+            conn.exec_driver_sql(f"ALTER TABLE public.{t} DETACH PARTITION public.{part}")
+            conn.exec_driver_sql(f"DROP TABLE public.{part}")
+            dropped.append(part)
+    return dropped
+
+# ---------------- conversão (python migrate.py partition) ----------------
+def _index_defs(conn, table: str) -> List[str]:
+    # índices fora a PK; o CREATE INDEX gerado vale igual na tabela nova (mesmo nome depois do RENAME)
+    return conn.execute(
+        text("""
+            SELECT pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            WHERE i.indrelid = CAST(:t AS regclass) AND NOT i.indisprimary
+        """),
+        {"t": f"public.{table}"}
+    ).scalars().all()
+
+def _outgoing_fks(conn, table: str) -> List[tuple]:
+    return conn.execute(
+        text("""
+            SELECT conname, confrelid::regclass::text, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid = CAST(:t AS regclass) AND contype = 'f'
+        """),
+        {"t": f"public.{table}"}
+    ).all()
+
+def enable_survey_partitioning() -> Optional[List[int]]:
+    """
+    Converte comment e perception para LIST por pesquisa numa transação só
+    (tabelas bloqueadas durante a cópia: rodar em janela de manutenção).
+    PK passa a incluir a pesquisa e a FK perception -> comment vira
+    (comment_id, survey_id). Índices e FKs existentes são recriados.
+    Retorna as pesquisas com partição criada (None se já estava particionado).
+    """
+    _layout["checked_at"] = 0.0
+    if survey_partitioning_enabled():
+        return None
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("SET LOCAL statement_timeout = 0")
+        conn.exec_driver_sql("LOCK TABLE public.comment, public.perception IN ACCESS EXCLUSIVE MODE")
+
+        # chave de partição obrigatória: completa as linhas antigas sem pesquisa
+        conn.exec_driver_sql("""
+            UPDATE public.comment c
+               SET comment_survey_id = q.question_survey_id
+              FROM public.question q
+             WHERE q.question_id = c.comment_question_id
+               AND c.comment_survey_id IS NULL
+        """)
+        conn.exec_driver_sql("""
+            UPDATE public.perception p
+               SET perception_survey_id = c.comment_survey_id
+              FROM public.comment c
+             WHERE c.comment_id = p.perception_comment_id
+               AND p.perception_survey_id IS NULL
+        """)
+        for t, col in PARTITIONED_TABLES.items():
+            n = conn.execute(text(f"SELECT count(*) FROM public.{t} WHERE {col} IS NULL")).scalar()
+            if n:
+                raise ValueError(f"{t}: {n} linha(s) sem {col}; corrija antes de particionar")
+
+        indexes = {t: _index_defs(conn, t) for t in PARTITIONED_TABLES}
+        fks = {t: _outgoing_fks(conn, t) for t in PARTITIONED_TABLES}
+        survey_ids = conn.execute(text("SELECT survey_id FROM public.survey ORDER BY survey_id")).scalars().all()
+
+        for t, col in PARTITIONED_TABLES.items():
+            new = f"{t}_partitioned"
+            conn.exec_driver_sql(f"CREATE TABLE public.{new} (LIKE public.{t} INCLUDING DEFAULTS) PARTITION BY LIST ({col})")
+            conn.exec_driver_sql(f"ALTER TABLE public.{new} ALTER COLUMN {col} SET NOT NULL")
+            conn.exec_driver_sql(f"CREATE TABLE public.{t}_default PARTITION OF public.{new} DEFAULT")
+            for sid in survey_ids:
+                conn.exec_driver_sql(
+                    f"CREATE TABLE public.{partition_name(t, sid)} PARTITION OF public.{new} FOR VALUES IN ({int(sid)})"
+                )
+            conn.exec_driver_sql(f"INSERT INTO public.{new} SELECT * FROM public.{t}")
+
+        # as sequências dos ids passam para as tabelas novas antes do DROP
+        conn.exec_driver_sql("ALTER SEQUENCE public.comment_comment_id_seq OWNED BY public.comment_partitioned.comment_id")
+        conn.exec_driver_sql("ALTER SEQUENCE public.perception_perception_id_seq OWNED BY public.perception_partitioned.perception_id")
+        conn.exec_driver_sql("DROP TABLE public.perception")
+        conn.exec_driver_sql("DROP TABLE public.comment")
+        for t in PARTITIONED_TABLES:
+            conn.exec_driver_sql(f"ALTER TABLE public.{t}_partitioned RENAME TO {t}")
+
+        conn.exec_driver_sql("ALTER TABLE public.comment ADD CONSTRAINT comment_pkey PRIMARY KEY (comment_id, comment_survey_id)")
+        conn.exec_driver_sql("ALTER TABLE public.perception ADD CONSTRAINT perception_pkey PRIMARY KEY (perception_id, perception_survey_id)")
+        for t in PARTITIONED_TABLES:
+            for ddl in indexes[t]:
+                conn.exec_driver_sql(ddl)
+        for t in PARTITIONED_TABLES:
+            for name, ref, ddl in fks[t]:
+                if ref in ("comment", "public.comment"):
+                    # comment_id sozinho não é mais único: a FK leva a pesquisa junto
+                    ddl = ("FOREIGN KEY (perception_comment_id, perception_survey_id) "
+                           "REFERENCES public.comment(comment_id, comment_survey_id) ON DELETE CASCADE")
+                conn.exec_driver_sql(f"ALTER TABLE public.{t} ADD CONSTRAINT {name} {ddl}")
+
+    with engine.begin() as conn:
+        for t in PARTITIONED_TABLES:
+            conn.exec_driver_sql(f"ANALYZE public.{t}")
+
+    _layout["checked_at"] = 0.0
+    logger.info("comment/perception particionadas por pesquisa (%d pesquisas)", len(survey_ids))
+    return list(survey_ids)
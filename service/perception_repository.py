@@ -2,13 +2,29 @@
 from typing import Dict, List, Tuple
 from sqlalchemy import text
 from db_config import engine
+from service.bulk_loader import bulk_insert
+from service.partitioning import truncate_survey_partition
 
-def fetch_employee_comments_grouped(survey_id: int) -> Dict[str, List[dict]]:
+# comment.comment_classification_status
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+def fetch_employee_comments_grouped(survey_id: int, only_remaining: bool = False) -> Dict[str, List[dict]]:
     """
     Retorna { email -> [ {comment_id, question, comment, email, area_id, gestor_id} ... ] }
     Somente comentários do survey informado.
+    Com only_remaining, pula comentários já classificados (status 'done' ou com percepção gravada).
     """
-    sql = text("""
+    remaining = """
+          AND c.comment_classification_status <> 'done'
+          AND NOT EXISTS (
+                SELECT 1 FROM perception p
+                 WHERE p.perception_comment_id = c.comment_id
+                   AND p.perception_survey_id = :sid
+          )
+    """ if only_remaining else ""
+    sql = text(f"""
         SELECT
           lower(e.employee_email)             AS email,
           e.employee_area_id                  AS area_id,
@@ -23,6 +39,8 @@ def fetch_employee_comments_grouped(survey_id: int) -> Dict[str, List[dict]]:
           ON q.question_id = c.comment_question_id
         WHERE e.employee_survey_id = :sid
           AND q.question_survey_id = :sid
+          AND c.comment_survey_id = :sid
+          {remaining}
         ORDER BY email, c.comment_id
     """)
     with engine.begin() as conn:
@@ -46,15 +64,62 @@ def insert_perceptions(rows: List[dict]) -> int:
     """
     if not rows:
         return 0
+    columns = [
+        "perception_comment_id", "perception_comment_clipping", "perception_theme",
+        "perception_intension", "perception_survey_id", "perception_area_id",
+    ]
+    with engine.begin() as conn:
+        return bulk_insert(conn, "perception", columns, rows)
+
+def save_perceptions_checkpoint(rows: List[dict], done_ids: List[int], failed_ids: List[int]) -> int:
+    """
+    Grava as percepções e o status dos comentários na mesma transação: um
+    comentário só vira 'done' junto com as suas percepções (reexecução não duplica).
+    """
+    columns = [
+        "perception_comment_id", "perception_comment_clipping", "perception_theme",
+        "perception_intension", "perception_survey_id", "perception_area_id",
+    ]
+    sql_status = text("""
+        UPDATE comment
+           SET comment_classification_status = :status
+         WHERE comment_id = ANY(CAST(:ids AS integer[]))
+    """)
+    with engine.begin() as conn:
+        inserted = bulk_insert(conn, "perception", columns, rows) if rows else 0
+        if done_ids:
+            conn.execute(sql_status, {"status": STATUS_DONE, "ids": list(done_ids)})
+        if failed_ids:
+            conn.execute(sql_status, {"status": STATUS_FAILED, "ids": list(failed_ids)})
+    return inserted
+
+def reset_classification_status(survey_id: int) -> int:
+    """Volta todos os comentários do survey para 'pending' (reprocessamento do zero)."""
+    sql = text("""
+        UPDATE comment c
+           SET comment_classification_status = 'pending'
+          FROM question q
+         WHERE q.question_id = c.comment_question_id
+           AND q.question_survey_id = :sid
+           AND c.comment_classification_status <> 'pending'
+    """)
+    with engine.begin() as conn:
+        return conn.execute(sql, {"sid": survey_id}).rowcount or 0
+
+def count_classification_status(survey_id: int) -> Dict[str, int]:
+    """{pending, done, failed} dos comentários do survey."""
     sql = text("""
-      INSERT INTO perception
-        (perception_comment_id, perception_comment_clipping, perception_theme, perception_intension, perception_survey_id, perception_area_id)
-      VALUES
-        (:perception_comment_id, :perception_comment_clipping, :perception_theme, :perception_intension, :perception_survey_id, :perception_area_id)
+        SELECT c.comment_classification_status AS status, COUNT(*) AS n
+          FROM comment c
+          JOIN question q ON q.question_id = c.comment_question_id
+         WHERE q.question_survey_id = :sid
+         GROUP BY c.comment_classification_status
     """)
     with engine.begin() as conn:
-        conn.execute(sql, rows)
-    return len(rows)
+        rows = conn.execute(sql, {"sid": survey_id}).fetchall()
+    out = {STATUS_PENDING: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+    out.update({r[0]: int(r[1]) for r in rows})
+    return out
 
 def delete_perceptions_for_survey(survey_id: int) -> int:
     """
@@ -77,6 +142,10 @@ def delete_perceptions_for_survey(survey_id: int) -> int:
         AND q.question_survey_id = :sid
     """)
     with engine.begin() as conn:
+        # layout particionado: TRUNCATE da partição da pesquisa
+        n = truncate_survey_partition(conn, "perception", survey_id)
+        if n is not None:
+            return n
         res = conn.execute(sql, {"sid": survey_id})
         return res.rowcount or 0
 
@@ -1,16 +1,38 @@
 # service/perception_service.py
-from typing import Dict, List, Tuple
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
 import re
+import time
+import unicodedata
 from db_config import engine
 import pandas as pd
 from sqlalchemy import text
-from service.openai_client import get_openai_client
+from service.openai_client import chat_completion, discard_cached_completion
+from service.comment_dedup import COMMENT_DEDUP_ENABLED, dedupe_comments, fan_out_perceptions
+from service.comment_packer import PERCEPTION_TOKEN_BUDGET, count_tokens, pack_items
 from service.perception_repository import (
     fetch_employee_comments_grouped,
-    insert_perceptions,
+    save_perceptions_checkpoint,
     delete_perceptions_for_survey,
+    reset_classification_status,
 )
 
+# Nº de employees classificados em paralelo e tamanho do lote de INSERT das percepções
+DEFAULT_MAX_WORKERS = int(os.environ.get("PERCEPTION_MAX_WORKERS", "8"))
+DEFAULT_INSERT_BATCH = int(os.environ.get("PERCEPTION_INSERT_BATCH", "500"))
+
+# Saída estruturada (JSON schema) em vez do texto "Pergunta1/Comentário1/Tema1"; opt-in
+STRUCTURED_OUTPUT = os.environ.get("PERCEPTION_STRUCTURED_OUTPUT", "0") in ("1", "true", "True")
+# rodadas extras só com os comentários que voltaram inválidos
+STRUCTURED_MAX_RETRIES = int(os.environ.get("PERCEPTION_STRUCTURED_MAX_RETRIES", "2"))
+# intervalo mínimo entre eventos de progresso da classificação (segundos)
+PERCEPTION_PROGRESS_INTERVAL = float(os.environ.get("PERCEPTION_PROGRESS_INTERVAL", "5"))
+
+INTENCOES = ["Reconhecimento", "Crítica", "Sugestão", "Neutro"]
+
 
 # -------- Prompt builders --------
 
@@ -36,14 +58,46 @@ O output foi esse: Liderança e Gestão - Sugestão - 'Momentos difíceis existe
     """
     return prompt_system
 
-def _build_user_prompt(comments: List[dict], temas: List[str]) -> str:
-    # Cria o bloco "question_list"
-    lines = []
+_TEXT_FORMAT = """- Em cada resposta, repita no campo Id o identificador [c<número>] do comentário exatamente como recebido.
+
+Responda estritamente no formato:
+
+Id1: [c<número>]
+Pergunta1: <pergunta>
+Comentário1: <comentario>
+Tema1: <tema> - <intenção> - <recorte>.| <tema> - <intenção> - <recorte>,...
+
+Id2: [c<número>]
+Pergunta2: <pergunta>
+Comentário2: <comentario>
+Tema2: <tema> - <intenção> - <recorte>.| <tema> - <intenção> - <recorte>,...
+"""
+
+_STRUCTURED_FORMAT = """- Ignore o formato de texto dos exemplos: responda em JSON, com um item por comentário.
+- Em comment_id use o número do identificador [c<número>] do comentário.
+- Cada comentário deve ter ao menos uma percepção (tema, intenção e recorte do comentário).
+"""
+
+def _render_item(item: dict) -> str:
+    # cada item leva o id do comentário ([c<comment_id>]) para o retorno ser resolvido por id
+    q = str(item["question"]).strip()
+    c = str(item["comment"]).strip()
+    return f"[c{item['comment_id']}]\npergunta: {q}\ncomentario: {c}\n"
+
+def _build_user_prompt(comments: List[dict], temas: List[str], structured: bool = False) -> str:
+    # Cria o bloco "question_list"; com vários employees na mesma requisição, agrupa por colaborador
+    grupos: Dict[str, List[str]] = {}
     for item in comments:
-        q = str(item["question"]).strip()
-        c = str(item["comment"]).strip()
-        lines.append(f"pergunta: {q}\ncomentario: {c}\n")
-    question_list = "\n".join(lines)
+        grupos.setdefault(item.get("email"), []).append(_render_item(item))
+    if len(grupos) > 1:
+        question_list = "\n".join(
+            f"Colaborador {n}:\n" + "\n".join(lines)
+            for n, lines in enumerate(grupos.values(), start=1)
+        )
+        mesmo = " do mesmo colaborador"
+    else:
+        question_list = "\n".join(line for lines in grupos.values() for line in lines)
+        mesmo = ""
 
     temas_txt = ", ".join(temas) if temas else "Sem tema"
     prompt_system = f"""
@@ -58,35 +112,32 @@ Seu objetivo é identificar um ou mais temas e intenções relacionados aos come
 {question_list}
 
 Instruções:
-- Não classifique um comentário com o mesmo tema e intenção mais de uma vez, mesmo que haja comentários parecidos em perguntas diferentes.
-
-Responda estritamente no formato:
-
-Pergunta1: <pergunta>
-Comentário1: <comentario>
-Tema1: <tema> - <intenção> - <recorte>.| <tema> - <intenção> - <recorte>,...
-
-Pergunta2: <pergunta>
-Comentário2: <comentario>
-Tema2: <tema> - <intenção> - <recorte>.| <tema> - <intenção> - <recorte>,...
-"""
+- Não classifique um comentário com o mesmo tema e intenção mais de uma vez, mesmo que haja comentários parecidos em perguntas diferentes{mesmo}.
+{_STRUCTURED_FORMAT if structured else _TEXT_FORMAT}"""
     return prompt_system
 
 # -------- Parser do output --------
 _BLOCK_RE = re.compile(
-    r"Pergunta\d+:\s*(?P<pergunta>.+?)\s*[\r\n]+Coment[aá]rio\d+:\s*(?P<comentario>.+?)\s*[\r\n]+Tema\d+:\s*(?P<temas>.+?)(?:[\r\n]{2,}|\Z)",
+    r"(?:Id\d*:\s*\[?c(?P<cid>\d+)\]?\s*[\r\n]+)?Pergunta\d+:\s*(?P<pergunta>.+?)\s*[\r\n]+Coment[aá]rio\d+:\s*(?P<comentario>.+?)\s*[\r\n]+Tema\d+:\s*(?P<temas>.+?)(?:[\r\n]{2,}|\Z)",
     re.DOTALL | re.IGNORECASE
 )
+_CID_TAG_RE = re.compile(r"\[c(\d+)\]\s*", re.IGNORECASE)
 
 def _parse_model_output(raw: str) -> List[dict]:
     """
     Retorna lista de blocos:
-    [{ 'pergunta': str, 'comentario': str, 'pairs': [ (tema, intenção, recorte), ... ] }, ...]
+    [{ 'comment_id': int | None, 'pergunta': str, 'comentario': str, 'pairs': [ (tema, intenção, recorte), ... ] }, ...]
     """
     results = []
     for m in _BLOCK_RE.finditer(raw.strip()):
+        cid = m.group("cid")
         pergunta = m.group("pergunta").strip()
         comentario = m.group("comentario").strip()
+        # o modelo às vezes repete o [c<id>] dentro da pergunta em vez do campo Id
+        tag = _CID_TAG_RE.search(pergunta)
+        if tag:
+            cid = cid or tag.group(1)
+            pergunta = _CID_TAG_RE.sub("", pergunta).strip()
         temas_line = m.group("temas").strip()
 
         # Split por "|" em percepções múltiplas
@@ -100,7 +151,12 @@ def _parse_model_output(raw: str) -> List[dict]:
             if len(bits) >= 3:
                 tema, intencao, recorte = bits[0], bits[1], " - ".join(bits[2:])
                 pairs.append((tema, intencao, recorte))
-        results.append({"pergunta": pergunta, "comentario": comentario, "pairs": pairs})
+        results.append({
+            "comment_id": int(cid) if cid else None,
+            "pergunta": pergunta,
+            "comentario": comentario,
+            "pairs": pairs,
+        })
     return results
 
 # -------- Resolve comment_id pelo texto (pergunta+comentário) --------
@@ -108,35 +164,289 @@ def _parse_model_output(raw: str) -> List[dict]:
 def _normalize(s: str) -> str:
     return re.sub(r"\s+", " ", s or "").strip().lower()
 
-def _resolve_comment_id(block: dict, items: List[dict]) -> int | None:
+class _CommentIndex:
+    """
+    Índices montados uma vez por employee:
+      - comment_id -> item
+      - (pergunta, comentário) normalizados -> comment_id
+      - pergunta normalizada -> [(comentário normalizado, comment_id)] para o fallback por substring
     """
-    Tenta achar o comment_id do bloco comparando pergunta e comentário.
-    Estratégia: match exato normalizado; se não achar, tenta 'comentário' como substring.
+    def __init__(self, items: List[dict]):
+        self.by_id: Dict[int, dict] = {}
+        self.by_text: Dict[Tuple[str, str], int] = {}
+        self.by_question: Dict[str, List[Tuple[str, int]]] = {}
+        for it in items:
+            cid = it["comment_id"]
+            self.by_id.setdefault(cid, it)
+            q = _normalize(it["question"])
+            c = _normalize(it["comment"])
+            self.by_text.setdefault((q, c), cid)
+            self.by_question.setdefault(q, []).append((c, cid))
+
+def _resolve_comment_id(block: dict, index: _CommentIndex) -> int | None:
     """
+    Resolve o comment_id do bloco.
+    Estratégia: id [c<n>] devolvido pelo modelo; se não vier (ou não for deste
+    employee), match exato normalizado de pergunta+comentário; por último,
+    'comentário' como substring dentro da mesma pergunta.
+    """
+    cid = block.get("comment_id")
+    if cid is not None and cid in index.by_id:
+        return cid
+
     p = _normalize(block["pergunta"])
     c = _normalize(block["comentario"])
 
     # 1) match exato
-    for it in items:
-        if _normalize(it["question"]) == p and _normalize(it["comment"]) == c:
-            return it["comment_id"]
+    cid = index.by_text.get((p, c))
+    if cid is not None:
+        return cid
 
     # 2) substring do comentário (fallback leve)
-    for it in items:
-        if _normalize(it["question"]) == p and c and c in _normalize(it["comment"]):
-            return it["comment_id"]
+    if c:
+        for comment, cid in index.by_question.get(p, []):
+            if c in comment:
+                return cid
 
     return None
 
+# -------- Saída estruturada (JSON schema) --------
+
+def _fold(s: str) -> str:
+    s = unicodedata.normalize("NFKD", str(s or ""))
+    return "".join(ch for ch in s if not unicodedata.combining(ch)).strip().lower()
+
+def _perception_schema(temas: List[str]) -> dict:
+    """response_format json_schema: {items: [{comment_id, perceptions: [{theme, intent, clipping}]}]}"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "perceptions",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["items"],
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "additionalProperties": False,
+                            "required": ["comment_id", "perceptions"],
+                            "properties": {
+                                "comment_id": {"type": "integer"},
+                                "perceptions": {
+                                    "type": "array",
+                                    "items": {
+                                        "type": "object",
+                                        "additionalProperties": False,
+                                        "required": ["theme", "intent", "clipping"],
+                                        "properties": {
+                                            "theme": {"type": "string", "enum": list(temas) or ["Sem tema"]},
+                                            "intent": {"type": "string", "enum": INTENCOES},
+                                            "clipping": {"type": "string"},
+                                        },
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    }
+
+def _parse_structured_output(raw: str, index: _CommentIndex, temas: List[str]) -> Dict[int, List[Tuple[str, str, str]]]:
+    """
+    Valida o JSON devolvido: comment_id do employee, tema da lista `temas` e
+    intenção conhecida. Percepções inválidas são descartadas; comentários sem
+    nenhuma percepção válida ficam de fora (e são pedidos de novo).
+    Retorna {comment_id: [(tema, intenção, recorte), ...]}.
+    """
+    try:
+        data = json.loads(raw or "")
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+        return {}
+
+    temas_ok = {_fold(t): t for t in (temas or ["Sem tema"])}
+    intents_ok = {_fold(i): i for i in INTENCOES}
+
+    out: Dict[int, List[Tuple[str, str, str]]] = {}
+    for item in data["items"]:
+        if not isinstance(item, dict):
+            continue
+        try:
+            cid = int(item.get("comment_id"))
+        except (TypeError, ValueError):
+            continue
+        if cid not in index.by_id:
+            continue
+        # comentário longo vai em partes com o mesmo comment_id: junta as percepções
+        pairs = out.get(cid, [])
+        for perc in item.get("perceptions") or []:
+            if not isinstance(perc, dict):
+                continue
+            tema = temas_ok.get(_fold(perc.get("theme")))
+            intencao = intents_ok.get(_fold(perc.get("intent")))
+            recorte = str(perc.get("clipping") or "").strip()
+            if tema and intencao and (tema, intencao, recorte) not in pairs:
+                pairs.append((tema, intencao, recorte))
+        if pairs:
+            out[cid] = pairs
+    return out
+
+def _classify_employee_structured(
+    items: List[dict],
+    temas: List[str],
+    model: str,
+    temperature: float,
+    survey_id: int
+) -> Tuple[List[dict], int, int]:
+    """
+    Como _classify_employee, mas com saída JSON validada contra o schema/temas.
+    Só os comentários sem resposta válida são reenviados (até STRUCTURED_MAX_RETRIES vezes),
+    sem usar o cache do LLM; resposta que deixou comentários sem percepção válida
+    sai do cache.
+    """
+    index = _CommentIndex(items)
+    prompt_system = _build_system_prompt()
+    response_format = _perception_schema(temas)
+
+    resolved: Dict[int, List[Tuple[str, str, str]]] = {}
+    pending = items
+    completion_tokens = 0
+    for attempt in range(1 + max(0, STRUCTURED_MAX_RETRIES)):
+        call = dict(
+            model=model,
+            temperature=temperature,
+            response_format=response_format,
+            messages=[
+                {"role": "system", "content": prompt_system},
+                {"role": "user", "content": _build_user_prompt(pending, temas, structured=True)},
+            ]
+        )
+        # se tudo voltou inválido o prompt da nova tentativa é idêntico ao anterior
+        resp = chat_completion(use_cache=attempt == 0, **call)
+        usage = getattr(resp, "usage", None)
+        completion_tokens += int(getattr(usage, "completion_tokens", 0) or 0)
+
+        parsed = _parse_structured_output(resp.choices[0].message.content, index, temas)
+        pending_ids = {it["comment_id"] for it in pending}
+        resolved.update({cid: pairs for cid, pairs in parsed.items() if cid in pending_ids})
+        pending = [it for it in pending if it["comment_id"] not in resolved]
+        if not pending:
+            break
+        discard_cached_completion(**call)
+
+    payload = []
+    seen = set()
+    for it in items:
+        if it["comment_id"] in seen:
+            continue
+        seen.add(it["comment_id"])
+        for tema, intencao, recorte in resolved.get(it["comment_id"], []):
+            payload.append({
+                "perception_comment_id": it["comment_id"],
+                "perception_comment_clipping": recorte[:1000] if recorte else None,
+                "perception_theme": tema[:255],
+                "perception_intension": intencao[:100],
+                "perception_survey_id": survey_id,
+                "perception_area_id": it.get("area_id"),
+            })
+
+    return payload, len(pending), completion_tokens
+
 # -------- Execução: por survey, por employee --------
 
+def _merge_perceptions(payload: List[dict]) -> List[dict]:
+    """
+    Uma percepção por (comentário, tema, intenção), como pede o prompt. Partes de
+    um comentário partido (split_long_items) voltam cada uma com as suas
+    percepções: os recortes do mesmo tema/intenção são juntados.
+    """
+    merged: Dict[Tuple[int, str, str], dict] = {}
+    clippings: Dict[Tuple[int, str, str], List[str]] = {}
+    for p in payload:
+        key = (p["perception_comment_id"], p["perception_theme"], p["perception_intension"])
+        if key not in merged:
+            merged[key] = dict(p)
+            clippings[key] = []
+        recorte = p.get("perception_comment_clipping")
+        if recorte and recorte not in clippings[key]:
+            clippings[key].append(recorte)
+    for key, p in merged.items():
+        p["perception_comment_clipping"] = " ... ".join(clippings[key])[:1000] or None
+    return list(merged.values())
+
+def _classify_employee(
+    items: List[dict],
+    temas: List[str],
+    model: str,
+    temperature: float,
+    survey_id: int
+) -> Tuple[List[dict], int, int]:
+    """
+    Classifica os comentários de uma requisição (um ou mais employees, ver
+    comment_packer) em 1 chamada ao modelo.
+    Resposta que deixou comentários sem percepção sai do cache: a retomada
+    monta o mesmo prompt e precisa de uma resposta nova.
+    Retorna (payload de percepções, blocos sem comment_id, completion_tokens).
+    """
+    prompt_user = _build_user_prompt(items, temas)
+    prompt_system = _build_system_prompt()
+
+    call = dict(
+        model=model,
+        temperature=temperature,
+        messages=[
+            {"role": "system", "content": prompt_system},
+            {"role": "user", "content": prompt_user},
+        ]
+    )
+    resp = chat_completion(**call)
+    content = resp.choices[0].message.content
+
+    blocks = _parse_model_output(content)
+    index = _CommentIndex(items)
+    payload = []
+    unmatched = 0
+    for blk in blocks:
+        cid = _resolve_comment_id(blk, index)
+        if not cid:
+            unmatched += 1
+            continue
+        for tema, intencao, recorte in blk["pairs"]:
+            payload.append({
+                "perception_comment_id": cid,
+                "perception_comment_clipping": recorte[:1000] if recorte else None,  # proteção básica
+                "perception_theme": tema[:255] if tema else None,
+                "perception_intension": intencao[:100] if intencao else None,
+                "perception_survey_id": survey_id,
+                "perception_area_id": index.by_id[cid].get("area_id"),
+            })
+
+    classified = {p["perception_comment_id"] for p in payload}
+    if unmatched or any(it["comment_id"] not in classified for it in items):
+        discard_cached_completion(**call)
+
+    return payload, unmatched, resp.usage.completion_tokens
+
 #OK
 def classify_and_save_perceptions(
     survey_id: int,
     temas: List[str],
     model: str = "gpt-4o-mini",
     temperature: float = 0.0,
-    clear_existing: bool = False
+    clear_existing: bool = False,
+    max_workers: int | None = None,
+    batch_size: int | None = None,
+    structured: bool | None = None,
+    token_budget: int | None = None,
+    dedup: bool | None = None,
+    on_progress: Optional[Callable[[dict], None]] = None
 ) -> Dict[str, int]:
     """
     Para o survey informado:
@@ -144,68 +454,188 @@ def classify_and_save_perceptions(
       - Para cada employee, envia 1 prompt com todas as (pergunta, comentário)
       - Faz parsing do output
       - Resolve comment_id e insere percepções em batch
-    Retorna stats.
+    As chamadas ao modelo rodam em um pool de `max_workers` threads; as percepções
+    são gravadas em lotes de `batch_size` à medida que os employees terminam.
+    Com `structured` (padrão: PERCEPTION_STRUCTURED_OUTPUT) o modelo responde em
+    JSON schema e blocks_unmatched conta comentários que seguiram inválidos.
+    Com `token_budget` > 0 (padrão: PERCEPTION_TOKEN_BUDGET) employees pequenos são
+    agrupados na mesma requisição e comentários enormes são partidos; com 0, uma
+    requisição por employee.
+    Com `dedup` (padrão: COMMENT_DEDUP_ENABLED, desligado) comentários iguais ou quase iguais
+    (service/comment_dedup.py) são classificados uma vez só e as percepções são
+    replicadas para os demais.
+    Retomável: só entram comentários ainda não classificados (comment_classification_status
+    <> 'done' e sem percepção). Cada lote grava percepções + status 'done'/'failed' na
+    mesma transação; uma requisição que falha marca os seus comentários como 'failed'
+    e não derruba as demais. clear_existing apaga tudo e volta os status para 'pending'.
+    `on_progress` recebe {requests_done, requests, comments_done, comments_failed} a cada
+    PERCEPTION_PROGRESS_INTERVAL segundos; exceção lançada nele (JobCancelled) interrompe
+    a classificação: requisições ainda não enviadas são canceladas e o que já voltou é gravado.
+    Retorna stats; completion_tokens (mantido por compatibilidade) e
+    completion_tokens_per_request são a mesma lista, na ordem das requisições
+    (com token_budget > 0 uma requisição pode ter vários employees).
     """
     if clear_existing:
         delete_perceptions_for_survey(survey_id)
+        reset_classification_status(survey_id)
 
-    grouped = fetch_employee_comments_grouped(survey_id)
+    grouped = fetch_employee_comments_grouped(survey_id, only_remaining=True)
     if not grouped:
-        return {"employees": 0, "perceptions": 0, "blocks_unmatched": 0, "employees_skipped": 0}
+        return {
+            "employees": 0, "requests": 0, "requests_failed": 0, "perceptions": 0,
+            "blocks_unmatched": 0, "employees_skipped": 0, "comments_deduplicated": 0,
+            "comments_done": 0, "comments_failed": 0, "completion_tokens": [],
+            "completion_tokens_per_request": [],
+        }
+
+    workers = max(1, int(max_workers or DEFAULT_MAX_WORKERS))
+    batch_size = max(1, int(batch_size or DEFAULT_INSERT_BATCH))
+    structured = STRUCTURED_OUTPUT if structured is None else bool(structured)
+    classify = _classify_employee_structured if structured else _classify_employee
 
-    client = get_openai_client()
     total_perc = 0
     unmatched = 0
-    skipped = 0
-
-    completion_tokens_list = []  
-
-    for email, items in grouped.items():
-               
-        if not items:
-            skipped += 1
-            continue
-
-        prompt_user = _build_user_prompt(items, temas)
-        prompt_system = _build_system_prompt()
 
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=[
-                {"role": "system", "content": prompt_system},
-                {"role": "user", "content": prompt_user},
-            ]
+    employees = [items for items in grouped.values() if items]
+    skipped = len(grouped) - len(employees)
+
+    clusters: Dict[int, List[dict]] = {}
+    if COMMENT_DEDUP_ENABLED if dedup is None else dedup:
+        representatives, clusters = dedupe_comments([it for items in employees for it in items])
+        keep = {it["comment_id"] for it in representatives}
+        employees = [g for g in ([it for it in items if it["comment_id"] in keep] for items in employees) if g]
+    deduplicated = sum(len(c) - 1 for c in clusters.values())
+
+    budget = PERCEPTION_TOKEN_BUDGET if token_budget is None else int(token_budget)
+    if budget > 0:
+        overhead = (
+            count_tokens(_build_system_prompt(), model)
+            + count_tokens(_build_user_prompt([], temas, structured), model)
         )
-        content = resp.choices[0].message.content
-        
-        completion_tokens_list.append(resp.usage.completion_tokens)
-
-        blocks = _parse_model_output(content)
-        payload = []
-        for blk in blocks:
-            cid = _resolve_comment_id(blk, items)
-            if not cid:
-                unmatched += 1
+        units = pack_items(employees, budget, overhead, _render_item, model)
+    else:
+        units = employees
+
+    completion_tokens_list = [None] * len(units)
+    # comentário partido em requisições diferentes: as percepções das partes ficam
+    # retidas até a última parte voltar e o status sai uma vez só
+    parts_left = Counter(cid for unit in units for cid in dict.fromkeys(it["comment_id"] for it in unit))
+    held: Dict[int, List[Tuple[int, List[dict]]]] = {}
+    held_failed = set()
+    buffer: List[dict] = []
+    done_ids: List[int] = []
+    failed_ids: List[int] = []
+    totals = {"done": 0, "failed": 0, "requests_failed": 0}
+
+    def _with_members(ids):
+        # membros de um grupo deduplicado seguem o status do representante
+        out = []
+        for cid in ids:
+            if cid in clusters:
+                out.extend(m["comment_id"] for m in clusters[cid])
+            else:
+                out.append(cid)
+        return out
+
+    def _settle(idx, unit_ids, payload, request_failed):
+        # -> (percepções prontas para gravar, comentários 'done', comentários 'failed')
+        by_cid: Dict[int, List[dict]] = {}
+        for p in payload:
+            by_cid.setdefault(p["perception_comment_id"], []).append(p)
+        ready, done, failed = [], [], []
+        for cid in unit_ids:
+            percs = by_cid.get(cid, [])
+            if parts_left[cid] > 1 or cid in held:
+                held.setdefault(cid, []).append((idx, percs))
+                if request_failed:
+                    held_failed.add(cid)
+                parts_left[cid] -= 1
+                if parts_left[cid] > 0:
+                    continue
+                # partes na ordem do texto (as requisições são montadas em ordem)
+                percs = [p for _, part in sorted(held.pop(cid), key=lambda x: x[0]) for p in part]
+                if cid in held_failed:
+                    held_failed.discard(cid)
+                    failed.append(cid)
+                    continue
+            if request_failed or not percs:
+                failed.append(cid)
+                continue
+            done.append(cid)
+            ready.extend(percs)
+        return _merge_perceptions(ready), done, failed
+
+    def _flush():
+        nonlocal buffer, done_ids, failed_ids, total_perc
+        total_perc += save_perceptions_checkpoint(buffer, done_ids, failed_ids)
+        totals["done"] += len(done_ids)
+        totals["failed"] += len(failed_ids)
+        buffer, done_ids, failed_ids = [], [], []
+
+    requests_done = 0
+    last_progress = time.monotonic()
+
+    def _progress():
+        nonlocal last_progress
+        if on_progress is None or time.monotonic() - last_progress < PERCEPTION_PROGRESS_INTERVAL:
+            return
+        last_progress = time.monotonic()
+        on_progress({
+            "requests_done": requests_done,
+            "requests": len(units),
+            "comments_done": totals["done"] + len(done_ids),
+            "comments_failed": totals["failed"] + len(failed_ids),
+        })
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="perception")
+    try:
+        futures = {
+            pool.submit(classify, items, temas, model, temperature, survey_id): idx
+            for idx, items in enumerate(units)
+        }
+        for fut in as_completed(futures):
+            idx = futures[fut]
+            unit_ids = list(dict.fromkeys(it["comment_id"] for it in units[idx]))
+            requests_done += 1
+            try:
+                payload, blk_unmatched, completion_tokens = fut.result()
+            except Exception as e:
+                print(f"Erro ao classificar requisição {idx} ({len(unit_ids)} comentários): {e}")
+                totals["requests_failed"] += 1
+                _, _, failed = _settle(idx, unit_ids, [], True)
+                failed_ids.extend(_with_members(failed))
+                _progress()
                 continue
-            for tema, intencao, recorte in blk["pairs"]:
-                payload.append({
-                    "perception_comment_id": cid,
-                    "perception_comment_clipping": recorte[:1000] if recorte else None,  # proteção básica
-                    "perception_theme": tema[:255] if tema else None,
-                    "perception_intension": intencao[:100] if intencao else None,
-                    "perception_survey_id": survey_id,
-                    "perception_area_id": next((i["area_id"] for i in items if i["comment_id"] == cid), None)
-                })
-
-        total_perc += insert_perceptions(payload)
+            completion_tokens_list[idx] = completion_tokens
+            unmatched += blk_unmatched
+
+            ready, done, failed = _settle(idx, unit_ids, payload, False)
+            done_ids.extend(_with_members(done))
+            failed_ids.extend(_with_members(failed))
+
+            # percepções de uma requisição entram juntas (e na ordem do parser) no lote
+            buffer.extend(fan_out_perceptions(ready, clusters))
+            if len(buffer) >= batch_size:
+                _flush()
+            _progress()
+    finally:
+        # em caso de erro ou cancelamento não dispara novas requisições, mas grava o que já foi classificado
+        pool.shutdown(wait=True, cancel_futures=True)
+        if buffer or done_ids or failed_ids:
+            _flush()
 
     return {
         "employees": len(grouped),
+        "requests": len(units),
+        "requests_failed": totals["requests_failed"],
         "perceptions": total_perc,
         "blocks_unmatched": unmatched,
         "employees_skipped": skipped,
-        "completion_tokens": completion_tokens_list
+        "comments_deduplicated": deduplicated,
+        "comments_done": totals["done"],
+        "comments_failed": totals["failed"],
+        "completion_tokens": completion_tokens_list,
+        "completion_tokens_per_request": completion_tokens_list
     }
 
 #OK
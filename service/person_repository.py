@@ -1,6 +1,8 @@
 # service/person_repository.py
 import pandas as pd
+from sqlalchemy import text
 from db_config import engine
+from service.bulk_loader import bulk_insert_df
 
 REQUIRED_COLS = {
     "employee_id",
@@ -34,15 +36,22 @@ def insert_person(df_employee: pd.DataFrame) -> int:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
 
-    # Inserção em lote (append) dentro de transação
+    # Inserção em lote (COPY) dentro de transação
     with engine.begin() as conn:
-        df.to_sql(
-            "employee",
-            con=conn,
-            if_exists="append",
-            index=False,
-            method="multi",
-            chunksize=1000,
-        )
+        return bulk_insert_df(conn, "employee", df)
 
-    return len(df)
+def fetch_survey_person(survey_id: int) -> pd.DataFrame:
+    """
+    Employees já cadastrados no survey, com as mesmas colunas de insert_person
+    (formato que data_preprocessing espera em df_employee).
+    """
+    with engine.begin() as conn:
+        return pd.read_sql(
+            text("""
+                SELECT employee_id, employee_email, employee_name,
+                       employee_manager_id, employee_area_id, employee_survey_id
+                FROM employee
+                WHERE employee_survey_id = :sid
+            """),
+            conn, params={"sid": survey_id}
+        )
@@ -1,52 +1,273 @@
-import json, time, threading, queue
-from typing import Dict, Any
+import json, os, time, threading, itertools, logging, select
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "postgres" (tabela job_event + LISTEN/NOTIFY, vale entre processos) ou "memory" (um processo só, desenvolvimento)
+PROGRESS_BACKEND = os.environ.get("PROGRESS_BACKEND", "postgres").strip().lower()
+# eventos mais velhos que isso são descartados (segundos)
+PROGRESS_EVENT_TTL = int(os.environ.get("PROGRESS_EVENT_TTL", "86400"))
+# sem notificação: releitura a cada N segundos (fallback do LISTEN)
+PROGRESS_POLL_INTERVAL = float(os.environ.get("PROGRESS_POLL_INTERVAL", "1.0"))
+# SSE sem eventos: ping a cada N segundos
+PING_INTERVAL = 30
+# canal do NOTIFY (payload = job_id)
+NOTIFY_CHANNEL = "job_events"
+
+Event = Tuple[int, Dict[str, Any]]
+
+class JobCancelled(BaseException):
+    """
+    Cancelamento pedido para o job. Herda de BaseException para atravessar os
+    `except Exception` dos workers (que só publicam 'error').
+    """
+
+# ============================================================
+# Backends: guardam eventos com id crescente e acordam quem espera
+# ============================================================
+
+class MemoryProgressBackend:
+    """
+    Eventos em memória do processo (desenvolvimento / workers embutidos).
+    Ids crescem globalmente; jobs sem evento novo há PROGRESS_EVENT_TTL somem.
+    """
+
+    def __init__(self, ttl: int = PROGRESS_EVENT_TTL):
+        self._ttl = ttl
+        self._ids = itertools.count(1)
+        self._events: Dict[str, List[Event]] = {}
+        self._touched: Dict[str, float] = {}
+        self._cond = threading.Condition()
+
+    def _expire(self, now: float):
+        for job_id in [j for j, t in self._touched.items() if now - t > self._ttl]:
+            self._events.pop(job_id, None)
+            self._touched.pop(job_id, None)
+
+    def publish(self, job_id: str, payload: Dict[str, Any]) -> int:
+        with self._cond:
+            now = time.monotonic()
+            self._expire(now)
+            event_id = next(self._ids)
+            self._events.setdefault(job_id, []).append((event_id, payload))
+            self._touched[job_id] = now
+            self._cond.notify_all()
+            return event_id
+
+    def read(self, job_id: str, after_id: int = 0) -> List[Event]:
+        with self._cond:
+            return [e for e in self._events.get(job_id, ()) if e[0] > after_id]
+
+    def wait(self, job_id: str, after_id: int, timeout: float) -> List[Event]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                events = [e for e in self._events.get(job_id, ()) if e[0] > after_id]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._cond.wait(remaining)
+
+class PostgresProgressBackend:
+    """
+    Eventos na tabela job_event (id = bigserial, crescente) + NOTIFY no canal
+    job_events na mesma transação. Cada processo mantém uma conexão dedicada
+    em LISTEN que acorda os streams daquele job; sem ela, cai para releitura
+    a cada PROGRESS_POLL_INTERVAL.
+    """
+    PURGE_EVERY = 600  # segundos entre limpezas por TTL (por processo)
+
+    def __init__(self, ttl: int = PROGRESS_EVENT_TTL):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, List[threading.Event]] = {}
+        self._listener: Optional[threading.Thread] = None
+        self._listening = False
+        self._last_purge = 0.0
+
+    # ---------- escrita ----------
+    def publish(self, job_id: str, payload: Dict[str, Any]) -> int:
+        from .job_repository import insert_job_event, purge_job_events
+        event_id = insert_job_event(job_id, payload, NOTIFY_CHANNEL)
+        now = time.monotonic()
+        if now - self._last_purge > self.PURGE_EVERY:
+            self._last_purge = now
+            try:
+                purge_job_events(self._ttl)
+            except Exception as e:
+                logger.warning("limpeza de job_event falhou: %s", e)
+        return event_id
+
+    # ---------- leitura ----------
+    def read(self, job_id: str, after_id: int = 0) -> List[Event]:
+        from .job_repository import fetch_job_events
+        return fetch_job_events(job_id, after_id)
+
+    def wait(self, job_id: str, after_id: int, timeout: float) -> List[Event]:
+        self._ensure_listener()
+        deadline = time.monotonic() + timeout
+        while True:
+            ev = threading.Event()
+            with self._lock:
+                self._waiters.setdefault(job_id, []).append(ev)
+            try:
+                # lê depois de registrar: uma notificação entre a leitura e o wait não se perde
+                events = self.read(job_id, after_id)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                step = remaining if self._listening else min(remaining, PROGRESS_POLL_INTERVAL)
+                ev.wait(step)
+            finally:
+                with self._lock:
+                    lst = self._waiters.get(job_id, [])
+                    if ev in lst:
+                        lst.remove(ev)
+                    if not lst:
+                        self._waiters.pop(job_id, None)
+
+    # ---------- LISTEN ----------
+    def _wake(self, job_id: Optional[str]):
+        with self._lock:
+            if job_id is None:
+                targets = [e for lst in self._waiters.values() for e in lst]
+            else:
+                targets = list(self._waiters.get(job_id, ()))
+        for e in targets:
+            e.set()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen_loop, name="progress-listener", daemon=True)
+            self._listener.start()
+
+    def _listen_loop(self):
+        import db_config
+        while True:
+            conn = None
+            try:
+                # conexão fora do pool: fica presa no LISTEN enquanto o processo existir
+                conn = db_config.engine.raw_connection()
+                conn.detach()
+                raw = conn.dbapi_connection
+                raw.autocommit = True
+                cur = raw.cursor()
+                cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                cur.close()
+                self._listening = True
+                self._wake(None)
+                if hasattr(raw, "poll"):
+                    self._listen_psycopg2(raw)
+                else:
+                    self._listen_psycopg3(raw)
+            except Exception as e:
+                logger.warning("LISTEN %s indisponível (%s); usando releitura periódica", NOTIFY_CHANNEL, e)
+            finally:
+                self._listening = False
+                self._wake(None)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(5)
+
+    def _listen_psycopg2(self, raw):
+        while True:
+            if select.select([raw], [], [], PING_INTERVAL) == ([], [], []):
+                continue
+            raw.poll()
+            while raw.notifies:
+                self._wake(raw.notifies.pop(0).payload)
+
+    def _listen_psycopg3(self, raw):
+        while True:
+            for n in raw.notifies(timeout=PING_INTERVAL):
+                self._wake(n.payload)
+
+def _make_backend(name: str):
+    if name == "memory":
+        return MemoryProgressBackend()
+    if name == "postgres":
+        return PostgresProgressBackend()
+    raise ValueError(f"PROGRESS_BACKEND inválido: {name!r} (use 'memory' ou 'postgres')")
+
+# ============================================================
+# Barramento de progresso (API usada pelos workers e pelas rotas SSE)
+# ============================================================
 
 class ProgressBus:
     """
-    Canal de mensagens por job_id para SSE.
+    Eventos de progresso por job_id para SSE, guardados no backend configurado
+    (PROGRESS_BACKEND). Cada evento recebe um id crescente, enviado no campo
+    `id:` do SSE; o navegador reconecta com Last-Event-ID e recebe só o que faltou.
+    O evento {"event": "done"} encerra o stream.
+    Observadores (add_observer) recebem todo evento antes de ele ser gravado; a
+    fila de jobs usa isso para checar cancelamento.
     """
-    def __init__(self):
-        self._channels: Dict[str, "queue.Queue[dict]"] = {}
+    def __init__(self, backend=None):
+        self.backend = backend or _make_backend(PROGRESS_BACKEND)
         self._lock = threading.Lock()
+        self._observers: List[Callable[[str, Dict[str, Any]], None]] = []
 
-    def open(self, job_id: str):
+    def add_observer(self, fn: Callable[[str, Dict[str, Any]], None]):
         with self._lock:
-            self._channels[job_id] = queue.Queue()
+            if fn not in self._observers:
+                self._observers.append(fn)
+
+    def open(self, job_id: str):
+        """Mantido por compatibilidade: o canal nasce com o primeiro evento."""
 
     def close(self, job_id: str):
-        with self._lock:
-            self._channels.pop(job_id, None)
+        """Mantido por compatibilidade: os eventos ficam para replay até expirar o TTL."""
 
-    def put(self, job_id: str, payload: Dict[str, Any]):
-        ch = self._channels.get(job_id)
-        if ch:
-            ch.put(payload)
+    def put(self, job_id: str, payload: Dict[str, Any]) -> Optional[int]:
+        for fn in self._observers:
+            fn(job_id, payload)
+        try:
+            return self.backend.publish(job_id, payload)
+        except Exception as e:
+            # progresso é informativo: falha ao gravar não derruba o job
+            logger.warning("evento de progresso do job %s perdido: %s", job_id, e)
+            return None
 
-    def stream(self, job_id: str):
+    def stream(self, job_id: str, last_event_id: Optional[int] = None, is_finished: Optional[Callable[[], bool]] = None):
         """
-        Generator para SSE: vai emitindo eventos enquanto houver mensagens.
+        Generator para SSE: replay dos eventos depois de `last_event_id` e, em
+        seguida, os novos. Termina no evento 'done' ou quando `is_finished()`
+        (job encerrado, eventos já expirados) for verdadeiro.
         """
-        ch = self._channels.get(job_id)
-        if ch is None:
-            # stream vazio encerra
-            yield "event: done\ndata: {}\n\n"
-            return
+        after = int(last_event_id or 0)
 
         # Mensagem inicial
         yield "event: start\ndata: {}\n\n"
 
-        # loop de consumo
+        last_sent = time.monotonic()
+        first = True
         while True:
-            try:
-                msg = ch.get(timeout=30)  # fecha se 30s sem eventos
-            except queue.Empty:
+            remaining = PING_INTERVAL - (time.monotonic() - last_sent)
+            if remaining <= 0:
                 yield "event: ping\ndata: {}\n\n"
+                last_sent = time.monotonic()
                 continue
-            if msg.get("event") == "done":
-                # última mensagem
+
+            # primeira leitura sem espera: job encerrado sem eventos termina na hora
+            events = self.backend.wait(job_id, after, 0 if first else remaining)
+            first = False
+            for event_id, msg in events:
+                after = event_id
+                if msg.get("event") == "done":
+                    # última mensagem
+                    yield f"id: {event_id}\nevent: done\ndata: {{}}\n\n"
+                    return
+                yield f"id: {event_id}\ndata: {json.dumps(msg, ensure_ascii=False)}\n\n"
+            if events:
+                last_sent = time.monotonic()
+            elif is_finished is not None and is_finished():
                 yield "event: done\ndata: {}\n\n"
-                break
-            yield f"data: {json.dumps(msg, ensure_ascii=False)}\n\n"
+                return
 
 progress_bus = ProgressBus()
 
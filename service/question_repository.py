@@ -16,25 +16,29 @@ def insert_questions(survey_id: int, names: List[str]) -> Dict[str, int]:
     """
     Garante perguntas para o survey_id.
     Retorna {question_name -> question_id}.
+
+    Um único INSERT multi-linha com ON CONFLICT DO NOTHING (índice único
+    question_survey_name_uidx) + uma leitura, na mesma transação. Se outro job
+    inserir a mesma pergunta em paralelo, o INSERT espera o commit dele e a
+    leitura seguinte já enxerga o id.
     """
     names = [n for n in {str(n).strip() for n in names} if n]
     if not names:
         return {}
 
-    existing = get_existing_questions(survey_id)
-    to_insert = [n for n in names if n not in existing]
-
-    if to_insert:
-        sql_ins = text("""
-            INSERT INTO question (question_name, question_survey_id)
-            VALUES (:name, :sid)
-            RETURNING question_id, question_name
-        """)
-        with engine.begin() as conn:
-            for n in to_insert:  # <- uma por vez (RETURNING seguro)
-                row = conn.execute(sql_ins, {"name": n, "sid": survey_id}).fetchone()
-                if row:
-                    qid, qname = row[0], row[1]
-                    existing[qname] = qid
+    sql_ins = text("""
+        INSERT INTO question (question_name, question_survey_id)
+        SELECT DISTINCT n, :sid
+        FROM unnest(CAST(:names AS text[])) AS n
+        ON CONFLICT (question_survey_id, question_name) DO NOTHING
+    """)
+    sql_sel = text("""
+        SELECT question_name, question_id
+        FROM question
+        WHERE question_survey_id = :sid
+    """)
+    with engine.begin() as conn:
+        conn.execute(sql_ins, {"sid": survey_id, "names": sorted(names)})
+        rows = conn.execute(sql_sel, {"sid": survey_id}).fetchall()
 
-    return existing
+    return {r[0]: r[1] for r in rows}
@@ -0,0 +1,108 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import text
+from db_config import engine
+
+# origem do vínculo pergunta -> tema
+SOURCE_LLM = "llm"
+SOURCE_MANUAL = "manual"
+
+_LEADING_NUMBER_RE = re.compile(r"^\s*(?:q\s*)?\d+\s*[.)\-:–]\s*", re.IGNORECASE)
+
+def normalize_question_key(question: str) -> str:
+    """
+    Chave estável da pergunta entre pesquisas: sem acento, minúscula, espaços
+    colapsados, sem numeração inicial ("12. ", "Q3 - ") e sem pontuação final.
+    """
+    s = unicodedata.normalize("NFKD", str(question or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = _LEADING_NUMBER_RE.sub("", s)
+    s = re.sub(r"\s+", " ", s).strip().strip("\"'“”").rstrip(" .?!:;").strip()
+    return s.lower()
+
+def fetch_question_themes(questions: Iterable[str]) -> Dict[str, str]:
+    """
+    Retorna {pergunta (como recebida) -> tema} para as perguntas já mapeadas.
+    """
+    by_key: Dict[str, List[str]] = {}
+    for q in questions:
+        k = normalize_question_key(q)
+        if k:
+            by_key.setdefault(k, []).append(q)
+    if not by_key:
+        return {}
+
+    sql = text("""
+        SELECT question_key, theme_name
+        FROM question_theme_map
+        WHERE question_key = ANY(CAST(:keys AS text[]))
+    """)
+    with engine.begin() as conn:
+        rows = conn.execute(sql, {"keys": list(by_key)}).fetchall()
+
+    out: Dict[str, str] = {}
+    for key, theme in rows:
+        for q in by_key.get(key, []):
+            out[q] = theme
+    return out
+
+def upsert_question_themes(mappings: Iterable[Tuple[str, str]], source: str = SOURCE_LLM) -> int:
+    """
+    Grava [(pergunta, tema)] em question_theme_map.
+    Vínculo manual sempre sobrescreve; vínculo do LLM nunca sobrescreve um manual.
+    A versão sobe quando o tema muda. Retorna o número de linhas gravadas.
+    """
+    if source not in (SOURCE_LLM, SOURCE_MANUAL):
+        raise ValueError(f"source inválido: {source}")
+
+    # chave repetida no mesmo lote: vale a última
+    rows: Dict[str, Tuple[str, str]] = {}
+    for question, theme in mappings:
+        key = normalize_question_key(question)
+        theme = str(theme or "").strip()
+        if key and theme:
+            rows[key] = (str(question).strip()[:500], theme[:255])
+    if not rows:
+        return 0
+
+    sql = text("""
+        INSERT INTO question_theme_map (question_key, question_text, theme_name, source)
+        SELECT k, q, t, :source
+        FROM unnest(
+            CAST(:keys AS text[]),
+            CAST(:texts AS text[]),
+            CAST(:themes AS text[])
+        ) AS u(k, q, t)
+        ON CONFLICT (question_key) DO UPDATE SET
+            question_text = EXCLUDED.question_text,
+            theme_name    = EXCLUDED.theme_name,
+            source        = EXCLUDED.source,
+            version       = question_theme_map.version
+                            + CASE WHEN question_theme_map.theme_name IS DISTINCT FROM EXCLUDED.theme_name
+                                   THEN 1 ELSE 0 END,
+            updated_at    = now()
+        WHERE EXCLUDED.source = 'manual' OR question_theme_map.source <> 'manual'
+    """)
+    keys = list(rows)
+    with engine.begin() as conn:
+        result = conn.execute(sql, {
+            "source": source,
+            "keys": keys,
+            "texts": [rows[k][0] for k in keys],
+            "themes": [rows[k][1] for k in keys],
+        })
+    return result.rowcount or 0
+
+def list_question_themes() -> List[dict]:
+    sql = text("""
+        SELECT question_key, question_text, theme_name, source, version, updated_at
+        FROM question_theme_map
+        ORDER BY question_text
+    """)
+    with engine.begin() as conn:
+        rows = conn.execute(sql).mappings().all()
+    return [
+        {**dict(r), "updated_at": r["updated_at"].isoformat() if r["updated_at"] else None}
+        for r in rows
+    ]
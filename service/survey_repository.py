@@ -1,5 +1,6 @@
 from sqlalchemy import text
 from db_config import engine
+from service.partitioning import ensure_survey_partitions, drop_survey_partitions
 
 #OK
 def insert_survey(survey_name: str) -> int | None:
@@ -19,6 +20,9 @@ def insert_survey(survey_name: str) -> int | None:
 
     with engine.begin() as conn:
         row = conn.execute(query, {"survey_name": survey_name.strip()}).mappings().first()
+        # layout particionado: partições de comment/perception da pesquisa nova
+        if row and row.get("survey_id") is not None:
+            ensure_survey_partitions(conn, row["survey_id"])
 
     if not row:
         return None
@@ -26,6 +30,17 @@ def insert_survey(survey_name: str) -> int | None:
     # Tenta localizar o nome da PK mais comum
     return row.get("survey_id")
 
+def delete_survey(survey_id: int) -> dict:
+    """
+    Apaga a pesquisa e tudo dela (FKs ON DELETE CASCADE). Com o layout
+    particionado, comentários e percepções saem por DETACH/DROP das partições
+    em vez de DELETE linha a linha.
+    """
+    with engine.begin() as conn:
+        dropped = drop_survey_partitions(conn, survey_id)
+        deleted = conn.execute(text("DELETE FROM survey WHERE survey_id = :sid"), {"sid": survey_id}).rowcount
+    return {"deleted": bool(deleted), "partitions_dropped": dropped}
+
 #OK
 def list_surveys():
     
@@ -63,7 +78,7 @@ def get_comments_with_perceptions(survey_id: int):
           q.question_name
         FROM comment c
         JOIN question q ON q.question_id = c.comment_question_id
-        WHERE q.question_survey_id = :sid
+        WHERE c.comment_survey_id = :sid
     """)
 
     # 2) Percepções para os comentários retornados
@@ -76,6 +91,7 @@ def get_comments_with_perceptions(survey_id: int):
           p.perception_intension
         FROM perception p
         WHERE p.perception_comment_id IN :ids
+          AND p.perception_survey_id = :sid
         ORDER BY p.perception_id
     """)
 
@@ -87,7 +103,7 @@ def get_comments_with_perceptions(survey_id: int):
 
         comment_ids = tuple([c["comment_id"] for c in comments])
         # SQLAlchemy precisa de tupla para IN
-        percs = conn.execute(q_perceptions, {"ids": comment_ids}).mappings().all()
+        percs = conn.execute(q_perceptions, {"ids": comment_ids, "sid": survey_id}).mappings().all()
 
     # Agrupa percepções por comment_id
     percs_by_comment = {}
@@ -132,9 +148,7 @@ def list_perception_themes_for_survey(survey_id: int) -> list[str]:
     sql = text("""
         SELECT DISTINCT p.perception_theme AS theme
         FROM perception p
-        JOIN comment    c ON c.comment_id        = p.perception_comment_id
-        JOIN employee   e ON e.employee_id       = c.comment_employee_id
-        WHERE e.employee_survey_id = :sid
+        WHERE p.perception_survey_id = :sid
           AND p.perception_theme IS NOT NULL
           AND TRIM(p.perception_theme) <> ''
         ORDER BY 1
@@ -0,0 +1,111 @@
+# sse_load_test.py
+"""
+Teste de carga das rotas SSE: abre N streams ociosos no mesmo job, mede a
+latência de uma requisição normal enquanto eles estão abertos e, ao cancelar
+o job, quanto tempo leva até todos receberem o 'done'.
+
+    python sse_load_test.py --url http://localhost:8000 -n 500
+    python sse_load_test.py --url http://localhost:8000 -n 500 --job-id <id>
+
+Sem --job-id, enfileira um job de tipo sem handler ('load_test', nunca é pego
+por worker) usando o banco do db_config; no fim ele é cancelado pela API.
+Um cliente só (sockets não bloqueantes), então o gargalo medido é o servidor.
+"""
+import argparse
+import selectors
+import socket
+import statistics
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+def _open_stream(host: str, port: int, path: str) -> socket.socket:
+    sock = socket.create_connection((host, port), timeout=10)
+    sock.sendall(
+        f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+        f"Accept: text/event-stream\r\nCache-Control: no-cache\r\n\r\n".encode()
+    )
+    sock.setblocking(False)
+    return sock
+
+def _pump(sel: selectors.BaseSelector, buffers: dict, marker: bytes, until: float, seen: dict):
+    """Lê os sockets até `until` (ou até todos terem `marker`); registra quando cada um viu o marker."""
+    while time.monotonic() < until and len(seen) < len(buffers):
+        for key, _ in sel.select(timeout=0.2):
+            sock = key.fileobj
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            except OSError:
+                data = b""
+            if not data:
+                sel.unregister(sock)
+                seen.setdefault(sock, None)
+                continue
+            buffers[sock] += data
+            if sock not in seen and marker in buffers[sock]:
+                seen[sock] = time.monotonic()
+
+def _timed_get(url: str) -> float:
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=30) as r:
+        r.read()
+    return time.perf_counter() - t0
+
+def _create_job() -> str:
+    from service.job_queue import submit_job
+    return submit_job("load_test", {})
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("-n", "--connections", type=int, default=300)
+    ap.add_argument("--job-id", default=None)
+    ap.add_argument("--route", default="events", choices=["events", "plan_events", "area_review_events"])
+    ap.add_argument("--hold", type=float, default=10.0, help="segundos com os streams ociosos")
+    args = ap.parse_args()
+
+    u = urlsplit(args.url)
+    host, port = u.hostname, u.port or 80
+    job_id = args.job_id or _create_job()
+    path = f"/{args.route}/{job_id}"
+    print(f"job {job_id}: abrindo {args.connections} streams em {path}")
+
+    sel = selectors.DefaultSelector()
+    buffers = {}
+    t0 = time.monotonic()
+    for _ in range(args.connections):
+        sock = _open_stream(host, port, path)
+        buffers[sock] = b""
+        sel.register(sock, selectors.EVENT_READ)
+
+    started = {}
+    _pump(sel, buffers, b"event: start", time.monotonic() + 60, started)
+    ok = sum(1 for v in started.values() if v is not None)
+    print(f"streams abertos: {ok}/{args.connections} em {time.monotonic() - t0:.2f}s")
+
+    # servidor continua atendendo com os streams abertos?
+    lat = []
+    end = time.monotonic() + args.hold
+    while time.monotonic() < end:
+        lat.append(_timed_get(f"{args.url}/jobs/{job_id}"))
+        _pump(sel, buffers, b"\x00", time.monotonic() + 0.5, {})
+    print(f"GET /jobs/<id> com streams abertos: n={len(lat)} "
+          f"mediana={statistics.median(lat) * 1000:.1f}ms max={max(lat) * 1000:.1f}ms")
+
+    # fan-out: cancela o job e espera o 'done' em todos
+    req = urllib.request.Request(f"{args.url}/jobs/{job_id}/cancel", method="POST")
+    t_cancel = time.monotonic()
+    urllib.request.urlopen(req, timeout=30).read()
+    done = {s: None for s, v in started.items() if v is None}
+    _pump(sel, buffers, b"event: done", time.monotonic() + 60, done)
+    got = [v - t_cancel for v in done.values() if v is not None]
+    print(f"'done' recebido: {len(got)}/{args.connections}"
+          + (f", último em {max(got) * 1000:.0f}ms após o cancel" if got else ""))
+
+    for sock in buffers:
+        sock.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from service.areas_service import compute_area_theme_scores
+
+COLUNAS = ["nota", "nota diretos", "porcentagem insatisfeitos", "porcentagem insatisfeitos diretos"]
+SAIDA = ["nota", "nota_diretos", "porcentagem_insatisfeitos", "porcentagem_insatisfeitos_diretos"]
+
+
+def _groupby_apply(df_notas_areas, df_pesos_area):
+    """Cálculo anterior (groupby().apply por área × tema), usado como referência."""
+    df = df_notas_areas.merge(
+        df_pesos_area[["employee_area_id", "peso"]],
+        left_on="area_id",
+        right_on="employee_area_id",
+        how="left"
+    ).drop(columns=["employee_area_id"])
+
+    def _media(g, col):
+        if g[col].notna().any() and g["peso"].notna().any() and g["peso"].sum() > 0:
+            return (g[col] * g["peso"]).sum() / g["peso"].sum()
+        return None
+
+    return (
+        df.groupby(["area_id", "tema"])
+        .apply(lambda g: pd.Series({out: _media(g, col) for out, col in zip(SAIDA, COLUNAS)}))
+        .reset_index()
+    )
+
+
+def _assert_igual(df_notas_areas, df_pesos_area):
+    novo = compute_area_theme_scores(df_notas_areas, df_pesos_area)
+    antigo = _groupby_apply(df_notas_areas, df_pesos_area)
+    assert list(novo.columns) == ["area_id", "tema", *SAIDA]
+    pd.testing.assert_frame_equal(
+        novo.reset_index(drop=True),
+        antigo[novo.columns].astype({c: float for c in SAIDA}).reset_index(drop=True),
+        check_dtype=False,
+    )
+    return novo
+
+
+def _notas(rows):
+    return pd.DataFrame(rows, columns=["area_id", "tema", *COLUNAS])
+
+
+def _pesos(rows):
+    return pd.DataFrame(rows, columns=["employee_area_id", "peso"])
+
+
+def test_media_ponderada_simples():
+    notas = _notas([
+        (1, "Liderança", 80.0, 70.0, 10.0, 20.0),
+        (1, "Liderança", 60.0, 50.0, 30.0, 40.0),
+        (2, "Carreira", 50.0, 40.0, 5.0, 0.0),
+    ])
+    pesos = _pesos([(1, 2.0), (2, 1.0)])
+    res = _assert_igual(notas, pesos)
+    linha = res[(res["area_id"] == 1) & (res["tema"] == "Liderança")].iloc[0]
+    # mesmo peso nas duas linhas da área 1: média simples
+    assert linha["nota"] == pytest.approx(70.0)
+    assert linha["porcentagem_insatisfeitos_diretos"] == pytest.approx(30.0)
+
+
+def test_pesos_nulos():
+    notas = _notas([
+        (1, "Liderança", 80.0, np.nan, 10.0, np.nan),
+        (1, "Carreira", np.nan, np.nan, np.nan, np.nan),
+        (2, "Liderança", 40.0, 30.0, 20.0, 10.0),
+        (3, "Carreira", 55.0, 45.0, 12.0, 8.0),
+    ])
+    # áreas 2 e 3 com peso NaN
+    pesos = _pesos([(1, 1.5), (2, np.nan), (3, np.nan)])
+    res = _assert_igual(notas, pesos)
+    assert res.loc[res["area_id"] == 2, SAIDA].isna().all(axis=None)
+    # grupo sem nenhuma nota fica nulo mesmo com peso
+    assert res.loc[(res["area_id"] == 1) & (res["tema"] == "Carreira"), SAIDA].isna().all(axis=None)
+    assert res.loc[(res["area_id"] == 1) & (res["tema"] == "Liderança"), "nota_diretos"].isna().all()
+
+
+def test_pesos_zerados():
+    notas = _notas([
+        (1, "Liderança", 80.0, 70.0, 10.0, 20.0),
+        (1, "Liderança", 60.0, 50.0, 30.0, 40.0),
+        (2, "Liderança", 90.0, 90.0, 0.0, 0.0),
+    ])
+    pesos = _pesos([(1, 0.0), (2, 1.0)])
+    res = _assert_igual(notas, pesos)
+    assert res.loc[res["area_id"] == 1, SAIDA].isna().all(axis=None)
+    assert res.loc[res["area_id"] == 2, "nota"].iloc[0] == pytest.approx(90.0)
+
+
+def test_area_sem_peso_correspondente():
+    notas = _notas([
+        (1, "Liderança", 80.0, 70.0, 10.0, 20.0),
+        (7, "Liderança", 60.0, 50.0, 30.0, 40.0),
+    ])
+    pesos = _pesos([(1, 1.0)])
+    res = _assert_igual(notas, pesos)
+    assert res.loc[res["area_id"] == 7, SAIDA].isna().all(axis=None)
+
+
+def test_nota_nula_entra_no_denominador():
+    # soma(x*peso) / soma(peso) conta também a linha com x nulo
+    notas = _notas([
+        (1, "Liderança", 80.0, 80.0, 10.0, 10.0),
+        (1, "Liderança", np.nan, 40.0, np.nan, 30.0),
+    ])
+    pesos = _pesos([(1, 1.0)])
+    res = _assert_igual(notas, pesos)
+    assert res["nota"].iloc[0] == pytest.approx(40.0)
+
+
+def test_aleatorio_contra_groupby_apply():
+    rng = np.random.default_rng(11)
+    n = 2000
+    notas = pd.DataFrame({
+        "area_id": rng.integers(1, 60, n),
+        "tema": rng.choice(["Liderança", "Carreira", "Ambiente", "Remuneração"], n),
+    })
+    for col in COLUNAS:
+        valores = rng.uniform(0, 100, n)
+        valores[rng.random(n) < 0.2] = np.nan
+        notas[col] = valores
+    areas = np.arange(1, 50)  # áreas 50..59 sem peso
+    peso = rng.uniform(0, 5, len(areas))
+    peso[rng.random(len(areas)) < 0.15] = np.nan
+    peso[rng.random(len(areas)) < 0.15] = 0.0
+    _assert_igual(notas, _pesos(list(zip(areas, peso))))
+
+
+def test_entrada_vazia():
+    res = compute_area_theme_scores(_notas([]), _pesos([]))
+    assert res.empty
+    assert list(res.columns) == ["area_id", "tema", *SAIDA]
@@ -0,0 +1,176 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from service.classification_service import data_preprocessing
+
+INVALID_COMMENTS = {".", "..", "...", "-", "--", "---", "NULL", "null", "NaN", "nan", "na", "N/A", "n/a", "N/a","N/D", "N/d", "n/d", "nd", "ND", "Nenhuma", "Nehuma.", "Não aplicável", "Não aplicável.", "Não tenho", "Não tenho.", "Nada a declarar", "Nada a declarar.", "Sem considerações", "Sem considerações.", "Sem comentários"}
+
+
+def _iterrows(df_campanha, survey_id, df_employee, perguntas_abertas):
+    """Cálculo anterior (iterrows por pergunta × linha da planilha), usado como referência."""
+    perguntas_abertas = [int(i.strip()) for i in perguntas_abertas.split(",") if i.strip()]
+    nova_planilha = []
+    colunas = df_campanha.columns.tolist()
+
+    i = 0
+    while i < len(colunas):
+        match = re.match(r'^(\d+)-ID-Categoria$', colunas[i])
+        if match:
+            numero_pergunta = int(match.group(1))
+            if (not perguntas_abertas or numero_pergunta in perguntas_abertas) and i + 1 < len(colunas):
+                coluna_categoria = colunas[i]
+                coluna_pergunta = colunas[i + 1]
+                coluna_comentario = None
+                if (i + 2) < len(colunas) and colunas[i + 2].startswith(f"{numero_pergunta}-Comentario"):
+                    coluna_comentario = colunas[i + 2]
+                pergunta_texto = re.sub(r'^\d+-', '', coluna_pergunta.strip())
+
+                for _, row in df_campanha.iterrows():
+                    resposta = row[coluna_pergunta]
+                    categoria = re.sub(r'^\d+-', '', str(row[coluna_categoria]).strip())
+                    if coluna_comentario:
+                        comentario = row.get(coluna_comentario, None)
+                        if pd.notna(comentario) and str(comentario).strip() != "":
+                            resposta = comentario
+                        else:
+                            continue
+                    elif pd.isna(resposta) or str(resposta).strip() == "":
+                        continue
+                    resposta = str(resposta).strip()
+                    if resposta in INVALID_COMMENTS:
+                        continue
+                    nova_planilha.append({
+                        'email': row['Email'],
+                        'categoria': categoria,
+                        'pergunta': pergunta_texto,
+                        'resposta': resposta,
+                        'survey_id': survey_id
+                    })
+
+                i += 2
+                if coluna_comentario:
+                    i += 1
+            else:
+                i += 1
+        else:
+            i += 1
+
+    df_resultado = pd.DataFrame(nova_planilha)
+    df_employee_filtered = df_employee[df_employee["employee_survey_id"] == survey_id].rename(columns={
+        "employee_email": "email",
+        "employee_area_id": "area_id",
+        "employee_manager_id": "gestor_id"
+    })
+    df_final = pd.merge(df_resultado, df_employee_filtered[["email", "area_id", "gestor_id"]], on="email", how="left")
+    return df_final[['email', 'categoria', 'pergunta', 'resposta', 'survey_id', 'area_id', 'gestor_id']]
+
+
+def _assert_igual(df_campanha, df_employee, perguntas_abertas="", survey_id=5):
+    novo = data_preprocessing(df_campanha.copy(), survey_id, df_employee, perguntas_abertas)
+    antigo = _iterrows(df_campanha.copy(), survey_id, df_employee, perguntas_abertas)
+    pd.testing.assert_frame_equal(
+        novo.reset_index(drop=True).astype(object),
+        antigo.reset_index(drop=True).astype(object),
+        check_dtype=False,
+    )
+    return novo
+
+
+def _employees(rows):
+    return pd.DataFrame(rows, columns=["employee_email", "employee_area_id", "employee_manager_id", "employee_survey_id"])
+
+
+EMPLOYEES = _employees([
+    ("a@x.com", 1, None, 5),
+    ("b@x.com", 2, 1, 5),
+    ("c@x.com", 3, 1, 5),
+    ("a@x.com", 9, 9, 6),  # outra pesquisa
+])
+
+
+def test_pergunta_sem_comentario():
+    campanha = pd.DataFrame({
+        "Email": ["a@x.com", "b@x.com", "c@x.com"],
+        "1-ID-Categoria": ["1-Liderança", "1-Liderança", "1-Liderança"],
+        "1-Pergunta um": [" bom ", "", "ruim"],
+    })
+    res = _assert_igual(campanha, EMPLOYEES)
+    assert res["resposta"].tolist() == ["bom", "ruim"]
+    assert res["categoria"].tolist() == ["Liderança", "Liderança"]
+
+
+def test_comentario_substitui_resposta():
+    campanha = pd.DataFrame({
+        "Email": ["a@x.com", "b@x.com", "c@x.com"],
+        "1-ID-Categoria": ["1-Carreira", "1-Carreira", "1-Carreira"],
+        "1-Pergunta um": ["8", "9", "10"],
+        "1-Comentario": ["poderia melhorar", np.nan, "  "],
+        "2-ID-Categoria": ["2-Ambiente", "2-Ambiente", "2-Ambiente"],
+        "2-Pergunta dois": ["ok", "N/A", "Sem comentários"],
+    })
+    res = _assert_igual(campanha, EMPLOYEES)
+    assert res[["pergunta", "resposta"]].values.tolist() == [
+        ["Pergunta um", "poderia melhorar"],
+        ["Pergunta dois", "ok"],
+    ]
+
+
+def test_respostas_ausentes_e_none():
+    # None e NaN nas células, inclusive na categoria de uma resposta válida;
+    # o 7 mantém a coluna como object (sem ele o None já vira NaN na leitura)
+    campanha = pd.DataFrame({
+        "Email": ["a@x.com", "b@x.com", "c@x.com", "d@x.com"],
+        "1-ID-Categoria": ["1-Liderança", None, np.nan, 7],
+        "1-Pergunta um": [None, "ok", "bom", np.nan],
+        "2-ID-Categoria": [None, "2-Ambiente", "2-Ambiente", "2-Ambiente"],
+        "2-Pergunta dois": ["sim", None, "nan", "não"],
+        "2-Comentario": ["texto", None, np.nan, "outro"],
+    }, dtype=object)
+    res = _assert_igual(campanha, EMPLOYEES)
+    assert res["categoria"].tolist() == ["nan", "nan", "nan", "Ambiente"]
+    # email fora do cadastro fica sem área
+    assert pd.isna(res.loc[res["email"] == "d@x.com", "area_id"]).all()
+
+
+def test_valores_numericos():
+    campanha = pd.DataFrame({
+        "Email": ["a@x.com", "b@x.com"],
+        "1-ID-Categoria": [12, 13],
+        "1-Pergunta um": [7.5, np.nan],
+    })
+    res = _assert_igual(campanha, EMPLOYEES)
+    assert res["resposta"].tolist() == ["7.5"]
+
+
+def test_filtro_perguntas_abertas():
+    campanha = pd.DataFrame({
+        "Email": ["a@x.com", "b@x.com"],
+        "1-ID-Categoria": ["1-Liderança", "1-Liderança"],
+        "1-Pergunta um": ["a", "b"],
+        "2-ID-Categoria": ["2-Ambiente", "2-Ambiente"],
+        "2-Pergunta dois": ["c", "d"],
+        "3-ID-Categoria": ["3-Carreira", "3-Carreira"],
+        "3-Pergunta três": ["e", "f"],
+        "3-Comentario": ["g", None],
+    })
+    res = _assert_igual(campanha, EMPLOYEES, perguntas_abertas="1, 3")
+    assert res["pergunta"].unique().tolist() == ["Pergunta um", "Pergunta três"]
+
+
+@pytest.mark.parametrize("seed", [3, 17])
+def test_aleatorio_contra_iterrows(seed):
+    rng = np.random.default_rng(seed)
+    n = 300
+    emails = [f"u{i}@x.com" for i in range(n)]
+    respostas = np.array(["bom", " ruim ", "", "  ", "nan", "N/A", "...", "ok", None, np.nan], dtype=object)
+    campanha = pd.DataFrame({"Email": emails}, dtype=object)
+    for q in range(1, 5):
+        campanha[f"{q}-ID-Categoria"] = rng.choice(np.array([f"{q}-Tema {q}", None, np.nan], dtype=object), n, p=[0.8, 0.1, 0.1])
+        campanha[f"{q}-Pergunta {q}"] = rng.choice(respostas, n)
+        if q % 2 == 0:
+            campanha[f"{q}-Comentario"] = rng.choice(respostas, n)
+    funcionarios = _employees([(e, i % 7, i % 3, 5) for i, e in enumerate(emails) if i % 5])
+    _assert_igual(campanha, funcionarios)
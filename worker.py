@@ -0,0 +1,21 @@
+# worker.py
+"""
+Workers da fila de jobs (tabela job).
+
+    python worker.py        -> JOB_WORKERS processos
+    python worker.py 4      -> 4 processos
+"""
+import logging
+import os
+import sys
+
+# antes de importar db_config: os processos de worker usam JOB_STATEMENT_TIMEOUT_MS
+# (herdado pelos processos filhos, que são spawn)
+os.environ["DB_PROCESS_ROLE"] = "worker"
+
+from service.job_queue import run_worker_pool, JOB_WORKERS
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else JOB_WORKERS
+    run_worker_pool("main:JOB_HANDLERS", n)